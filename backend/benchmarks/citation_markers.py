@@ -0,0 +1,116 @@
+"""Micro-benchmark of `insert_citation_markers` against the slicing implementation.
+
+Builds synthetic grounded responses with increasing numbers of grounding supports,
+checks that both implementations return identical text and reports the time per
+call.
+
+Usage:
+    python benchmarks/citation_markers.py
+    python benchmarks/citation_markers.py --supports 10 100 1000 10000 --json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# Importing the agent package loads the graph, which checks for a key at import time.
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+
+from agent.utils import (  # noqa: E402
+    SHORT_URL_PREFIX,
+    _insert_citation_markers_by_slicing,
+    insert_citation_markers,
+)
+
+
+def synthetic_response(supports: int, rng: random.Random) -> tuple:
+    """Return a response text and `supports` citations that cover it."""
+    sentences = [
+        f"Sentence {i} reports a finding with a figure of {rng.randint(1, 999)}."
+        for i in range(supports)
+    ]
+    text = " ".join(sentences)
+    citations = []
+    position = 0
+    for i, sentence in enumerate(sentences):
+        start, position = position, position + len(sentence)
+        # Grounding supports regularly share a segment end
+        end = position if rng.random() > 0.2 else start + len(sentence) // 2
+        citations.append(
+            {
+                "start_index": start,
+                "end_index": end,
+                "segments": [
+                    {
+                        "label": f"site{j}",
+                        "short_url": f"{SHORT_URL_PREFIX}{i}-{j}",
+                        "value": f"https://example.com/{i}/{j}",
+                    }
+                    for j in range(rng.randint(1, 3))
+                ],
+            }
+        )
+        position += 1
+    rng.shuffle(citations)
+    return text, citations
+
+
+def best_of(func, text, citations, repeat: int) -> float:
+    """Best time of one call in milliseconds."""
+    timer = timeit.Timer(lambda: func(text, citations))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1000
+
+
+def main() -> None:
+    """Run the benchmark and print the time per call for each support count."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--supports", type=int, nargs="+", default=[10, 100, 1000, 5000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print JSON rows")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = []
+    for supports in args.supports:
+        text, citations = synthetic_response(supports, rng)
+        expected = _insert_citation_markers_by_slicing(text, citations)
+        if insert_citation_markers(text, citations) != expected:
+            raise SystemExit(f"Output differs from the slicing version at {supports}")
+        slicing_ms = best_of(
+            _insert_citation_markers_by_slicing, text, citations, args.repeat
+        )
+        single_pass_ms = best_of(insert_citation_markers, text, citations, args.repeat)
+        rows.append(
+            {
+                "supports": supports,
+                "text_chars": len(text),
+                "slicing_ms": round(slicing_ms, 4),
+                "single_pass_ms": round(single_pass_ms, 4),
+                "speedup": round(slicing_ms / single_pass_ms, 2),
+            }
+        )
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(
+        f"{'supports':>8} {'text_chars':>10} {'slicing_ms':>11} "
+        f"{'single_pass_ms':>14} {'speedup':>8}"
+    )
+    for row in rows:
+        print(
+            f"{row['supports']:>8} {row['text_chars']:>10} {row['slicing_ms']:>11.4f} "
+            f"{row['single_pass_ms']:>14.4f} {row['speedup']:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Offline stand-ins for the LLM providers, used by the benchmarks.
+
+`install()` makes the client registry hand out `FakeChatModel`s and a fake
+google-genai client, and answers the Yunwu image requests of `comicsAgent`
+locally. Every call sleeps a synthetic latency and returns a deterministic
+response: plain text of a configurable length, a grounded search response with
+citations, an instance of the requested structured output schema filled with
+sample values, or a small base64 image.
+"""
+
+import asyncio
+import base64
+import hashlib
+import itertools
+import random
+import time
+import typing
+from typing import Any, Dict, List
+
+from google.genai import types
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel
+
+from agent.utils import estimate_tokens
+
+# 1x1 transparent PNG
+_PIXEL = base64.b64encode(
+    bytes.fromhex(
+        "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+        "1f15c4890000000d49444154789c6360000002000154a24f5f0000000049454e44ae426082"
+    )
+).decode()
+
+
+class Latency:
+    """Synthetic call latency: fixed, or drawn from a seeded uniform range."""
+
+    def __init__(self, spec: str = "0", seed: int = 0):
+        """Parse `spec`, either `seconds` or `low:high`."""
+        low, _, high = spec.partition(":")
+        self.low = float(low)
+        self.high = float(high) if high else self.low
+        self._rng = random.Random(seed)
+
+    def sample(self) -> float:
+        """Return the latency of the next call, in seconds."""
+        if self.high == self.low:
+            return self.low
+        return self._rng.uniform(self.low, self.high)
+
+
+_counter = itertools.count()
+
+
+def sample_value(annotation: Any, name: str = "value", items: int = 3) -> Any:
+    """Return a sample value of a type annotation; strings are distinct per call."""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        return sample_value(next(a for a in args if a is not type(None)), name, items)
+    if origin is typing.Literal:
+        return args[0]
+    if origin in (list, List):
+        item = args[0] if args else str
+        return [sample_value(item, name, items) for _ in range(items)]
+    if origin in (dict, Dict):
+        return {}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return sample_model(annotation, items)
+    if annotation is bool:
+        return False
+    if annotation is int:
+        return items
+    if annotation is float:
+        return 1.0
+    n = next(_counter)
+    # Distinct tokens, so sampled search queries are not deduplicated
+    return f"{name} sample{n} detail{n * 7 + 3}"
+
+
+def sample_model(schema: type, items: int = 3) -> BaseModel:
+    """Return an instance of a pydantic schema with every field sampled."""
+    return schema(
+        **{
+            name: sample_value(field.annotation, name, items)
+            for name, field in schema.model_fields.items()
+        }
+    )
+
+
+def _usage(prompt: str, output: str) -> Dict[str, int]:
+    prompt_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(output)
+    return {
+        "input_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": prompt_tokens + output_tokens,
+    }
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that sleeps `latency` and answers with `response_words` words."""
+
+    model: str = "fake"
+    latency: Any = None
+    response_words: int = 300
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _answer(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = "\n".join(str(m.content) for m in messages)
+        text = " ".join(f"word{i}" for i in range(self.response_words))
+        message = AIMessage(content=text, usage_metadata=_usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency.sample())
+        return self._answer(messages)
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency.sample())
+        return self._answer(messages)
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        """Return a runnable that answers with a sample instance of `schema`."""
+        include_raw = kwargs.get("include_raw", False)
+
+        def result(prompt: Any):
+            parsed = sample_model(schema)
+            if not include_raw:
+                return parsed
+            raw = AIMessage(
+                content="", usage_metadata=_usage(str(prompt), parsed.model_dump_json())
+            )
+            return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+        def invoke(prompt: Any):
+            time.sleep(self.latency.sample())
+            return result(prompt)
+
+        async def ainvoke(prompt: Any):
+            await asyncio.sleep(self.latency.sample())
+            return result(prompt)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name="FakeStructuredOutput")
+
+
+def grounded_response(contents: str, sources: int = 3) -> types.GenerateContentResponse:
+    """Return a search response whose text cites `sources` pages."""
+    digest = hashlib.sha1(str(contents).encode()).hexdigest()[:8]
+    text = " ".join(f"Finding {i} of search {digest}." for i in range(sources))
+    chunks = [
+        types.GroundingChunk(
+            web=types.GroundingChunkWeb(
+                uri=f"https://example.com/{digest}/{i}", title=f"site{i}.com"
+            )
+        )
+        for i in range(sources)
+    ]
+    supports = [
+        types.GroundingSupport(
+            segment=types.Segment(start_index=0, end_index=len(text)),
+            grounding_chunk_indices=[i],
+        )
+        for i in range(sources)
+    ]
+    return types.GenerateContentResponse(
+        candidates=[
+            types.Candidate(
+                content=types.Content(parts=[types.Part(text=text)], role="model"),
+                grounding_metadata=types.GroundingMetadata(
+                    grounding_chunks=chunks, grounding_supports=supports
+                ),
+            )
+        ],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=estimate_tokens(str(contents)),
+            candidates_token_count=estimate_tokens(text),
+        ),
+    )
+
+
+class _Models:
+    def __init__(self, latency: Latency):
+        self._latency = latency
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None):
+        time.sleep(self._latency.sample())
+        return grounded_response(contents)
+
+
+class _AsyncModels(_Models):
+    async def generate_content(self, *, model: str, contents: Any, config: Any = None):
+        await asyncio.sleep(self._latency.sample())
+        return grounded_response(contents)
+
+
+class _Aio:
+    def __init__(self, latency: Latency):
+        self.models = _AsyncModels(latency)
+
+
+class FakeGenaiClient:
+    """google-genai client stand-in for grounded search."""
+
+    def __init__(self, latency: Latency):
+        """Answer every search after a delay drawn from `latency`."""
+        self.models = _Models(latency)
+        self.aio = _Aio(latency)
+
+
+def install(latency: str = "0", response_words: int = 300, seed: int = 0) -> None:
+    """Route every provider call of the five graphs to the fakes.
+
+    Must be called after the graph modules are imported.
+    """
+    import comicsAgent.gemini
+    from agent.clients import registry
+
+    delay = Latency(latency, seed)
+    registry.clear()
+    registry._build_chat_model = lambda provider, model, temperature, options: (
+        FakeChatModel(model=model, latency=delay, response_words=response_words)
+    )
+    registry._genai_client = FakeGenaiClient(delay)
+
+    def yunwu(kind: str, request: Any, live: Any, **kwargs: Any) -> Dict[str, Any]:
+        time.sleep(delay.sample())
+        part = {"inlineData": {"mimeType": "image/png", "data": _PIXEL}}
+        return {"candidates": [{"content": {"parts": [{"text": "image"}, part]}}]}
+
+    comicsAgent.gemini.intercept = yunwu
+
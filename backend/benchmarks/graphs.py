@@ -0,0 +1,391 @@
+"""End-to-end throughput and latency benchmark of the five graphs.
+
+Runs `agent`, `contentAgent`, `comicsAgent`, `excelAgent` and `xiaohongshuAgent`
+with fixed inputs at a configurable concurrency and reports, per graph, the
+p50/p95/p99 latency of whole runs and of every node, runs per second, the peak
+RSS of the process and the bytes written to an in-memory checkpointer.
+
+Providers are never called in the default `fake` mode: `fake_providers` answers
+every call after a synthetic latency. In `replay` mode the calls are answered by
+the record/replay harness (`agent.replay`) from fixtures recorded beforehand
+with `--mode record`, which calls the live providers once.
+
+Results are machine readable with `--output`, and `--compare` checks them
+against the results of another commit.
+
+Usage:
+    python benchmarks/graphs.py
+    python benchmarks/graphs.py --graphs agent excelAgent --runs 50 --concurrency 8
+    python benchmarks/graphs.py --output before.json
+    python benchmarks/graphs.py --compare before.json --max-regression 0.2
+    python benchmarks/graphs.py --mode record --fixtures fixtures/llm --runs 1
+    python benchmarks/graphs.py --mode replay --fixtures fixtures/llm --latency 0.5:2
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+# The graph modules check for provider keys at import time
+PLACEHOLDER_KEYS = [
+    "GEMINI_API_KEY",
+    "DeepSeek_API_KEY",
+    "YUNWU_BASE_URL",
+    "YUNWU_API_KEY",
+]
+GRAPHS = ["agent", "contentAgent", "comicsAgent", "excelAgent", "xiaohongshuAgent"]
+
+SUBTITLES = """1
+00:00:01,000 --> 00:00:04,000
+Today we look at how small teams ship reliable software.
+
+2
+00:00:04,500 --> 00:00:09,000
+The first habit is to measure before changing anything.
+
+3
+00:00:09,500 --> 00:00:14,000
+The second is to keep every change small enough to review.
+"""
+
+
+def graph_inputs(name: str, workdir: str) -> Dict[str, Any]:
+    """Return the fixed input of one run of graph `name`, so recorded fixtures keep matching."""
+    if name == "agent":
+        return {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": "What changed in battery recycling in 2024?",
+                }
+            ],
+            "initial_search_query_count": 3,
+            "max_research_loops": 2,
+        }
+    if name == "contentAgent":
+        srt = os.path.join(workdir, "benchmark.srt")
+        if not os.path.exists(srt):
+            with open(srt, "w", encoding="utf-8") as f:
+                f.write(SUBTITLES)
+        return {"messages": [], "srt": srt}
+    if name == "comicsAgent":
+        return {
+            "messages": [],
+            "description": "A cat who learns to cook dumplings for its friends.",
+            "comicInfo": {
+                "type": "四格漫画",
+                "style": "Q版",
+                "character": {"name": "Mimi"},
+            },
+        }
+    if name == "excelAgent":
+        return {"messages": []}
+    if name == "xiaohongshuAgent":
+        return {"messages": [], "selected_topic": "周末在家做手冲咖啡"}
+    raise ValueError(f"Unknown graph: {name}")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of `values`, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q * len(ordered) + 0.5) - 1))]
+
+
+def latency_summary(values: List[float]) -> Dict[str, Any]:
+    """Return the count, mean and tail percentiles of latencies in seconds."""
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 6) if values else None,
+        **{
+            f"p{int(q * 100)}": None if p is None else round(p, 6)
+            for q in (0.5, 0.95, 0.99)
+            for p in [percentile(values, q)]
+        },
+    }
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of the process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class CountingSerializer:
+    """Checkpoint serializer that counts the bytes it writes."""
+
+    def __init__(self, inner: Any):
+        """Wrap the `inner` serializer."""
+        self.inner = inner
+        self.bytes_written = 0
+
+    def dumps_typed(self, obj: Any) -> Any:
+        """Serialize with the inner serializer and count the bytes."""
+        type_, data = self.inner.dumps_typed(obj)
+        self.bytes_written += len(data)
+        return type_, data
+
+    def loads_typed(self, data: Any) -> Any:
+        """Deserialize with the inner serializer."""
+        return self.inner.loads_typed(data)
+
+
+async def run_graph(
+    name: str, args: argparse.Namespace, workdir: str
+) -> Dict[str, Any]:
+    """Run graph `name` `args.runs` times and summarize the measurements."""
+    from langgraph.checkpoint.memory import InMemorySaver
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    from agent.metrics import MetricsCallbackHandler, MetricsRegistry
+
+    module = importlib.import_module(f"{name}.graph")
+    serde = CountingSerializer(JsonPlusSerializer())
+    graph = module.graph
+    # Measure an in-memory checkpointer, even when GRAPH_CHECKPOINT_DB is set
+    checkpointer = InMemorySaver(serde=serde) if args.checkpoint else None
+    graph = graph.copy(update={"checkpointer": checkpointer})
+    registry = MetricsRegistry(recent_runs=args.runs + args.warmup)
+    handler = MetricsCallbackHandler(name, registry)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    errors: List[str] = []
+
+    async def one_run(measured: bool) -> Optional[float]:
+        config = {
+            "callbacks": [handler] if measured else [],
+            "configurable": {"thread_id": str(uuid.uuid4())},
+            "recursion_limit": 100,
+        }
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await graph.ainvoke(graph_inputs(name, workdir), config)
+            except Exception as error:  # noqa: BLE001
+                errors.append(f"{type(error).__name__}: {error}")
+                return None
+            return time.perf_counter() - started
+
+    await asyncio.gather(*(one_run(False) for _ in range(args.warmup)))
+    registry.clear()
+    errors.clear()
+    bytes_before = serde.bytes_written
+
+    started = time.perf_counter()
+    durations = await asyncio.gather(*(one_run(True) for _ in range(args.runs)))
+    wall = time.perf_counter() - started
+
+    completed = [d for d in durations if d is not None]
+    nodes: Dict[str, List[float]] = defaultdict(list)
+    for run in registry.recent_runs():
+        for node in run["nodes"]:
+            nodes[node["node"]].append(node["duration_seconds"])
+    checkpoint_bytes = serde.bytes_written - bytes_before
+    return {
+        "graph": name,
+        "runs": args.runs,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_seconds": round(wall, 4),
+        "runs_per_second": round(len(completed) / wall, 3) if wall else None,
+        "latency_seconds": latency_summary(completed),
+        "nodes": {node: latency_summary(values) for node, values in nodes.items()},
+        "checkpoint_bytes": {
+            "total": checkpoint_bytes,
+            "per_run": round(checkpoint_bytes / args.runs) if args.runs else 0,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def git_commit() -> Optional[str]:
+    """Return the short hash of the checked out commit, None outside a git tree."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=BENCHMARKS_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], limit: float
+) -> List[str]:
+    """Return the regressions of `results` against `baseline` beyond `limit`."""
+    previous = {row["graph"]: row for row in baseline["graphs"]}
+    regressions = []
+    for row in results["graphs"]:
+        before = previous.get(row["graph"])
+        if before is None:
+            continue
+        checks: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "p95 latency": lambda r: r["latency_seconds"]["p95"],
+            "p99 latency": lambda r: r["latency_seconds"]["p99"],
+            "checkpoint bytes per run": lambda r: r["checkpoint_bytes"]["per_run"],
+        }
+        for label, value in checks.items():
+            old, new = value(before), value(row)
+            if old and new and new > old * (1 + limit):
+                regressions.append(
+                    f"{row['graph']}: {label} {old} -> {new} (+{new / old - 1:.0%})"
+                )
+        old, new = before["runs_per_second"], row["runs_per_second"]
+        if old and new and new < old / (1 + limit):
+            regressions.append(
+                f"{row['graph']}: runs/sec {old} -> {new} ({new / old - 1:.0%})"
+            )
+    return regressions
+
+
+def print_table(results: Dict[str, Any]) -> None:
+    """Print one summary row per graph."""
+    print(
+        f"{'graph':<18} {'runs/s':>8} {'p50_s':>8} {'p95_s':>8} {'p99_s':>8} "
+        f"{'ckpt_B/run':>10} {'rss_MiB':>8} {'errors':>6}"
+    )
+    for row in results["graphs"]:
+        latency = row["latency_seconds"]
+        cells = [latency[p] for p in ("p50", "p95", "p99")]
+        print(
+            f"{row['graph']:<18} {row['runs_per_second'] or 0:>8.2f} "
+            + " ".join(f"{c:>8.3f}" if c is not None else f"{'-':>8}" for c in cells)
+            + f" {row['checkpoint_bytes']['per_run']:>10} {row['peak_rss_mb']:>8.1f}"
+            f" {row['errors']:>6}"
+        )
+        for node, summary in row["nodes"].items():
+            cells = [summary[p] for p in ("p50", "p95", "p99")]
+            print(
+                f"  {node:<25} {'':>1}"
+                + " ".join(f"{c:>8.3f}" for c in cells)
+                + f"  x{summary['count']}"
+            )
+        if row["first_error"]:
+            print(f"  first error: {row['first_error']}")
+
+
+def main() -> None:
+    """Parse the arguments, run the benchmarks and write the report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--graphs", nargs="+", choices=GRAPHS, default=GRAPHS)
+    parser.add_argument(
+        "--mode", choices=["fake", "replay", "record"], default="fake"
+    )
+    parser.add_argument("--runs", type=int, default=20, help="Measured runs per graph")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured runs first")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--latency",
+        default="0.05",
+        help="Synthetic provider latency in seconds, fixed or min:max",
+    )
+    parser.add_argument(
+        "--response-words", type=int, default=300, help="Length of fake answers"
+    )
+    parser.add_argument("--fixtures", default="fixtures/llm", help="Fixture directory")
+    parser.add_argument(
+        "--no-checkpoint",
+        dest="checkpoint",
+        action="store_false",
+        help="Run without a checkpointer",
+    )
+    parser.add_argument(
+        "--node-cache",
+        choices=["off", "memory", "sqlite"],
+        default="off",
+        help="Node result cache backend; off by default so every run does the work",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--verbose", action="store_true", help="Keep the graphs' own console output"
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--json", action="store_true", help="Print JSON results")
+    parser.add_argument("--compare", help="Results JSON of a baseline run")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="Relative slowdown tolerated by --compare before failing",
+    )
+    args = parser.parse_args()
+
+    os.environ["NODE_CACHE"] = args.node_cache
+    if args.mode == "fake":
+        for key in PLACEHOLDER_KEYS:
+            os.environ.setdefault(key, "benchmark-placeholder")
+    else:
+        os.environ["LLM_HARNESS_MODE"] = args.mode
+        os.environ["LLM_FIXTURES_DIR"] = os.path.abspath(args.fixtures)
+        os.environ["LLM_REPLAY_LATENCY"] = args.latency
+    for name in args.graphs:
+        importlib.import_module(f"{name}.graph")
+    if args.mode == "fake":
+        from fake_providers import install
+
+        install(args.latency, args.response_words, args.seed)
+
+    results: Dict[str, Any] = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "settings": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "json", "compare")
+        },
+        "graphs": [],
+    }
+    # The graphs write their outputs relative to the working directory
+    cwd = os.getcwd()
+    with contextlib.ExitStack() as stack:
+        workdir = stack.enter_context(
+            tempfile.TemporaryDirectory(prefix="graph-benchmark-")
+        )
+        if not args.verbose:
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        os.chdir(workdir)
+        stack.callback(os.chdir, cwd)
+        for name in args.graphs:
+            results["graphs"].append(asyncio.run(run_graph(name, args, workdir)))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_table(results)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Import-time profile of the graph modules listed in `langgraph.json`.
+
+Imports every graph module in a fresh interpreter with `python -X importtime`,
+then all of them together as the server does at startup. It reports the
+total import time of each module and the modules and top-level packages that
+cost the most.
+
+Usage:
+    python benchmarks/import_profile.py
+    python benchmarks/import_profile.py --top 30 --by-package
+    python benchmarks/import_profile.py --modules agent.graph --json
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# The graph modules check for provider keys at import time
+PLACEHOLDER_KEYS = [
+    "GEMINI_API_KEY",
+    "DeepSeek_API_KEY",
+    "YUNWU_BASE_URL",
+    "YUNWU_API_KEY",
+]
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def graph_modules() -> List[str]:
+    """Return the module names of the graphs registered in `langgraph.json`."""
+    with open(os.path.join(BACKEND_DIR, "langgraph.json"), encoding="utf-8") as f:
+        graphs = json.load(f)["graphs"]
+    modules = []
+    for target in graphs.values():
+        path = target.split(":")[0]
+        module = os.path.relpath(path, "./src")[: -len(".py")].replace(os.sep, ".")
+        modules.append(module)
+    return modules
+
+
+def profile_imports(modules: List[str]) -> List[Dict]:
+    """Import `modules` in a fresh interpreter and return its importtime rows."""
+    env = dict(os.environ)
+    for key in PLACEHOLDER_KEYS:
+        env.setdefault(key, "import-profile-placeholder")
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(BACKEND_DIR, "src"), env.get("PYTHONPATH", "")]
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append(
+                {
+                    "module": name,
+                    "self_ms": int(self_us) / 1000,
+                    "cumulative_ms": int(cumulative_us) / 1000,
+                    "depth": len(indent) // 2,
+                }
+            )
+    if completed.returncode != 0:
+        raise SystemExit(f"Importing {modules} failed:\n{completed.stderr[-2000:]}")
+    return rows
+
+
+def summarize(rows: List[Dict], top: int, by_package: bool) -> Dict:
+    """Return the total import time and the slowest modules or packages."""
+    total = sum(row["cumulative_ms"] for row in rows if row["depth"] == 0)
+    if by_package:
+        costs: Dict[str, float] = defaultdict(float)
+        for row in rows:
+            costs[row["module"].split(".")[0]] += row["self_ms"]
+        ranked = [{"module": name, "self_ms": ms} for name, ms in costs.items()]
+    else:
+        ranked = rows
+    ranked = sorted(ranked, key=lambda row: row["self_ms"], reverse=True)[:top]
+    return {
+        "total_ms": round(total, 1),
+        "modules": len(rows),
+        "top": [
+            {
+                key: round(value, 1) if isinstance(value, float) else value
+                for key, value in row.items()
+                if key != "depth"
+            }
+            for row in ranked
+        ],
+    }
+
+
+def main() -> None:
+    """Profile the imports of each graph module and report the slowest ones."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--modules", nargs="+", help="Default: the graphs of langgraph.json"
+    )
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument(
+        "--by-package",
+        action="store_true",
+        help="Add up self time per top-level package",
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    args = parser.parse_args()
+
+    modules = args.modules or graph_modules()
+    report = {
+        module: summarize(profile_imports([module]), args.top, args.by_package)
+        for module in modules
+    }
+    if len(modules) > 1:
+        report["all"] = summarize(profile_imports(modules), args.top, args.by_package)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, summary in report.items():
+        print(f"{name}: {summary['total_ms']:.0f} ms, {summary['modules']} modules")
+    print()
+    name = "all" if "all" in report else modules[0]
+    kind = "packages" if args.by_package else "modules"
+    print(f"Most expensive {kind} ({name}, self time):")
+    for row in report[name]["top"]:
+        cumulative = row.get("cumulative_ms")
+        suffix = f"  (cumulative {cumulative:.1f} ms)" if cumulative is not None else ""
+        print(f"  {row['self_ms']:>8.1f} ms  {row['module']}{suffix}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Compare reflection prompt size and latency of the 'full' and 'incremental' modes.
+
+The benchmark replays the research loop without calling any provider: every loop
+adds `--fan-out` synthetic web research summaries, formats the reflection prompt
+with the graph's own prompt builder and models the call latency from the prompt
+and output token counts. Incremental mode pays for the extra output tokens of the
+rewritten knowledge summary, full mode pays for re-reading every summary.
+
+Usage:
+    python benchmarks/reflection_prompts.py
+    python benchmarks/reflection_prompts.py --loops 2 5 10 --fan-out 3 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# The graph module checks for a key at import time; no request is ever sent.
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+from agent.configuration import Configuration  # noqa: E402
+from agent.graph import _reflection_prompt  # noqa: E402
+from agent.utils import estimate_tokens  # noqa: E402
+
+# Output tokens of the structured reflection without the knowledge summary
+REFLECTION_OUTPUT_TOKENS = 120
+
+
+def synthetic_summary(loop: int, branch: int, words: int) -> str:
+    """Return a web research summary with citations, roughly `words` words long."""
+    sentence = (
+        f"Finding {loop}.{branch} reports figures and context for the topic "
+        f"[source](https://vertexaisearch.cloud.google.com/id/{loop}-{branch})."
+    )
+    repeat = max(1, words // len(sentence.split()))
+    return " ".join([sentence] * repeat)
+
+
+def run_mode(mode: str, loops: int, args: argparse.Namespace) -> list:
+    """Simulate `loops` reflection calls and return per-loop measurements."""
+    configurable = Configuration(
+        reflection_mode=mode, knowledge_summary_words=args.summary_words
+    )
+    summary_tokens = estimate_tokens("word " * args.summary_words)
+    state = {
+        "messages": [HumanMessage(content="What changed in the topic this year?")],
+        "web_research_result": [],
+        "knowledge_summary": "",
+        "summarized_result_count": 0,
+    }
+    rows = []
+    for loop in range(loops):
+        state["web_research_result"] += [
+            synthetic_summary(loop, branch, args.summary_length)
+            for branch in range(args.fan_out)
+        ]
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            prompt = _reflection_prompt(state, configurable)
+        format_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+        prompt_tokens = estimate_tokens(prompt)
+        output_tokens = REFLECTION_OUTPUT_TOKENS
+        if mode == "incremental":
+            output_tokens += summary_tokens
+            state["knowledge_summary"] = "word " * args.summary_words
+            state["summarized_result_count"] = len(state["web_research_result"])
+        model_ms = (
+            prompt_tokens / args.prefill_tokens_per_second
+            + output_tokens / args.decode_tokens_per_second
+        ) * 1000
+        rows.append(
+            {
+                "mode": mode,
+                "max_research_loops": loops,
+                "loop": loop + 1,
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "format_ms": round(format_ms, 4),
+                "wall_ms": round(format_ms + model_ms, 1),
+            }
+        )
+    return rows
+
+
+def main() -> None:
+    """Run the benchmark and print one row per loop count and mode."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--loops", type=int, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--fan-out", type=int, default=3, help="Summaries per loop")
+    parser.add_argument(
+        "--summary-length", type=int, default=350, help="Words per web summary"
+    )
+    parser.add_argument(
+        "--summary-words", type=int, default=400, help="Knowledge summary length"
+    )
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=4000)
+    parser.add_argument("--decode-tokens-per-second", type=float, default=150)
+    parser.add_argument("--repeat", type=int, default=200, help="Format repetitions")
+    parser.add_argument("--json", action="store_true", help="Print JSON rows")
+    args = parser.parse_args()
+
+    rows = [
+        row
+        for loops in args.loops
+        for mode in ("full", "incremental")
+        for row in run_mode(mode, loops, args)
+    ]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(
+        f"{'loops':>5} {'mode':<12} {'loop':>4} {'prompt_tok':>10} "
+        f"{'output_tok':>10} {'format_ms':>9} {'wall_ms':>9}"
+    )
+    for row in rows:
+        print(
+            f"{row['max_research_loops']:>5} {row['mode']:<12} {row['loop']:>4} "
+            f"{row['prompt_tokens']:>10} {row['output_tokens']:>10} "
+            f"{row['format_ms']:>9.4f} {row['wall_ms']:>9.1f}"
+        )
+    print()
+    print(f"{'loops':>5} {'mode':<12} {'total_prompt_tok':>16} {'total_wall_ms':>13}")
+    for loops in args.loops:
+        for mode in ("full", "incremental"):
+            selected = [
+                r for r in rows if r["mode"] == mode and r["max_research_loops"] == loops
+            ]
+            print(
+                f"{loops:>5} {mode:<12} "
+                f"{sum(r['prompt_tokens'] for r in selected):>16} "
+                f"{sum(r['wall_ms'] for r in selected):>13.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,173 @@
 import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import sys
+import time
+import uuid
+from typing import Any, Dict, Iterator, Optional, Set, TextIO
+
 from langchain_core.messages import HumanMessage
+from agent.checkpoint import resume_run
 from agent.graph import graph
 
 
+def build_state(question: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Return the graph input for one question."""
+    return {
+        "messages": [HumanMessage(content=question)],
+        "initial_search_query_count": args.initial_queries,
+        "max_research_loops": args.max_loops,
+        "reasoning_model": args.reasoning_model,
+        "excelPath":"data"
+    }
+
+
+def read_questions(stream: TextIO) -> Iterator[Dict[str, str]]:
+    """Yield `{"id", "question"}` items from JSONL lines.
+
+    A line is either an object with a `question` and an optional `id`, or a JSON
+    string. Questions without an id are identified by a hash of their text.
+    """
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict) or not item.get("question"):
+            raise ValueError(f"Line {line_number} has no question: {line[:80]}")
+        question = item["question"]
+        question_id = item.get("id")
+        if question_id is None:
+            question_id = hashlib.sha1(question.encode("utf-8")).hexdigest()[:12]
+        yield {"id": str(question_id), "question": question}
+
+
+def answered_ids(path: str) -> Set[str]:
+    """Ids of the questions answered successfully in an earlier output file."""
+    done = set()
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of an interrupted batch
+                    continue
+                if record.get("status") == "ok":
+                    done.add(record["id"])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+async def finished_result(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the result of a thread whose run already finished."""
+    return values
+
+
+async def answer(item: Dict[str, str], args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the graph for one question and return its output record."""
+    record: Dict[str, Any] = {"id": item["id"], "question": item["question"]}
+    started = time.perf_counter()
+    state = build_state(item["question"], args)
+    run = None
+    if graph.checkpointer is not None:
+        # One thread per question, so that a later --resume finds its checkpoints
+        thread_id = f"cli-research-{item['id']}"
+        config = {"configurable": {"thread_id": thread_id}}
+        if not args.resume:
+            # A new batch starts the question over instead of adding a turn
+            await graph.checkpointer.adelete_thread(thread_id)
+        else:
+            snapshot = await graph.aget_state(config)
+            if snapshot.next:
+                # Failed or timed-out questions continue from their last checkpoint
+                run = graph.ainvoke(None, config)
+            elif snapshot.values:
+                # Finished, but the record never reached the output file
+                run = finished_result(snapshot.values)
+    else:
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    if run is None:
+        run = graph.ainvoke(state, config)
+    try:
+        result = await asyncio.wait_for(run, timeout=args.timeout or None)
+        messages = result.get("messages", [])
+        record["status"] = "ok"
+        record["answer"] = messages[-1].content if messages else ""
+        record["sources"] = [
+            source["value"] for source in result.get("sources_gathered", [])
+        ]
+    except TimeoutError:
+        record["status"] = "timeout"
+        record["error"] = f"No answer after {args.timeout}s"
+    except Exception as error:
+        record["status"] = "error"
+        record["error"] = f"{type(error).__name__}: {error}"
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def percentile(values: list, q: float) -> Optional[float]:
+    """Return the nearest-rank `q` percentile of `values`, None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_batch(args: argparse.Namespace) -> Dict[str, Any]:
+    """Answer every question of the batch and stream the records to the output."""
+    skip = answered_ids(args.output) if args.resume else set()
+    source = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    output = (
+        sys.__stdout__
+        if args.output == "-"
+        else open(args.output, "a" if args.resume else "w", encoding="utf-8")
+    )
+    counts = {"ok": 0, "error": 0, "timeout": 0, "skipped": 0}
+    durations = []
+    pending = read_questions(source)
+
+    async def worker() -> None:
+        # Workers share one iterator, so at most `concurrency` questions run at once
+        for item in pending:
+            if item["id"] in skip:
+                counts["skipped"] += 1
+                continue
+            record = await answer(item, args)
+            counts[record["status"]] += 1
+            durations.append(record["seconds"])
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.__stdout__:
+            output.close()
+    wall = time.perf_counter() - started
+    finished = len(durations)
+    return {
+        **counts,
+        "wall_seconds": round(wall, 2),
+        "questions_per_minute": round(finished / wall * 60, 2) if wall else None,
+        "p50_seconds": percentile(durations, 0.5),
+        "p95_seconds": percentile(durations, 0.95),
+    }
+
+
 def main() -> None:
     """Run the research agent from the command line."""
     parser = argparse.ArgumentParser(description="Run the LangGraph research agent")
-    parser.add_argument("question", help="Research question")
+    parser.add_argument("question", nargs="?", help="Research question")
     parser.add_argument(
         "--initial-queries",
         type=int,
@@ -24,17 +185,59 @@ def main() -> None:
         default="gemini-2.5-pro-preview-05-06",
         help="Model for the final answer",
     )
+    parser.add_argument(
+        "--thread",
+        help="Thread id; with GRAPH_CHECKPOINT_DB set, a failed run of the thread "
+        "is resumed and a finished one continued with the question",
+    )
+    batch = parser.add_argument_group("batch mode")
+    batch.add_argument(
+        "--batch",
+        metavar="JSONL",
+        help="Answer the questions of a JSONL file ('-' for stdin) instead",
+    )
+    batch.add_argument(
+        "--output",
+        default="-",
+        help="JSONL file the answers are written to as they finish (default stdout)",
+    )
+    batch.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of questions researched at the same time",
+    )
+    batch.add_argument(
+        "--timeout",
+        type=float,
+        default=0,
+        help="Seconds after which a question is given up (0 waits forever)",
+    )
+    batch.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the questions already answered in --output; with "
+        "GRAPH_CHECKPOINT_DB set, failed ones resume from their last checkpoint",
+    )
     args = parser.parse_args()
 
-    state = {
-        "messages": [HumanMessage(content=args.question)],
-        "initial_search_query_count": args.initial_queries,
-        "max_research_loops": args.max_loops,
-        "reasoning_model": args.reasoning_model,
-        "excelPath":"data"
-    }
-
-    result = graph.invoke(state)
+    if args.resume and args.output == "-":
+        parser.error("--resume needs an --output file")
+    if args.batch:
+        # Keep stdout for the answers; anything the graph prints goes to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = asyncio.run(run_batch(args))
+        print(json.dumps({"summary": summary}), file=sys.stderr)
+        return
+    if args.thread and graph.checkpointer is not None:
+        config = {"configurable": {"thread_id": args.thread}}
+        state = build_state(args.question, args) if args.question else None
+        result = resume_run(graph, config, state)
+    elif not args.question:
+        parser.error("a question or --batch is required")
+    else:
+        config = {"configurable": {"thread_id": args.thread or str(uuid.uuid4())}}
+        result = graph.invoke(build_state(args.question, args), config)
     messages = result.get("messages", [])
     if messages:
         print(messages[-1].content)
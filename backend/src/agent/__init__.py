@@ -1,3 +1,15 @@
-from agent.graph import graph
+"""Research agent graph and its shared building blocks.
+
+The graph is built on first access, so importing a submodule such as
+`agent.clients` does not load the graph and its dependencies.
+"""
 
 __all__ = ["graph"]
+
+
+def __getattr__(name):
+    if name == "graph":
+        from agent.graph import graph
+
+        return graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -139,6 +139,36 @@ async def health_check() -> dict:
     """健康检查接口"""
     return {"status": "ok", "message": "Server is running"}
 
+@app.get("/api/rate_limits")
+async def rate_limit_stats() -> dict:
+    """LLM 调用限流队列状态（排队数、并发数、累计等待时间）."""
+    from agent.rate_limit import rate_limiter
+
+    return {"success": True, "data": rate_limiter.stats()}
+
+@app.get("/api/metrics")
+async def prometheus_metrics() -> Response:
+    """各 agent 的运行、节点和 LLM 调用指标（Prometheus 文本格式）."""
+    from agent.metrics import render_prometheus
+
+    return Response(
+        render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@app.get("/api/metrics/runs")
+async def recent_run_metrics() -> dict:
+    """最近运行的耗时、排队时间和 token 明细（按节点）."""
+    from agent.metrics import metrics
+
+    return {"success": True, "data": metrics.recent_runs()}
+
+@app.get("/api/metrics/prompts")
+async def prompt_cache_metrics() -> dict:
+    """各提示词模板在服务商侧的前缀缓存命中率."""
+    from agent.prompt_cache import prompt_cache_report
+
+    return {"success": True, "data": prompt_cache_report()}
+
 @app.get("/api/getSrtList")
 async def getSrtList()-> dict:
     try:
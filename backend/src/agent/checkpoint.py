@@ -0,0 +1,580 @@
+"""Durable SQLite checkpointer and resume helpers for the graphs.
+
+The graphs are compiled with `get_checkpointer()`. It returns None unless
+`GRAPH_CHECKPOINT_DB` is set: under `langgraph dev` and LangGraph Platform the
+server provides persistence and refuses graphs that bring their own. For
+scripts, the CLI and self-hosted servers, setting it to a file path saves a
+checkpoint after every superstep. A run that fails in `finalize_answer` or
+`batch_generate_image` can then be resumed with `resume_run` from its last
+completed node instead of recomputing the upstream work.
+
+Checkpoint writes stay off the critical path. `put` and `put_writes` only
+serialize and queue a row. A writer thread commits the queue in one
+transaction per batch, prunes old checkpoints now and then, and the database
+runs in WAL mode. Reads, which LangGraph makes once at the start of a run,
+flush the queue first, so they always see the latest writes.
+
+A batch that fails to commit is kept and retried. Until a retry succeeds,
+`put`, `put_writes`, `flush` and the reads raise `CheckpointWriteError`, so a
+run does not go on as if its checkpoints were saved.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import cache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# Old checkpoints are pruned at most this often
+_PRUNE_SECONDS = 60.0
+
+_CHECKPOINT_KEY = "thread_id, checkpoint_ns, checkpoint_id"
+
+
+class CheckpointWriteError(RuntimeError):
+    """Raised while queued checkpoint writes cannot be committed."""
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[int]):
+    """Checkpoint saver backed by a local SQLite file, with batched writes.
+
+    Every checkpoint is stored whole, with its channel values, so pruning old
+    checkpoints never breaks the ones that are kept.
+
+    Args:
+        path: Database file; several processes may share it.
+        keep_per_thread: Newest checkpoints kept per thread and namespace;
+            0 keeps all of them.
+        retention_seconds: Checkpoints older than this are deleted; 0 keeps
+            them forever.
+        flush_seconds: How long queued writes may wait to be batched.
+        batch_size: Queued writes that trigger an immediate commit.
+        retry_seconds: Wait before retrying a batch that failed to commit.
+        serde: Serializer of the checkpoints and writes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        keep_per_thread: int = 20,
+        retention_seconds: float = 7 * 24 * 3600,
+        flush_seconds: float = 0.2,
+        batch_size: int = 256,
+        retry_seconds: float = 1.0,
+        serde: Optional[SerializerProtocol] = None,
+    ):
+        """Open or create the database and start the writer thread."""
+        super().__init__(serde=serde)
+        self.path = path
+        self.keep_per_thread = keep_per_thread
+        self.retention_seconds = retention_seconds
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, "
+                "checkpoint_id TEXT NOT NULL, parent_checkpoint_id TEXT, "
+                "type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, "
+                "created_at REAL NOT NULL, "
+                f"PRIMARY KEY ({_CHECKPOINT_KEY}))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS writes ("
+                "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, "
+                "checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL, "
+                "idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT, "
+                "value BLOB, task_path TEXT NOT NULL DEFAULT '', "
+                f"PRIMARY KEY ({_CHECKPOINT_KEY}, task_id, idx))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS checkpoints_created_at "
+                "ON checkpoints (created_at)"
+            )
+
+        # Queued statements, committed by the writer thread
+        self._pending: List[Tuple[str, Sequence[tuple]]] = []
+        self._writing = False
+        self._flush_requests = 0
+        self._closed = False
+        # Error of the last failed commit, cleared when a retry succeeds
+        self._error: Optional[BaseException] = None
+        self._lost = 0
+        self._last_prune = 0.0
+        self._cond = threading.Condition()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="checkpoint-writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
+
+    # Writer
+
+    def _raise_write_error(self) -> None:
+        # Caller holds self._cond
+        if self._error is not None:
+            raise CheckpointWriteError(
+                f"Writing checkpoints to {self.path} failed: {self._error}"
+            ) from self._error
+
+    def _enqueue(self, sql: str, rows: Sequence[tuple]) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"Checkpointer for {self.path} is closed")
+            self._raise_write_error()
+            self._pending.append((sql, rows))
+            self._cond.notify_all()
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if self._error is not None:
+                    # Back off before retrying the failed batch
+                    self._cond.wait_for(lambda: self._closed, self.retry_seconds)
+                # Let more writes join the batch unless someone is waiting for it
+                self._cond.wait_for(
+                    lambda: len(self._pending) >= self.batch_size
+                    or self._flush_requests
+                    or self._closed,
+                    timeout=self.flush_seconds,
+                )
+                batch, self._pending = self._pending, []
+                if not batch and self._closed:
+                    return
+                self._writing = True
+            try:
+                self._commit(batch)
+            except Exception as error:
+                logger.exception("Writing %d checkpoint rows failed", len(batch))
+                with self._cond:
+                    self._error = error
+                    if self._closed:
+                        # Last attempt on close; the loss is raised by close()
+                        self._lost = len(batch)
+                    else:
+                        self._pending = batch + self._pending
+            else:
+                with self._cond:
+                    self._error = None
+                self._maybe_prune()
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _commit(self, batch: List[Tuple[str, Sequence[tuple]]]) -> None:
+        with self._lock, self._conn:
+            for sql, rows in batch:
+                self._conn.executemany(sql, rows)
+
+    def _maybe_prune(self) -> None:
+        # Pruning runs in its own transaction; failing it loses no checkpoint
+        now = time.time()
+        if now - self._last_prune < _PRUNE_SECONDS:
+            return
+        self._last_prune = now
+        try:
+            with self._lock, self._conn:
+                self._prune(now)
+        except Exception:
+            logger.exception("Pruning checkpoints failed")
+
+    def _prune(self, now: float) -> None:
+        conditions, params = [], []
+        if self.retention_seconds > 0:
+            conditions.append(
+                f"SELECT {_CHECKPOINT_KEY} FROM checkpoints WHERE created_at < ?"
+            )
+            params.append(now - self.retention_seconds)
+        if self.keep_per_thread > 0:
+            conditions.append(
+                f"SELECT {_CHECKPOINT_KEY} FROM (SELECT {_CHECKPOINT_KEY}, "
+                "ROW_NUMBER() OVER (PARTITION BY thread_id, checkpoint_ns "
+                "ORDER BY checkpoint_id DESC) AS position FROM checkpoints) "
+                "WHERE position > ?"
+            )
+            params.append(self.keep_per_thread)
+        if not conditions:
+            return
+        doomed = " UNION ".join(conditions)
+        for table in ("writes", "checkpoints"):
+            self._conn.execute(
+                f"DELETE FROM {table} WHERE ({_CHECKPOINT_KEY}) IN ({doomed})", params
+            )
+
+    def flush(self) -> None:
+        """Block until every queued write is committed.
+
+        Raises:
+            CheckpointWriteError: A batch failed to commit and is waiting
+                to be retried.
+        """
+        with self._cond:
+            self._raise_write_error()
+            self._flush_requests += 1
+            self._cond.notify_all()
+            try:
+                self._cond.wait_for(
+                    lambda: (not self._pending and not self._writing)
+                    or self._error is not None
+                )
+            finally:
+                self._flush_requests -= 1
+            self._raise_write_error()
+
+    def prune(self) -> None:
+        """Delete the checkpoints beyond the retention limits now."""
+        self.flush()
+        with self._lock, self._conn:
+            self._last_prune = time.time()
+            self._prune(self._last_prune)
+
+    def close(self) -> None:
+        """Commit the queued writes and stop the writer thread.
+
+        Raises:
+            CheckpointWriteError: The queued writes could not be committed.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+        if self._lost:
+            raise CheckpointWriteError(
+                f"{self._lost} queued checkpoint writes were lost: {self._error}"
+            ) from self._error
+
+    # Reads
+
+    def _tuple(self, row: tuple) -> CheckpointTuple:
+        (
+            thread_id,
+            checkpoint_ns,
+            checkpoint_id,
+            parent_id,
+            type_,
+            checkpoint,
+            metadata_type,
+            metadata,
+        ) = row
+        with self._lock:
+            writes = self._conn.execute(
+                "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchall()
+        writes.sort(key=lambda w: writes_sort_key(w[5], w[0], w[1]))
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((w_type, value)))
+                for task_id, _, channel, w_type, value, _ in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Return the requested checkpoint, or the latest one of the thread."""
+        self.flush()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        sql = (
+            f"SELECT {_CHECKPOINT_KEY}, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints "
+            "WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        params: List[Any] = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            sql += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        else:
+            sql += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return self._tuple(row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """List checkpoints, newest first, matching the config and filters."""
+        self.flush()
+        conditions, params = [], []
+        if config:
+            configurable = config["configurable"]
+            conditions.append("thread_id = ?")
+            params.append(configurable["thread_id"])
+            if (checkpoint_ns := configurable.get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_CHECKPOINT_KEY}, parent_checkpoint_id, type, checkpoint, "
+                f"metadata_type, metadata FROM checkpoints{where} "
+                "ORDER BY checkpoint_id DESC",
+                params,
+            ).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads_typed((row[6], row[7]))
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            yield self._tuple(row)
+
+    # Writes
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Queue a checkpoint and return the config that points to it."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+        self._enqueue(
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    blob,
+                    metadata_type,
+                    metadata_blob,
+                    time.time(),
+                )
+            ],
+        )
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Queue the writes of a task for the checkpoint in `config`."""
+        configurable = config["configurable"]
+        # Special writes (errors, interrupts) replace earlier ones; others do not
+        verb = (
+            "INSERT OR REPLACE"
+            if all(channel in WRITES_IDX_MAP for channel, _ in writes)
+            else "INSERT OR IGNORE"
+        )
+        rows = [
+            (
+                configurable["thread_id"],
+                configurable.get("checkpoint_ns", ""),
+                configurable["checkpoint_id"],
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self.serde.dumps_typed(value),
+                task_path,
+            )
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        self._enqueue(
+            f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete every checkpoint and write of a thread."""
+        self.flush()
+        with self._lock, self._conn:
+            for table in ("writes", "checkpoints"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,)
+                )
+
+    # Async variants: writes only queue, reads run in a worker thread
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Return the requested checkpoint, or the latest one of the thread."""
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """List checkpoints, newest first, matching the config and filters."""
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Queue a checkpoint and return the config that points to it."""
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Queue the writes of a task for the checkpoint in `config`."""
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Delete every checkpoint and write of a thread."""
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+@cache
+def get_checkpointer() -> Optional[SQLiteCheckpointSaver]:
+    """Return the process-wide checkpointer, or None when persistence is off.
+
+    `GRAPH_CHECKPOINT_DB` enables it. `GRAPH_CHECKPOINT_KEEP` (checkpoints kept
+    per thread), `GRAPH_CHECKPOINT_RETENTION_HOURS` and
+    `GRAPH_CHECKPOINT_FLUSH_SECONDS` tune it.
+    """
+    path = os.getenv("GRAPH_CHECKPOINT_DB")
+    if not path:
+        return None
+    return SQLiteCheckpointSaver(
+        path,
+        keep_per_thread=int(os.getenv("GRAPH_CHECKPOINT_KEEP") or 20),
+        retention_seconds=float(os.getenv("GRAPH_CHECKPOINT_RETENTION_HOURS") or 168)
+        * 3600,
+        flush_seconds=float(os.getenv("GRAPH_CHECKPOINT_FLUSH_SECONDS") or 0.2),
+    )
+
+
+def run_status(graph: Any, config: RunnableConfig) -> Dict[str, Any]:
+    """Where the run of a thread stopped.
+
+    Returns:
+        The checkpoint id, the nodes that would run next (empty once the run
+        finished), and the nodes that failed with their errors.
+    """
+    state = graph.get_state(config)
+    return {
+        "checkpoint_id": (state.config or {}).get("configurable", {}).get(
+            "checkpoint_id"
+        ),
+        "next": list(state.next),
+        "failed": {task.name: task.error for task in state.tasks if task.error},
+    }
+
+
+def resume_run(graph: Any, config: RunnableConfig, input: Any = None) -> Any:
+    """Continue the run of a thread from its last completed node.
+
+    A thread whose run failed, timed out or was interrupted still has nodes to
+    run; they are run again from the last checkpoint with the writes of the
+    nodes that completed in the same step. Otherwise a new run starts with
+    `input`.
+    """
+    if graph.get_state(config).next:
+        return graph.invoke(None, config)
+    if input is None:
+        raise ValueError(
+            f"Thread {config['configurable']['thread_id']} has nothing to resume"
+        )
+    return graph.invoke(input, config)
+
+
+async def aresume_run(graph: Any, config: RunnableConfig, input: Any = None) -> Any:
+    """Async variant of `resume_run`."""
+    if (await graph.aget_state(config)).next:
+        return await graph.ainvoke(None, config)
+    if input is None:
+        raise ValueError(
+            f"Thread {config['configurable']['thread_id']} has nothing to resume"
+        )
+    return await graph.ainvoke(input, config)
@@ -0,0 +1,248 @@
+"""Process-wide registry of LLM provider clients.
+
+Building a chat model inside every node call re-creates the provider client and,
+with it, the HTTP connection pool, so each call pays for object setup and a fresh
+TLS handshake. The registry hands out one client per
+(provider, model, temperature, structured schema) and shares pooled HTTP
+transports between all clients of a provider.
+
+Models and clients are wrapped by the record/replay harness in `agent.replay`
+when `LLM_HARNESS_MODE` is set; call `registry.clear()` after changing it.
+
+The provider SDKs are imported when their first client is built, not when this
+module is imported, since they dominate the import time of the graphs.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Type
+
+import httpx
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel
+
+from agent.replay import REPLAY, HarnessGenaiClient, harness_mode, wrap_chat_model
+
+if TYPE_CHECKING:
+    from google.genai import Client
+
+GOOGLE_GENAI = "google_genai"
+DEEPSEEK = "deepseek"
+
+logger = logging.getLogger(__name__)
+
+# Pending `aclose()` tasks of dropped async clients, kept until they finish
+_closing: "set[asyncio.Task]" = set()
+
+
+def _close_async_client(client: httpx.AsyncClient) -> None:
+    """Close a dropped async client and its connection pool.
+
+    On an event loop the close is scheduled as a task; otherwise it runs on a
+    temporary loop.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        task = loop.create_task(client.aclose())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+        return
+    try:
+        asyncio.run(client.aclose())
+    except Exception:
+        # Connections opened on a loop that is gone cannot be closed cleanly
+        logger.warning("Closing a dropped async HTTP client failed", exc_info=True)
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    """HTTP connection pool settings shared by all provider clients."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        """Read the pool settings from `LLM_POOL_*` environment variables."""
+        defaults = cls()
+        return cls(
+            max_connections=int(
+                os.getenv("LLM_POOL_MAX_CONNECTIONS", defaults.max_connections)
+            ),
+            max_keepalive_connections=int(
+                os.getenv("LLM_POOL_MAX_KEEPALIVE", defaults.max_keepalive_connections)
+            ),
+            keepalive_expiry=float(
+                os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", defaults.keepalive_expiry)
+            ),
+        )
+
+    def limits(self) -> httpx.Limits:
+        """Return the settings as `httpx.Limits`."""
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class ClientRegistry:
+    """Thread-safe cache of provider clients keyed by their construction arguments."""
+
+    def __init__(self, pool: Optional[PoolSettings] = None):
+        """Create an empty registry; `pool` defaults to the `LLM_POOL_*` settings."""
+        self._pool = pool or PoolSettings.from_env()
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple[Any, ...], Runnable] = {}
+        self._genai_client: Optional[Client] = None
+        self._http_clients: Dict[str, Tuple[httpx.Client, httpx.AsyncClient]] = {}
+
+    @property
+    def pool(self) -> PoolSettings:
+        """The pool settings used for newly created clients."""
+        return self._pool
+
+    def configure_pool(self, pool: PoolSettings) -> None:
+        """Replace the pool settings and drop every cached client."""
+        with self._lock:
+            self._pool = pool
+            self._clear_locked()
+
+    def clear(self) -> None:
+        """Drop every cached client so the next call builds fresh ones."""
+        with self._lock:
+            self._clear_locked()
+
+    def _clear_locked(self) -> None:
+        self._models.clear()
+        self._genai_client = None
+        for sync_client, async_client in self._http_clients.values():
+            sync_client.close()
+            _close_async_client(async_client)
+        self._http_clients.clear()
+
+    def chat_model(
+        self,
+        provider: str,
+        model: str,
+        temperature: float = 0,
+        schema: Optional[Type[BaseModel]] = None,
+        **options: Any,
+    ) -> Runnable:
+        """Return a shared chat model, wrapped with structured output if `schema` is set.
+
+        Args:
+            provider: Either `GOOGLE_GENAI` or `DEEPSEEK`.
+            model: The provider's model name.
+            temperature: Sampling temperature.
+            schema: Optional pydantic schema passed to `with_structured_output`.
+            **options: Extra constructor arguments, e.g. `max_retries` or `timeout`.
+                They are part of the cache key.
+
+        Returns:
+            The cached chat model or structured-output runnable.
+        """
+        key = (provider, model, temperature, schema, tuple(sorted(options.items())))
+        cached = self._models.get(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            if key not in self._models:
+                llm = wrap_chat_model(
+                    provider,
+                    model,
+                    lambda: self._build_chat_model(
+                        provider, model, temperature, options
+                    ),
+                )
+                self._models[key] = (
+                    llm.with_structured_output(schema) if schema is not None else llm
+                )
+            return self._models[key]
+
+    def genai_client(self) -> "Client":
+        """Return the shared google-genai client used for grounded search."""
+        if self._genai_client is None:
+            with self._lock:
+                if self._genai_client is None:
+                    self._genai_client = self._build_genai_client()
+        return self._genai_client
+
+    def _build_genai_client(self) -> "Client":
+        mode = harness_mode()
+        if mode == REPLAY:
+            return HarnessGenaiClient()
+        from google.genai import Client, types
+
+        limits = self._pool.limits()
+        client = Client(
+            api_key=os.getenv("GEMINI_API_KEY"),
+            http_options=types.HttpOptions(
+                client_args={"limits": limits},
+                async_client_args={"limits": limits},
+            ),
+        )
+        return HarnessGenaiClient(client) if mode else client
+
+    def _http_client_pair(self, provider: str) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        if provider not in self._http_clients:
+            limits = self._pool.limits()
+            self._http_clients[provider] = (
+                httpx.Client(limits=limits),
+                httpx.AsyncClient(limits=limits),
+            )
+        return self._http_clients[provider]
+
+    def _build_chat_model(
+        self, provider: str, model: str, temperature: float, options: Dict[str, Any]
+    ) -> Any:
+        if provider == GOOGLE_GENAI:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            return ChatGoogleGenerativeAI(
+                model=model,
+                temperature=temperature,
+                api_key=os.getenv("GEMINI_API_KEY"),
+                client_args={"limits": self._pool.limits()},
+                **options,
+            )
+        if provider == DEEPSEEK:
+            from langchain_deepseek import ChatDeepSeek
+
+            http_client, http_async_client = self._http_client_pair(provider)
+            return ChatDeepSeek(
+                model=model,
+                temperature=temperature,
+                api_key=os.getenv("DeepSeek_API_KEY") or os.getenv("DEEPSEEK_API_KEY"),
+                http_client=http_client,
+                http_async_client=http_async_client,
+                **options,
+            )
+        raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+# Process-wide instance
+registry = ClientRegistry()
+
+
+def get_chat_model(
+    provider: str,
+    model: str,
+    temperature: float = 0,
+    schema: Optional[Type[BaseModel]] = None,
+    **options: Any,
+) -> Runnable:
+    """Return a shared chat model from the process-wide registry."""
+    return registry.chat_model(provider, model, temperature, schema, **options)
+
+
+def get_genai_client() -> "Client":
+    """Return the shared google-genai client from the process-wide registry."""
+    return registry.genai_client()
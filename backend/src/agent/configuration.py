@@ -1,12 +1,31 @@
 import os
-from pydantic import BaseModel, Field
-from typing import Any, Optional
+import threading
+from collections import OrderedDict
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, ClassVar, Dict, Hashable, Optional, Tuple
 
 from langchain_core.runnables import RunnableConfig
 
 
 class Configuration(BaseModel):
-    """The configuration for the agent."""
+    """The configuration for the agent.
+
+    Instances are frozen, because `from_runnable_config` hands the same
+    resolved instance to every node of a run and to other runs with the same
+    settings. Setting a field raises a `ValidationError`; use
+    `model_copy(update=...)` for a changed copy.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    # Resolved instances keyed on the configurable values of a run
+    _cache: ClassVar["OrderedDict[Tuple[type, Hashable], Configuration]"] = (
+        OrderedDict()
+    )
+    _cache_lock: ClassVar[threading.Lock] = threading.Lock()
+    # Field name and encoded environment variable of each field, per class
+    _env_keys: ClassVar[Dict[type, Tuple[Tuple[str, Any], ...]]] = {}
+    max_cached: ClassVar[int] = 256
 
     query_generator_model: str = Field(
         default="gemini-2.0-flash",
@@ -39,18 +58,223 @@ class Configuration(BaseModel):
         metadata={"description": "The maximum number of research loops to perform."},
     )
 
+    max_run_seconds: float = Field(
+        default=0,
+        metadata={
+            "description": "Wall-clock budget of one run. Research stops looping when another round plus the answer would not fit. 0 disables it."
+        },
+    )
+
+    max_total_tokens: int = Field(
+        default=0,
+        metadata={
+            "description": "Token budget of one run. Follow-up searches are trimmed to what the remaining tokens are projected to pay for. 0 disables it."
+        },
+    )
+
+    max_web_searches: int = Field(
+        default=0,
+        metadata={
+            "description": "Maximum number of grounded web searches in one run; cached results do not count. 0 disables it."
+        },
+    )
+
+    hedge_web_research: bool = Field(
+        default=False,
+        metadata={
+            "description": "Send a duplicate grounded search when a web_research branch runs longer than hedge_percentile of recent searches, and use the first response."
+        },
+    )
+
+    hedge_percentile: float = Field(
+        default=0.95,
+        metadata={
+            "description": "Latency percentile of recent searches after which a hedged duplicate is sent."
+        },
+    )
+
+    web_research_timeout_seconds: float = Field(
+        default=0,
+        metadata={
+            "description": "Hard timeout of one web_research branch. A branch that times out is dropped, recorded in dropped_queries, and reflection goes ahead with the other results. 0 disables it."
+        },
+    )
+
+    adaptive_fan_out: bool = Field(
+        default=False,
+        metadata={
+            "description": "Pick the number of initial and follow-up searches of each round from recent search latency, free rate limiter slots and the new sources per search of the previous round, instead of number_of_initial_queries and every follow-up query. Decisions are recorded in the fan_out state key."
+        },
+    )
+
+    max_fan_out: int = Field(
+        default=5,
+        metadata={"description": "Most searches the adaptive fan-out sends in one round."},
+    )
+
+    fan_out_latency_slack: float = Field(
+        default=0.5,
+        metadata={
+            "description": "How much longer than the median search the slowest branch of an adaptive round may be expected to take; 0.5 allows 1.5 times the median."
+        },
+    )
+
+    fan_out_min_source_gain: float = Field(
+        default=1.0,
+        metadata={
+            "description": "New unique source URIs per search at which the adaptive fan-out keeps the previous round's width; rounds that found fewer get proportionally narrower follow-ups. 0 ignores the source gain."
+        },
+    )
+
+    reflection_mode: str = Field(
+        default="full",
+        metadata={
+            "description": "'full' sends every summary to reflection on each loop; 'incremental' keeps a running knowledge summary and only sends the summaries added since the previous loop."
+        },
+    )
+
+    research_mode: str = Field(
+        default="rounds",
+        metadata={
+            "description": "'rounds' waits for every web_research branch before reflecting; 'pipelined' reflects on results as they arrive and sends follow-up searches, or stops searching, while slower branches are still in flight."
+        },
+    )
+
+    pipelined_reflection_quorum: float = Field(
+        default=0.5,
+        metadata={
+            "description": "In 'pipelined' mode, share of the searches in flight since the previous reflection that must return before the next reflection runs. 1 waits for all of them."
+        },
+    )
+
+    knowledge_summary_words: int = Field(
+        default=400,
+        metadata={
+            "description": "Target length of the running knowledge summary in 'incremental' reflection mode."
+        },
+    )
+
+    synthesis_token_threshold: int = Field(
+        default=60000,
+        metadata={
+            "description": "Estimated token size of all web research summaries above which the answer is synthesized map-reduce style: batches are condensed in parallel before the final answer. 0 disables it."
+        },
+    )
+
+    synthesis_batch_tokens: int = Field(
+        default=8000,
+        metadata={
+            "description": "Estimated token size of one batch of summaries condensed in the map step."
+        },
+    )
+
+    synthesis_model: str = Field(
+        default="gemini-2.0-flash",
+        metadata={
+            "description": "The name of the language model that condenses summary batches in the map step."
+        },
+    )
+
+    stream_answer: bool = Field(
+        default=True,
+        metadata={
+            "description": "Stream the final answer token by token on the graph's messages stream."
+        },
+    )
+
+    query_dedup_threshold: float = Field(
+        default=0.8,
+        metadata={
+            "description": "Token Jaccard similarity at or above which a search query counts as a duplicate of one already run. Values above 1 disable the check."
+        },
+    )
+
+    search_cache: str = Field(
+        default="memory",
+        metadata={
+            "description": "Backend of the web search result cache: 'memory', 'sqlite' or 'off'."
+        },
+    )
+
+    search_cache_path: str = Field(
+        default="outputs/search_cache.sqlite3",
+        metadata={
+            "description": "Database file of the 'sqlite' search cache, shared by all worker processes."
+        },
+    )
+
+    search_cache_ttl_seconds: float = Field(
+        default=6 * 60 * 60,
+        metadata={"description": "How long a cached web search result stays valid."},
+    )
+
+    search_cache_max_entries: int = Field(
+        default=2048,
+        metadata={
+            "description": "Maximum number of cached web search results before LRU eviction."
+        },
+    )
+
+    history_window_tokens: int = Field(
+        default=4000,
+        metadata={
+            "description": "Estimated token size of the most recent conversation turns embedded verbatim in the research prompts; older turns are summarized. 0 embeds the whole history."
+        },
+    )
+
+    history_summary_tokens: int = Field(
+        default=400,
+        metadata={
+            "description": "Estimated token size of the rolling summary of the turns that no longer fit in history_window_tokens."
+        },
+    )
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
     ) -> "Configuration":
-        """Create a Configuration instance from a RunnableConfig."""
+        """Create a Configuration instance from a RunnableConfig.
+
+        Environment variables take precedence over the run's configurable
+        values. The resolved instance is cached per set of configurable values
+        and of the environment variables of the fields, so the nodes and
+        routers of a run share one instance, and a changed environment is seen
+        by the next call.
+        """
         configurable = (
             config["configurable"] if config and "configurable" in config else {}
         )
+        environ = cls._environ_values()
+        key = (cls, environ, cls._cache_key(configurable))
+        with cls._cache_lock:
+            cached = cls._cache.get(key)
+            if cached is not None:
+                cls._cache.move_to_end(key)
+                return cached
+
+        resolved = cls._resolve(
+            configurable,
+            {name: os.environ[name.upper()] for name, _ in environ},
+        )
+        with cls._cache_lock:
+            cls._cache[key] = resolved
+            if len(cls._cache) > cls.max_cached:
+                cls._cache.popitem(last=False)
+        return resolved
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Forget resolved instances."""
+        with cls._cache_lock:
+            cls._cache.clear()
 
+    @classmethod
+    def _resolve(
+        cls, configurable: Dict[str, Any], environ: Dict[str, str]
+    ) -> "Configuration":
         # Get raw values from environment or config
         raw_values: dict[str, Any] = {
-            name: os.environ.get(name.upper(), configurable.get(name))
+            name: environ.get(name, configurable.get(name))
             for name in cls.model_fields.keys()
         }
 
@@ -58,3 +282,38 @@ class Configuration(BaseModel):
         values = {k: v for k, v in raw_values.items() if v is not None}
 
         return cls(**values)
+
+    @classmethod
+    def _environ_values(cls) -> Tuple[Tuple[str, Any], ...]:
+        """Return the raw values of the set environment variables of the fields."""
+        keys = cls._env_keys.get(cls)
+        if keys is None:
+            keys = tuple(
+                (name, os.environ.encodekey(name.upper()))
+                for name in cls.model_fields.keys()
+            )
+            cls._env_keys[cls] = keys
+        # os.environ raises and catches a KeyError for every unset variable,
+        # which costs more than resolving the fields; its encoded dict does not
+        data = getattr(os.environ, "_data", None)
+        if data is None:
+            return tuple(
+                (name, os.environ[name.upper()])
+                for name, _ in keys
+                if name.upper() in os.environ
+            )
+        return tuple((name, data[key]) for name, key in keys if key in data)
+
+    @classmethod
+    def _cache_key(cls, configurable: Dict[str, Any]) -> Hashable:
+        # Only the fields matter; thread ids and checkpoint state are ignored
+        key = []
+        for name in cls.model_fields.keys():
+            if name in configurable:
+                value = configurable[name]
+                try:
+                    hash(value)
+                except TypeError:
+                    value = repr(value)
+                key.append((name, value))
+        return tuple(key)
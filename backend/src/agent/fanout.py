@@ -0,0 +1,151 @@
+"""Adaptive fan-out width for the initial and follow-up searches.
+
+`number_of_initial_queries` fixes the width of the first round, and every
+follow-up query the reflection returns is searched. With `adaptive_fan_out`
+set, `decide_fan_out` picks the width of each round of the run instead, from
+three signals:
+
+- Latency: the slowest of n parallel searches is expected to take about the
+  n/(n+1) percentile of recent search latencies. The width is the largest one
+  whose expected slowest branch stays within `fan_out_latency_slack` of the
+  median, so a wider round costs little wall time while the latency
+  distribution is tight and narrows when stragglers appear.
+- Rate limit headroom: searches beyond the free rate limiter slots of the
+  search model only queue, so the width is capped to them.
+- Source gain: the new unique source URIs per search of the previous round
+  of the same run. A round that found fewer than `fan_out_min_source_gain`
+  per search gets a proportionally narrower follow-up round.
+
+Without enough latency samples the first round keeps `number_of_initial_queries`.
+Each decision, with its signals, is appended to the `fan_out` state key.
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.configuration import Configuration
+from agent.hedging import latency_tracker
+from agent.metrics import metrics
+from agent.rate_limit import rate_limiter
+
+INITIAL = "initial"
+FOLLOW_UP = "follow_up"
+
+_WIDTH_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 16)
+
+
+def unique_uri_count(store: Optional[Dict[str, Any]]) -> int:
+    """Return the number of distinct source URIs in a source store."""
+    return len((store or {}).get("uris") or {})
+
+
+def latency_width(
+    model: str, slack: float, ceiling: int
+) -> Tuple[Optional[float], Optional[int]]:
+    """Return the median search latency and the widest round within `slack` of it.
+
+    Returns (None, None) until the latency tracker has enough samples.
+    """
+    median = latency_tracker.percentile(model, 0.5)
+    if median is None:
+        return None, None
+    limit = (1 + slack) * median
+    width = 1
+    for n in range(2, ceiling + 1):
+        tail = latency_tracker.percentile(model, n / (n + 1))
+        if tail is None or tail > limit:
+            break
+        width = n
+    return median, width
+
+
+def run_decisions(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return the decisions made in the current run.
+
+    `fan_out` accumulates over the turns of a thread; `generate_query` notes
+    its length at the start of the run in `budget_start`.
+    """
+    decisions = state.get("fan_out") or []
+    start = (state.get("budget_start") or {}).get("fan_out_decisions")
+    return decisions[start:] if start is not None else []
+
+
+def source_gain(state: Dict[str, Any]) -> Optional[float]:
+    """Return the new unique URIs per search since the run's previous decision.
+
+    None if the run has not decided yet.
+    """
+    decisions = run_decisions(state)
+    if not decisions:
+        return None
+    previous = decisions[-1]
+    found = unique_uri_count(state.get("source_store")) - previous["unique_uris"]
+    return max(found, 0) / max(previous["width"], 1)
+
+
+def decide_fan_out(
+    stage: str,
+    requested: int,
+    state: Dict[str, Any],
+    configurable: Configuration,
+) -> Dict[str, Any]:
+    """Pick the width of the next round of searches.
+
+    Args:
+        stage: INITIAL for the queries of `generate_query`, FOLLOW_UP for the
+            follow-up queries of a reflection.
+        requested: The configured number of initial queries, or the number of
+            follow-up queries left after deduplication.
+        state: Current graph state, for the source store and earlier decisions.
+        configurable: The run's configuration.
+
+    Returns:
+        The decision to record in the `fan_out` state key; `width` is the
+        number of searches to send.
+    """
+    model = configurable.query_generator_model
+    ceiling = max(configurable.max_fan_out, 1)
+    median, by_latency = latency_width(
+        model, configurable.fan_out_latency_slack, ceiling
+    )
+    headroom = rate_limiter.headroom(model)
+    gain = source_gain(state) if stage == FOLLOW_UP else None
+
+    # Ties are reported as the first limit; an unconstrained round as "requested"
+    limits = {}
+    if stage == FOLLOW_UP or by_latency is None:
+        limits["requested"] = max(requested, 1)
+    # Otherwise searches are cheap in wall time: the first round widens to the limit
+    limits["max_fan_out"] = ceiling
+    if by_latency is not None:
+        limits["latency"] = by_latency
+    if headroom is not None:
+        limits["rate_limit"] = max(headroom, 1)
+    if gain is not None and configurable.fan_out_min_source_gain > 0:
+        previous_width = run_decisions(state)[-1]["width"]
+        limits["source_gain"] = max(
+            1,
+            math.floor(previous_width * gain / configurable.fan_out_min_source_gain),
+        )
+
+    limited_by = min(limits, key=limits.get)
+    width = limits[limited_by]
+    metrics.observe(
+        "agent_fan_out_width",
+        "Searches per round chosen by the adaptive fan-out.",
+        {"stage": stage, "limited_by": limited_by},
+        width,
+        buckets=_WIDTH_BUCKETS,
+    )
+    return {
+        "stage": stage,
+        "loop": state.get("research_loop_count") or 0,
+        "requested": requested,
+        "width": width,
+        "limited_by": limited_by,
+        "median_latency_seconds": median,
+        "latency_width": by_latency,
+        "rate_limit_headroom": headroom,
+        "source_gain": gain,
+        "unique_uris": unique_uri_count(state.get("source_store")),
+    }
@@ -1,127 +1,238 @@
-import os
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional, get_type_hints
 
-from agent.tools_and_schemas import SearchQueryList, Reflection
 from dotenv import load_dotenv
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.messages.ai import add_usage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from langgraph.config import get_config
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import push_message
 from langgraph.types import Send
-from langgraph.graph import StateGraph
-from langgraph.graph import START, END
-from langchain_core.runnables import RunnableConfig
-from google.genai import Client
 
-from agent.state import (
-    OverallState,
-    QueryGenerationState,
-    ReflectionState,
-    WebSearchState,
-)
+import agent.history
+import agent.prompts
+import agent.sources
+import agent.utils
+from agent.checkpoint import get_checkpointer
+from agent.clients import GOOGLE_GENAI, get_chat_model, get_genai_client
 from agent.configuration import Configuration
+from agent.fanout import FOLLOW_UP, INITIAL, decide_fan_out
+from agent.hedging import HedgeTimeout, ahedged_call, hedged_call, latency_tracker
+from agent.history import conversation_history
+from agent.metrics import instrument_graph, report_llm_call
+from agent.node_cache import NodeCachePolicy, cached_node
 from agent.prompts import (
+    answer_instructions,
+    condense_instructions,
     get_current_date,
+    incremental_reflection_instructions,
     query_writer_instructions,
-    web_searcher_instructions,
     reflection_instructions,
-    answer_instructions,
+    web_searcher_instructions,
 )
-from langchain_google_genai import ChatGoogleGenerativeAI
+from agent.rate_limit import rate_limiter
+from agent.replay import require_env
+from agent.search_cache import get_search_cache, rekey_short_urls, search_cache_key
+from agent.sources import source_store, store_segments
+from agent.state import (
+    OverallState,
+    QueryGenerationState,
+    ReflectionState,
+    WebSearchState,
+)
+from agent.tools_and_schemas import IncrementalReflection, Reflection, SearchQueryList
 from agent.utils import (
+    ShortUrlStreamRewriter,
+    dedupe_queries,
+    estimate_tokens,
+    expand_short_urls,
     get_citations,
-    get_research_topic,
     insert_citation_markers,
     resolve_urls,
 )
 
-from langchain_deepseek import ChatDeepSeek
-
 load_dotenv()
 
-if os.getenv("GEMINI_API_KEY") is None:
-    raise ValueError("GEMINI_API_KEY is not set")
+require_env("GEMINI_API_KEY")
 
-# Used for Google Search API
-genai_client = Client(api_key=os.getenv("GEMINI_API_KEY"))
 
+@contextmanager
+def _llm_slot(config: RunnableConfig, model: str, prompt: str):
+    """Hold a rate limiter slot for an LLM call and report its queue time."""
+    with rate_limiter.limit(model, estimate_tokens(prompt)) as lease:
+        report_llm_call(config, model, lease.waited)
+        yield lease
 
-# Nodes
-def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
-    """LangGraph node that generates search queries based on the User's question.
 
-    Uses Gemini 2.0 Flash to create an optimized search queries for web research based on
-    the User's question.
+@asynccontextmanager
+async def _allm_slot(config: RunnableConfig, model: str, prompt: str):
+    """Async variant of `_llm_slot`."""
+    async with rate_limiter.alimit(model, estimate_tokens(prompt)) as lease:
+        report_llm_call(config, model, lease.waited)
+        yield lease
 
-    Args:
-        state: Current graph state containing the User's question
-        config: Configuration for the runnable, including LLM provider settings
 
-    Returns:
-        Dictionary with state update, including search_query key containing the generated queries
+# Nodes
+def _query_generation_llm(state: OverallState, config: RunnableConfig):
+    """Build the structured query writer model and its prompt.
+
+    Also returns the adaptive fan-out decision for the initial queries, or None.
     """
     configurable = Configuration.from_runnable_config(config)
     print(state,"agentState")
     # check for custom initial search query count
+    decision = None
     if state.get("initial_search_query_count") is None:
         state["initial_search_query_count"] = configurable.number_of_initial_queries
+        if configurable.adaptive_fan_out:
+            decision = decide_fan_out(
+                INITIAL, configurable.number_of_initial_queries, state, configurable
+            )
+            state["initial_search_query_count"] = decision["width"]
 
     # init Gemini 2.0 Flash
-    llm = ChatGoogleGenerativeAI(
-        model=configurable.query_generator_model,
+    structured_llm = get_chat_model(
+        GOOGLE_GENAI,
+        configurable.query_generator_model,
         temperature=1.0,
+        schema=SearchQueryList,
         max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
     )
-    structured_llm = llm.with_structured_output(SearchQueryList)
 
     # Format the prompt
     current_date = get_current_date()
     formatted_prompt = query_writer_instructions.format(
         current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
+        research_topic=conversation_history(state["messages"], configurable),
         number_queries=state["initial_search_query_count"],
     )
+    model = configurable.query_generator_model
+    return structured_llm, formatted_prompt, model, decision
+
+
+def _structured_token_count(prompt: str, result) -> int:
+    """Estimated tokens of a structured-output call, which reports no usage."""
+    return estimate_tokens(prompt) + estimate_tokens(result.model_dump_json())
+
+
+def _query_generation_update(
+    state: OverallState,
+    config: RunnableConfig,
+    result: SearchQueryList,
+    prompt: str,
+    decision: Optional[dict] = None,
+) -> QueryGenerationState:
+    """Drop generated queries that duplicate each other or queries already run.
+
+    Also marks the start of the run for the budgets checked by `evaluate_research`,
+    and trims the queries to the adaptive fan-out `decision`, if any.
+    """
+    configurable = Configuration.from_runnable_config(config)
+    queries, skipped = dedupe_queries(
+        result.query, state.get("search_query") or [], configurable.query_dedup_threshold
+    )
+    # Always search at least once, even if every query was run in an earlier turn
+    if not queries and result.query:
+        queries, skipped = result.query[:1], skipped[1:]
+    update = {
+        "search_query": queries,
+        "skipped_queries": skipped,
+        "tokens_used": _structured_token_count(prompt, result),
+        "budget_start": {
+            "started_at": time.time(),
+            "tokens_used": state.get("tokens_used") or 0,
+            "web_searches_used": state.get("web_searches_used") or 0,
+            "research_loop_count": state.get("research_loop_count") or 0,
+            # Adaptive fan-out decisions of earlier runs of the thread
+            "fan_out_decisions": len(state.get("fan_out") or []),
+        },
+    }
+    if decision is not None:
+        update["search_query"] = queries[: decision["width"]]
+        update["fan_out"] = [decision]
+    return update
+
+
+def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
+    """LangGraph node that generates search queries based on the User's question.
+
+    Uses Gemini 2.0 Flash to create an optimized search queries for web research based on
+    the User's question.
+
+    Args:
+        state: Current graph state containing the User's question
+        config: Configuration for the runnable, including LLM provider settings
+
+    Returns:
+        Dictionary with state update, including search_query key containing the generated queries
+    """
+    structured_llm, formatted_prompt, model, decision = _query_generation_llm(
+        state, config
+    )
     # Generate the search queries
-    result = structured_llm.invoke(formatted_prompt)
-    return {"search_query": result.query}
+    with _llm_slot(config, model, formatted_prompt):
+        result = structured_llm.invoke(formatted_prompt)
+    return _query_generation_update(state, config, result, formatted_prompt, decision)
 
 
-def continue_to_web_research(state: QueryGenerationState):
+async def agenerate_query(
+    state: OverallState, config: RunnableConfig
+) -> QueryGenerationState:
+    """Async variant of `generate_query` used when the graph runs on an event loop."""
+    structured_llm, formatted_prompt, model, decision = _query_generation_llm(
+        state, config
+    )
+    async with _allm_slot(config, model, formatted_prompt):
+        result = await structured_llm.ainvoke(formatted_prompt)
+    return _query_generation_update(state, config, result, formatted_prompt, decision)
+
+
+def continue_to_web_research(state: QueryGenerationState, config: RunnableConfig):
     """LangGraph node that sends the search queries to the web research node.
 
     This is used to spawn n number of web research nodes, one for each search query.
+    In 'pipelined' research mode the queries go to `pipelined_research` instead.
     """
+    if Configuration.from_runnable_config(config).research_mode == "pipelined":
+        return "pipelined_research"
     return [
         Send("web_research", {"search_query": search_query, "id": int(idx)})
         for idx, search_query in enumerate(state["search_query"])
     ]
 
 
-def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
-    """LangGraph node that performs web research using the native Google Search API tool.
-
-    Executes a web search using the native Google Search API tool in combination with Gemini 2.0 Flash.
-
-    Args:
-        state: Current graph state containing the search query and research loop count
-        config: Configuration for the runnable, including search API settings
-
-    Returns:
-        Dictionary with state update, including sources_gathered, research_loop_count, and web_research_results
-    """
-    # Configure
-    configurable = Configuration.from_runnable_config(config)
+def _web_search_request(state: WebSearchState, configurable: Configuration) -> dict:
+    """Build the keyword arguments for the grounded Google Search call."""
     formatted_prompt = web_searcher_instructions.format(
         current_date=get_current_date(),
         research_topic=state["search_query"],
     )
-
-    # Uses the google genai client as the langchain client doesn't return grounding metadata
-    response = genai_client.models.generate_content(
-        model=configurable.query_generator_model,
-        contents=formatted_prompt,
-        config={
+    return {
+        "model": configurable.query_generator_model,
+        "contents": formatted_prompt,
+        "config": {
             "tools": [{"google_search": {}}],
             "temperature": 0,
         },
-    )
+    }
+
+
+def _total_token_count(response) -> Optional[int]:
+    """Total tokens reported by a genai response, if any."""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None)
+
+
+def _web_research_update(state: WebSearchState, response) -> OverallState:
+    """Turn a grounded search response into the `web_research` state update."""
     # resolve the urls to short urls for saving tokens and time
     resolved_urls = resolve_urls(
         response.candidates[0].grounding_metadata.grounding_chunks, state["id"]
@@ -129,57 +240,356 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     # Gets the citations and adds them to the generated text
     citations = get_citations(response, resolved_urls)
     modified_text = insert_citation_markers(response.text, citations)
-    sources_gathered = [item for citation in citations for item in citation["segments"]]
+    sources = source_store(
+        item for citation in citations for item in citation["segments"]
+    )
 
     return {
-        "sources_gathered": sources_gathered,
+        "source_store": sources,
         "search_query": [state["search_query"]],
         "web_research_result": [modified_text],
+        "tokens_used": _total_token_count(response) or 0,
+        "web_searches_used": 1,
     }
 
 
-def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
-    """LangGraph node that identifies knowledge gaps and generates potential follow-up queries.
+def _hedging(request: dict, configurable: Configuration):
+    """Return the hedge delay and timeout of a grounded search, None when disabled."""
+    hedge_after = (
+        latency_tracker.percentile(request["model"], configurable.hedge_percentile)
+        if configurable.hedge_web_research
+        else None
+    )
+    return hedge_after, configurable.web_research_timeout_seconds or None
+
+
+def _dropped_query_update(state: WebSearchState, timeout: float) -> OverallState:
+    """State update of a `web_research` branch that hit its timeout."""
+    return {
+        "dropped_queries": [
+            {"query": state["search_query"], "reason": "timeout", "timeout": timeout}
+        ]
+    }
+
+
+def _search_usage(response) -> Optional[dict]:
+    """Token usage of a genai response in LangChain's `usage_metadata` keys."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        "input_tokens": usage.prompt_token_count or 0,
+        "output_tokens": usage.candidates_token_count or 0,
+    }
+
+
+def _search(
+    request: dict,
+    config: RunnableConfig,
+    abandoned: Optional[threading.Event] = None,
+):
+    """Run one grounded search attempt under the rate limiter.
+
+    An attempt of a hedged call that already returned skips the request if it
+    is still waiting for a slot. If it finishes late, its latency is not
+    recorded, so stragglers do not push up the hedge percentile.
+    """
+    start = time.monotonic()
+    with _llm_slot(config, request["model"], request["contents"]) as lease:
+        if abandoned is not None and abandoned.is_set():
+            return None
+        response = get_genai_client().models.generate_content(**request)
+        lease.record_usage(_total_token_count(response))
+    if abandoned is None or not abandoned.is_set():
+        latency_tracker.record(request["model"], time.monotonic() - start)
+    # LangChain callbacks do not see the genai client, so the usage is reported here
+    report_llm_call(config, request["model"], usage=_search_usage(response))
+    return response
+
+
+async def _asearch(request: dict, config: RunnableConfig):
+    """Async variant of `_search`."""
+    start = time.monotonic()
+    async with _allm_slot(config, request["model"], request["contents"]) as lease:
+        response = await get_genai_client().aio.models.generate_content(**request)
+        lease.record_usage(_total_token_count(response))
+    latency_tracker.record(request["model"], time.monotonic() - start)
+    report_llm_call(config, request["model"], usage=_search_usage(response))
+    return response
 
-    Analyzes the current summary to identify areas for further research and generates
-    potential follow-up queries. Uses structured output to extract
-    the follow-up query in JSON format.
+
+def _search_cache_key(state: WebSearchState, configurable: Configuration) -> str:
+    return search_cache_key(
+        state["search_query"], configurable.query_generator_model, get_current_date()
+    )
+
+
+def _search_cache(configurable: Configuration):
+    return get_search_cache(
+        configurable.search_cache,
+        configurable.search_cache_path,
+        configurable.search_cache_ttl_seconds,
+        configurable.search_cache_max_entries,
+    )
+
+
+def _cached_web_research(
+    state: WebSearchState, configurable: Configuration
+) -> Optional[OverallState]:
+    """Return the `web_research` update from the search cache, or None on a miss."""
+    cache = _search_cache(configurable)
+    if cache is None:
+        return None
+    entry = cache.get(_search_cache_key(state, configurable))
+    # Entries written before the source store existed count as misses
+    if entry is None or "source_store" not in entry:
+        return None
+    entry = rekey_short_urls(entry, state["id"])
+    return {
+        "source_store": entry["source_store"],
+        "search_query": [state["search_query"]],
+        "web_research_result": [entry["text"]],
+    }
+
+
+def _cache_web_research(
+    state: WebSearchState, configurable: Configuration, update: OverallState
+) -> None:
+    """Store a fresh `web_research` update in the search cache."""
+    cache = _search_cache(configurable)
+    if cache is None:
+        return
+    cache.set(
+        _search_cache_key(state, configurable),
+        {
+            "id": state["id"],
+            "text": update["web_research_result"][0],
+            "source_store": update["source_store"],
+        },
+    )
+
+
+def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
+    """LangGraph node that performs web research using the native Google Search API tool.
+
+    Executes a web search using the native Google Search API tool in combination with Gemini 2.0 Flash.
 
     Args:
-        state: Current graph state containing the running summary and research topic
-        config: Configuration for the runnable, including LLM provider settings
+        state: Current graph state containing the search query and research loop count
+        config: Configuration for the runnable, including search API settings
 
     Returns:
-        Dictionary with state update, including search_query key containing the generated follow-up query
+        Dictionary with state update, including source_store, search_query, and web_research_result
     """
     configurable = Configuration.from_runnable_config(config)
-    # Increment the research loop count and get the reasoning model
-    state["research_loop_count"] = state.get("research_loop_count", 0) + 1
-    reasoning_model = state.get("reasoning_model", configurable.reflection_model)
+    # Repeat queries are served from the search cache
+    cached = _cached_web_research(state, configurable)
+    if cached is not None:
+        return cached
 
-    # Format the prompt
+    # Uses the google genai client as the langchain client doesn't return grounding metadata
+    request = _web_search_request(state, configurable)
+    hedge_after, timeout = _hedging(request, configurable)
+    if hedge_after is None and timeout is None:
+        response = _search(request, config)
+    else:
+        # A straggler gets a duplicate request, or is dropped at the timeout
+        abandoned = threading.Event()
+        try:
+            response = hedged_call(
+                lambda: _search(request, config, abandoned),
+                hedge_after,
+                timeout,
+                abandoned,
+            )
+        except HedgeTimeout:
+            return _dropped_query_update(state, timeout)
+    update = _web_research_update(state, response)
+    _cache_web_research(state, configurable, update)
+    return update
+
+
+async def aweb_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
+    """Async variant of `web_research` built on the async genai client.
+
+    Each `Send` branch awaits the grounded search on the event loop instead of
+    holding a worker thread while the request is in flight.
+    """
+    configurable = Configuration.from_runnable_config(config)
+    cached = _cached_web_research(state, configurable)
+    if cached is not None:
+        return cached
+
+    request = _web_search_request(state, configurable)
+    hedge_after, timeout = _hedging(request, configurable)
+    if hedge_after is None and timeout is None:
+        response = await _asearch(request, config)
+    else:
+        try:
+            response = await ahedged_call(
+                lambda: _asearch(request, config), hedge_after, timeout
+            )
+        except HedgeTimeout:
+            return _dropped_query_update(state, timeout)
+    update = _web_research_update(state, response)
+    _cache_web_research(state, configurable, update)
+    return update
+
+
+def _reflection_prompt(state: OverallState, configurable: Configuration) -> str:
+    """Format the reflection prompt for the configured reflection mode.
+
+    In 'incremental' mode the prompt carries the running knowledge summary and only
+    the summaries added since the previous loop, so its size stays flat instead of
+    growing with every loop.
+    """
     current_date = get_current_date()
-    formatted_prompt = reflection_instructions.format(
+    research_topic = conversation_history(state["messages"], configurable)
+    if configurable.reflection_mode == "incremental":
+        new_results = state["web_research_result"][
+            state.get("summarized_result_count") or 0 :
+        ]
+        return incremental_reflection_instructions.format(
+            current_date=current_date,
+            research_topic=research_topic,
+            summary_words=configurable.knowledge_summary_words,
+            knowledge_summary=state.get("knowledge_summary") or "(nothing gathered yet)",
+            summaries="\n\n---\n\n".join(new_results),
+        )
+    return reflection_instructions.format(
         current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
+        research_topic=research_topic,
         summaries="\n\n---\n\n".join(state["web_research_result"]),
     )
+
+
+def _reflection_llm(state: OverallState, config: RunnableConfig):
+    """Build the structured reflection model and its prompt."""
+    configurable = Configuration.from_runnable_config(config)
+    # Increment the research loop count and get the reasoning model
+    state["research_loop_count"] = state.get("research_loop_count", 0) + 1
+    reasoning_model = state.get("reasoning_model", configurable.reflection_model)
+
+    # Format the prompt
+    formatted_prompt = _reflection_prompt(state, configurable)
     # init Reasoning Model
-    llm = ChatGoogleGenerativeAI(
-        model=reasoning_model,
+    structured_llm = get_chat_model(
+        GOOGLE_GENAI,
+        reasoning_model,
         temperature=1.0,
+        schema=(
+            IncrementalReflection
+            if configurable.reflection_mode == "incremental"
+            else Reflection
+        ),
         max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
     )
-    result = llm.with_structured_output(Reflection).invoke(formatted_prompt)
+    return structured_llm, formatted_prompt, reasoning_model
 
-    return {
+
+def _reflection_update(
+    state: OverallState, config: RunnableConfig, result: Reflection, prompt: str
+) -> ReflectionState:
+    """Turn a structured reflection into the `reflection` state update.
+
+    Follow-up queries that paraphrase a query already run are dropped before the
+    next fan-out and recorded in `skipped_queries`. With `adaptive_fan_out` the
+    rest are trimmed to the width picked by `decide_fan_out`.
+    """
+    configurable = Configuration.from_runnable_config(config)
+    follow_up_queries, skipped = dedupe_queries(
+        result.follow_up_queries,
+        state["search_query"],
+        configurable.query_dedup_threshold,
+    )
+    decision = None
+    if (
+        configurable.adaptive_fan_out
+        and follow_up_queries
+        and not result.is_sufficient
+        and state["research_loop_count"] < _max_research_loops(state, configurable)
+    ):
+        decision = decide_fan_out(
+            FOLLOW_UP, len(follow_up_queries), state, configurable
+        )
+        follow_up_queries = follow_up_queries[: decision["width"]]
+    update = {
         "is_sufficient": result.is_sufficient,
         "knowledge_gap": result.knowledge_gap,
-        "follow_up_queries": result.follow_up_queries,
+        "follow_up_queries": follow_up_queries,
+        "skipped_queries": skipped,
         "research_loop_count": state["research_loop_count"],
         "number_of_ran_queries": len(state["search_query"]),
+        "tokens_used": _structured_token_count(prompt, result),
     }
+    if isinstance(result, IncrementalReflection):
+        update["knowledge_summary"] = result.knowledge_summary
+        update["summarized_result_count"] = len(state["web_research_result"])
+    if decision is not None:
+        update["fan_out"] = [decision]
+    return update
+
+
+def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+    """LangGraph node that identifies knowledge gaps and generates potential follow-up queries.
+
+    Analyzes the current summary to identify areas for further research and generates
+    potential follow-up queries. Uses structured output to extract
+    the follow-up query in JSON format.
+
+    Args:
+        state: Current graph state containing the running summary and research topic
+        config: Configuration for the runnable, including LLM provider settings
+
+    Returns:
+        Dictionary with state update, including search_query key containing the generated follow-up query
+    """
+    structured_llm, formatted_prompt, model = _reflection_llm(state, config)
+    with _llm_slot(config, model, formatted_prompt):
+        result = structured_llm.invoke(formatted_prompt)
+    return _reflection_update(state, config, result, formatted_prompt)
+
+
+async def areflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+    """Async variant of `reflection`."""
+    structured_llm, formatted_prompt, model = _reflection_llm(state, config)
+    async with _allm_slot(config, model, formatted_prompt):
+        result = await structured_llm.ainvoke(formatted_prompt)
+    return _reflection_update(state, config, result, formatted_prompt)
+
+
+def _max_research_loops(state: OverallState, configurable: Configuration) -> int:
+    """Return the run's loop limit: the state's override, else the configured one."""
+    if state.get("max_research_loops") is not None:
+        return state["max_research_loops"]
+    return configurable.max_research_loops
+
+
+def _budget_fan_out(state: ReflectionState, configurable: Configuration) -> Optional[int]:
+    """Return how many follow-up searches the run's budgets still allow, None if unbounded.
+
+    Spend is measured from the `budget_start` snapshot taken by `generate_query`.
+    Projections assume that a further search costs the run's average tokens per
+    search so far, and that another round, like the answer, takes as long as the
+    average round so far.
+    """
+    start = state.get("budget_start") or {}
+    searches = (state.get("web_searches_used") or 0) - start.get("web_searches_used", 0)
+    allowed = None
+    if configurable.max_web_searches > 0:
+        allowed = configurable.max_web_searches - searches
+    if configurable.max_total_tokens > 0:
+        tokens = (state.get("tokens_used") or 0) - start.get("tokens_used", 0)
+        per_search = tokens / max(searches, 1)
+        # Keep one search's worth of tokens for the answer
+        by_tokens = int((configurable.max_total_tokens - tokens) // max(per_search, 1)) - 1
+        allowed = by_tokens if allowed is None else min(allowed, by_tokens)
+    if configurable.max_run_seconds > 0 and "started_at" in start:
+        elapsed = time.time() - start["started_at"]
+        rounds = state["research_loop_count"] - start.get("research_loop_count", 0)
+        if elapsed + 2 * elapsed / max(rounds, 1) > configurable.max_run_seconds:
+            allowed = 0
+    return allowed
 
 
 def evaluate_research(
@@ -190,6 +600,8 @@ def evaluate_research(
 
     Controls the research loop by deciding whether to continue gathering information
     or to finalize the summary based on the configured maximum number of research loops.
+    When a run budget (`max_run_seconds`, `max_total_tokens`, `max_web_searches`)
+    runs low, the follow-up fan-out is trimmed, or the answer is written right away.
 
     Args:
         state: Current graph state containing the research loop count
@@ -199,12 +611,18 @@ def evaluate_research(
         String literal indicating the next node to visit ("web_research" or "finalize_summary")
     """
     configurable = Configuration.from_runnable_config(config)
-    max_research_loops = (
-        state.get("max_research_loops")
-        if state.get("max_research_loops") is not None
-        else configurable.max_research_loops
-    )
-    if state["is_sufficient"] or state["research_loop_count"] >= max_research_loops:
+    max_research_loops = _max_research_loops(state, configurable)
+    follow_up_queries = state["follow_up_queries"]
+    allowed = _budget_fan_out(state, configurable)
+    if allowed is not None:
+        # Follow-up queries come in the model's order of priority
+        follow_up_queries = follow_up_queries[: max(allowed, 0)]
+    if (
+        state["is_sufficient"]
+        or state["research_loop_count"] >= max_research_loops
+        # every follow-up query duplicated one that was already run, or no budget is left
+        or not follow_up_queries
+    ):
         return "finalize_answer"
     else:
         return [
@@ -215,73 +633,514 @@ def evaluate_research(
                     "id": state["number_of_ran_queries"] + int(idx),
                 },
             )
-            for idx, follow_up_query in enumerate(state["follow_up_queries"])
+            for idx, follow_up_query in enumerate(follow_up_queries)
         ]
 
 
-def finalize_answer(state: OverallState, config: RunnableConfig):
-    """LangGraph node that finalizes the research summary.
+# Reducers of the state keys, to merge branch updates the way the graph does
+_REDUCERS = {
+    name: hint.__metadata__[0]
+    for name, hint in get_type_hints(OverallState, include_extras=True).items()
+    if getattr(hint, "__metadata__", None)
+}
 
-    Prepares the final output by deduplicating and formatting sources, then
-    combining them with the running summary to create a well-structured
-    research report with proper citations.
+
+def _merge_update(target: dict, update: dict) -> None:
+    """Apply a node's state update to `target` with the state's reducers."""
+    for key, value in update.items():
+        reducer = _REDUCERS.get(key)
+        if reducer is not None and target.get(key) is not None:
+            target[key] = reducer(target[key], value)
+        else:
+            target[key] = value
+
+
+class _Pipeline:
+    """Bookkeeping of the 'pipelined' research mode.
+
+    The sync and async drivers only schedule the work: they start the branches
+    from `take_branches`, reflect when `reflection_due` says so, and report back
+    through `add_result` and `add_reflection`. The pipeline keeps the state as
+    the 'rounds' mode would see it, and the node's update. As in that mode, a run
+    reflects up to `max_research_loops` times, the last time on every result,
+    and only the follow-ups of the earlier reflections are searched.
+    """
+
+    def __init__(self, state: OverallState, config: RunnableConfig):
+        self.configurable = Configuration.from_runnable_config(config)
+        self.max_loops = _max_research_loops(state, self.configurable)
+        self.state = dict(state)
+        self.update = {}
+        # Every query sent so far, in flight or not; follow-ups are deduped on it
+        self.issued = list(state["search_query"])
+        self.queued = [
+            {"search_query": query, "id": idx} for idx, query in enumerate(self.issued)
+        ]
+        self.in_flight = 0
+        self.returned = 0
+        self.reflecting = False
+        self.reflected_results = len(state.get("web_research_result") or [])
+        self.stopped = False
+
+    def take_branches(self) -> list:
+        """Return the searches to start now and count them as in flight."""
+        branches, self.queued = self.queued, []
+        self.in_flight += len(branches)
+        return branches
+
+    def add_result(self, update: OverallState) -> None:
+        """Fold in the update of a finished web_research branch."""
+        self.in_flight -= 1
+        self.returned += 1
+        _merge_update(self.state, update)
+        _merge_update(self.update, update)
+
+    def reflection_due(self) -> bool:
+        """Whether to reflect now on the results gathered so far.
+
+        Reflection runs once it has new results and the quorum of the searches
+        in flight since the previous reflection has returned. The last
+        reflection of the run, whose follow-ups are not searched, waits for
+        every search, like the last round of the 'rounds' mode.
+        """
+        if self.reflecting or self.stopped:
+            return False
+        if len(self.state.get("web_research_result") or []) <= self.reflected_results:
+            return False
+        if (self.state.get("research_loop_count") or 0) + 1 >= self.max_loops:
+            return self.in_flight == 0
+        quorum = self.configurable.pipelined_reflection_quorum
+        return self.returned >= quorum * (self.returned + self.in_flight)
+
+    def start_reflection(self) -> OverallState:
+        """Snapshot of the state to reflect on."""
+        self.reflecting = True
+        self.returned = 0
+        snapshot = dict(self.state)
+        snapshot["search_query"] = list(self.issued)
+        snapshot["web_research_result"] = list(self.state["web_research_result"])
+        return snapshot
+
+    def add_reflection(self, snapshot: OverallState, update: ReflectionState) -> None:
+        """Fold in a reflection and queue its follow-up searches.
+
+        Like `evaluate_research`, searching stops when the results are
+        sufficient, after the last loop, when every follow-up was a duplicate or
+        when no budget is left; the searches in flight still finish and reach
+        the answer.
+        """
+        self.reflecting = False
+        self.reflected_results = len(snapshot["web_research_result"])
+        _merge_update(self.state, update)
+        _merge_update(self.update, update)
+        follow_up_queries = update["follow_up_queries"]
+        allowed = _budget_fan_out(self.state, self.configurable)
+        if allowed is not None:
+            follow_up_queries = follow_up_queries[: max(allowed, 0)]
+        if (
+            update["is_sufficient"]
+            or update["research_loop_count"] >= self.max_loops
+            or not follow_up_queries
+        ):
+            self.stopped = True
+            return
+        self.queued.extend(
+            {"search_query": query, "id": len(self.issued) + idx}
+            for idx, query in enumerate(follow_up_queries)
+        )
+        self.issued.extend(follow_up_queries)
+
+
+def pipelined_research(state: OverallState, config: RunnableConfig) -> OverallState:
+    """LangGraph node that runs web research and reflection as a pipeline.
+
+    With `add_edge("web_research", "reflection")` reflection waits for the
+    slowest branch of every round. Here the searches run on a thread pool and
+    reflection runs on the results gathered so far while the rest are in
+    flight. It can send follow-up searches right away, or stop searching once
+    the results are sufficient; the results that arrive afterwards still go to
+    `finalize_answer`.
 
     Args:
-        state: Current graph state containing the running summary and sources gathered
+        state: Current graph state containing the initial search queries
+        config: Configuration for the runnable, including the research settings
 
     Returns:
-        Dictionary with state update, including running_summary key containing the formatted final summary with sources
+        The merged updates of every web research branch and reflection
+    """
+    pipeline = _Pipeline(state, config)
+    pending = {}
+    with ContextThreadPoolExecutor() as pool:
+
+        def launch() -> None:
+            for branch in pipeline.take_branches():
+                pending[pool.submit(web_research, branch, config)] = None
+            if pipeline.reflection_due():
+                snapshot = pipeline.start_reflection()
+                pending[pool.submit(reflection, snapshot, config)] = snapshot
+
+        try:
+            launch()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    snapshot = pending.pop(future)
+                    if snapshot is None:
+                        pipeline.add_result(future.result())
+                    else:
+                        pipeline.add_reflection(snapshot, future.result())
+                launch()
+        finally:
+            for future in pending:
+                future.cancel()
+    return pipeline.update
+
+
+async def apipelined_research(
+    state: OverallState, config: RunnableConfig
+) -> OverallState:
+    """Async variant of `pipelined_research`; branches are tasks on the event loop."""
+    pipeline = _Pipeline(state, config)
+    pending = {}
+
+    def launch() -> None:
+        for branch in pipeline.take_branches():
+            pending[asyncio.ensure_future(aweb_research(branch, config))] = None
+        if pipeline.reflection_due():
+            snapshot = pipeline.start_reflection()
+            pending[asyncio.ensure_future(areflection(snapshot, config))] = snapshot
+
+    try:
+        launch()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                snapshot = pending.pop(task)
+                if snapshot is None:
+                    pipeline.add_result(task.result())
+                else:
+                    pipeline.add_reflection(snapshot, task.result())
+            launch()
+    finally:
+        for task in pending:
+            task.cancel()
+    return pipeline.update
+
+
+def _synthesis_batches(summaries: list, configurable: Configuration) -> Optional[list]:
+    """Group summaries into batches for the map step, or None when none is needed.
+
+    Summaries are packed in order up to `synthesis_batch_tokens` per batch. None is
+    returned below `synthesis_token_threshold`, or when no two summaries fit into one
+    batch, since another round of condensing would not reduce their number.
+    """
+    threshold = configurable.synthesis_token_threshold
+    if threshold <= 0 or estimate_tokens("\n---\n\n".join(summaries)) <= threshold:
+        return None
+    batches, batch_tokens = [], 0
+    for summary in summaries:
+        tokens = estimate_tokens(summary)
+        if batches and batch_tokens + tokens <= configurable.synthesis_batch_tokens:
+            batches[-1].append(summary)
+            batch_tokens += tokens
+        else:
+            batches.append([summary])
+            batch_tokens = tokens
+    return batches if len(batches) < len(summaries) else None
+
+
+def _condense_prompts(
+    state: OverallState, configurable: Configuration, batches: list
+) -> list:
+    """Format one condense prompt per batch of summaries."""
+    current_date = get_current_date()
+    research_topic = conversation_history(state["messages"], configurable)
+    return [
+        condense_instructions.format(
+            current_date=current_date,
+            research_topic=research_topic,
+            summaries="\n---\n\n".join(batch),
+        )
+        for batch in batches
+    ]
+
+
+def _condense_llm(config: RunnableConfig):
+    """Build the map-step model; its output is intermediate and never streamed."""
+    model = Configuration.from_runnable_config(config).synthesis_model
+    llm = get_chat_model(GOOGLE_GENAI, model, temperature=0, max_retries=2)
+    return llm.with_config(tags=[TAG_NOSTREAM]), model
+
+
+def _condense(prompt: str, config: RunnableConfig) -> str:
+    """Condense one batch of summaries into notes that keep their short urls."""
+    llm, model = _condense_llm(config)
+    with _llm_slot(config, model, prompt) as lease:
+        result = llm.invoke(prompt)
+        lease.record_usage(_message_token_count(result))
+    return _chunk_text(result)
+
+
+async def _acondense(prompt: str, config: RunnableConfig) -> str:
+    """Async variant of `_condense`."""
+    llm, model = _condense_llm(config)
+    async with _allm_slot(config, model, prompt) as lease:
+        result = await llm.ainvoke(prompt)
+        lease.record_usage(_message_token_count(result))
+    return _chunk_text(result)
+
+
+condense_summaries = RunnableLambda(_condense, afunc=_acondense, name="condense_summaries")
+
+
+def _synthesized_summaries(state: OverallState, config: RunnableConfig) -> list:
+    """Summaries for the answer prompt, condensed batch-wise in parallel while too large.
+
+    Each round is a map step over all batches; the answer model then performs the
+    reduce step on the condensed notes.
     """
     configurable = Configuration.from_runnable_config(config)
+    summaries = state["web_research_result"]
+    while (batches := _synthesis_batches(summaries, configurable)) is not None:
+        summaries = condense_summaries.batch(
+            _condense_prompts(state, configurable, batches), config
+        )
+    return summaries
+
+
+async def _asynthesized_summaries(state: OverallState, config: RunnableConfig) -> list:
+    """Async variant of `_synthesized_summaries`."""
+    configurable = Configuration.from_runnable_config(config)
+    summaries = state["web_research_result"]
+    while (batches := _synthesis_batches(summaries, configurable)) is not None:
+        summaries = await condense_summaries.abatch(
+            _condense_prompts(state, configurable, batches), config
+        )
+    return summaries
+
+
+def _answer_llm(state: OverallState, config: RunnableConfig, summaries: list):
+    """Build the answer model and its prompt."""
+    configurable = Configuration.from_runnable_config(config)
     reasoning_model = state.get("reasoning_model") or configurable.answer_model
 
     # Format the prompt
     current_date = get_current_date()
     formatted_prompt = answer_instructions.format(
         current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
-        summaries="\n---\n\n".join(state["web_research_result"]),
+        research_topic=conversation_history(state["messages"], configurable),
+        summaries="\n---\n\n".join(summaries),
     )
 
     # init Reasoning Model, default to Gemini 2.5 Flash
-    llm = ChatGoogleGenerativeAI(
-        model=reasoning_model,
-        temperature=0,
-        max_retries=2,
-        api_key=os.getenv("GEMINI_API_KEY"),
-    )
-    result = llm.invoke(formatted_prompt)
+    llm = get_chat_model(GOOGLE_GENAI, reasoning_model, temperature=0, max_retries=2)
+    return llm, formatted_prompt, reasoning_model
+
 
+def _message_token_count(message) -> Optional[int]:
+    """Total tokens reported in a chat message's usage metadata, if any."""
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+def _finalize_update(state: OverallState, result) -> OverallState:
+    """Expand the short urls in the answer and build the final state update."""
     # Replace the short urls with the original urls and add all used urls to the sources_gathered
-    unique_sources = []
-    for source in state["sources_gathered"]:
-        if source["short_url"] in result.content:
-            result.content = result.content.replace(
-                source["short_url"], source["value"]
-            )
-            unique_sources.append(source)
+    content, unique_sources = expand_short_urls(
+        result.content, store_segments(state.get("source_store"))
+    )
 
     return {
-        "messages": [AIMessage(content=result.content)],
+        "messages": [AIMessage(content=content)],
         "sources_gathered": unique_sources,
+        "tokens_used": _message_token_count(result) or 0,
     }
 
 
+def _chunk_text(chunk) -> str:
+    """Text of a streamed message chunk, skipping non-text content blocks."""
+    if isinstance(chunk.content, str):
+        return chunk.content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in chunk.content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+
+def _push_answer_chunk(message_id: str, text: str) -> None:
+    """Emit a chunk of the final answer on the graph's `messages` stream."""
+    # push_message needs the callbacks of a streaming run; plain invoke has none
+    if get_config().get("callbacks") is not None:
+        push_message(AIMessageChunk(content=text, id=message_id), state_key=None)
+
+
+class _AnswerStream:
+    """Collects a streamed answer, rewriting short urls before each chunk is emitted.
+
+    The answer model itself runs with the `nostream` tag, so the `messages` stream
+    only carries the rewritten chunks. They share the id of the final message.
+    """
+
+    def __init__(self, state: OverallState):
+        self.sources = store_segments(state.get("source_store"))
+        self.rewriter = ShortUrlStreamRewriter(self.sources)
+        self.message_id = f"run-{uuid.uuid4()}"
+        self.parts = []
+        self.usage = None
+
+    def add(self, chunk) -> None:
+        if chunk.usage_metadata:
+            self.usage = add_usage(self.usage, chunk.usage_metadata)
+        self._emit(self.rewriter.feed(_chunk_text(chunk)))
+
+    def total_tokens(self) -> Optional[int]:
+        return self.usage["total_tokens"] if self.usage else None
+
+    def finish(self) -> OverallState:
+        self._emit(self.rewriter.flush())
+        return {
+            "messages": [AIMessage(content="".join(self.parts), id=self.message_id)],
+            "sources_gathered": self.rewriter.unique_sources(self.sources),
+            "tokens_used": self.total_tokens() or 0,
+        }
+
+    def _emit(self, text: str) -> None:
+        if text:
+            self.parts.append(text)
+            _push_answer_chunk(self.message_id, text)
+
+
+def finalize_answer(state: OverallState, config: RunnableConfig):
+    """LangGraph node that finalizes the research summary.
+
+    Prepares the final output by deduplicating and formatting sources, then
+    combining them with the running summary to create a well-structured
+    research report with proper citations.
+
+    Args:
+        state: Current graph state containing the running summary and sources gathered
+
+    Returns:
+        Dictionary with state update, including running_summary key containing the formatted final summary with sources
+    """
+    summaries = _synthesized_summaries(state, config)
+    llm, formatted_prompt, model = _answer_llm(state, config, summaries)
+    if not Configuration.from_runnable_config(config).stream_answer:
+        with _llm_slot(config, model, formatted_prompt) as lease:
+            result = llm.invoke(formatted_prompt)
+            lease.record_usage(_message_token_count(result))
+        return _finalize_update(state, result)
+
+    answer = _AnswerStream(state)
+    with _llm_slot(config, model, formatted_prompt) as lease:
+        for chunk in llm.with_config(tags=[TAG_NOSTREAM]).stream(formatted_prompt):
+            answer.add(chunk)
+        lease.record_usage(answer.total_tokens())
+    return answer.finish()
+
+
+async def afinalize_answer(state: OverallState, config: RunnableConfig):
+    """Async variant of `finalize_answer`."""
+    summaries = await _asynthesized_summaries(state, config)
+    llm, formatted_prompt, model = _answer_llm(state, config, summaries)
+    if not Configuration.from_runnable_config(config).stream_answer:
+        async with _allm_slot(config, model, formatted_prompt) as lease:
+            result = await llm.ainvoke(formatted_prompt)
+            lease.record_usage(_message_token_count(result))
+        return _finalize_update(state, result)
+
+    answer = _AnswerStream(state)
+    async with _allm_slot(config, model, formatted_prompt) as lease:
+        async for chunk in llm.with_config(tags=[TAG_NOSTREAM]).astream(formatted_prompt):
+            answer.add(chunk)
+        lease.record_usage(answer.total_tokens())
+    return answer.finish()
+
+
+def _answer_params(state: OverallState, config: RunnableConfig) -> tuple:
+    """Return the settings and prompts the answer depends on, besides the state."""
+    configurable = Configuration.from_runnable_config(config)
+    return (
+        configurable.answer_model,
+        configurable.synthesis_model,
+        configurable.synthesis_token_threshold,
+        configurable.synthesis_batch_tokens,
+        configurable.history_window_tokens,
+        configurable.history_summary_tokens,
+        answer_instructions,
+        condense_instructions,
+    )
+
+
+# The answer model runs at temperature 0, so the same research gives the same
+# answer. tokens_used is left out: a cached answer costs no tokens.
+FINALIZE_ANSWER_CACHE = NodeCachePolicy(
+    inputs=("messages", "web_research_result", "source_store", "reasoning_model"),
+    outputs=("messages", "sources_gathered"),
+    params=_answer_params,
+    depends_on=(
+        _synthesis_batches,
+        _condense_prompts,
+        _condense_llm,
+        _condense,
+        _acondense,
+        _synthesized_summaries,
+        _asynthesized_summaries,
+        _answer_llm,
+        _message_token_count,
+        _finalize_update,
+        _AnswerStream,
+        agent.history,
+        agent.prompts,
+        agent.sources,
+        agent.utils,
+    ),
+)
+
+
 # Create our Agent Graph
 builder = StateGraph(OverallState, config_schema=Configuration)
 
-# Define the nodes we will cycle between
-builder.add_node("generate_query", generate_query)
-builder.add_node("web_research", web_research)
-builder.add_node("reflection", reflection)
-builder.add_node("finalize_answer", finalize_answer)
+# Define the nodes we will cycle between. Each node carries a sync and an async
+# implementation: `invoke`/`stream` run the sync functions, while `ainvoke`/`astream`
+# await the native async clients so parallel branches share one event loop.
+builder.add_node(
+    "generate_query",
+    RunnableLambda(generate_query, afunc=agenerate_query, name="generate_query"),
+)
+builder.add_node(
+    "web_research",
+    RunnableLambda(web_research, afunc=aweb_research, name="web_research"),
+)
+builder.add_node(
+    "reflection",
+    RunnableLambda(reflection, afunc=areflection, name="reflection"),
+)
+builder.add_node(
+    "pipelined_research",
+    RunnableLambda(
+        pipelined_research, afunc=apipelined_research, name="pipelined_research"
+    ),
+)
+builder.add_node(
+    "finalize_answer",
+    cached_node(
+        "finalize_answer",
+        finalize_answer,
+        FINALIZE_ANSWER_CACHE,
+        afunc=afinalize_answer,
+    ),
+)
 
 # Set the entrypoint as `generate_query`
 # This means that this node is the first one called
 builder.add_edge(START, "generate_query")
 # Add conditional edge to continue with search queries in a parallel branch
 builder.add_conditional_edges(
-    "generate_query", continue_to_web_research, ["web_research"]
+    "generate_query",
+    continue_to_web_research,
+    ["web_research", "pipelined_research"],
 )
 # Reflect on the web research
 builder.add_edge("web_research", "reflection")
@@ -289,7 +1148,12 @@ builder.add_edge("web_research", "reflection")
 builder.add_conditional_edges(
     "reflection", evaluate_research, ["web_research", "finalize_answer"]
 )
+# In 'pipelined' research mode, reflection runs inside `pipelined_research`
+builder.add_edge("pipelined_research", "finalize_answer")
 # Finalize the answer
 builder.add_edge("finalize_answer", END)
 
-graph = builder.compile(name="pro-search-agent")
+graph = instrument_graph(
+    builder.compile(name="pro-search-agent", checkpointer=get_checkpointer()),
+    "agent",
+)
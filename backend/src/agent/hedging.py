@@ -0,0 +1,193 @@
+"""Hedged requests and hard timeouts for slow provider calls.
+
+`reflection` only runs once every parallel `web_research` branch has finished, so
+the latency of a fan-out is the latency of its slowest branch. A hedged call
+sends a duplicate request once the first one has been running longer than a
+percentile of recently observed latencies, and returns whichever response
+arrives first. An optional hard timeout bounds the call as a whole.
+
+Sync attempts run on one shared pool of `HEDGE_MAX_WORKERS` threads (32 by
+default). Attempts that have not started when the call returns are cancelled;
+running ones finish in the background and are told through `abandoned`, so
+they can skip their work and their latency samples.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class HedgeTimeout(TimeoutError):
+    """Raised when no attempt of a hedged call finished within its timeout."""
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies per key, e.g. per model."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """Keep the last `window` latencies per key."""
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float) -> None:
+        """Add the latency of a finished call."""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key: str, q: float) -> Optional[float]:
+        """Latency below which a fraction `q` of recent calls finished.
+
+        Returns None until `min_samples` calls have been recorded for `key`, so no
+        hedges are sent before the distribution is known.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))]
+
+
+# Process-wide instances; counts are "hedged", "hedge_won" and "timed_out"
+latency_tracker = LatencyTracker()
+hedge_counts: Counter = Counter()
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _attempt_pool() -> ThreadPoolExecutor:
+    """Return the shared pool of sync attempts, created on first use.
+
+    The graphs load `.env` after their imports, so `HEDGE_MAX_WORKERS` is read
+    here rather than at import time.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("HEDGE_MAX_WORKERS") or 32),
+                thread_name_prefix="hedged-call",
+            )
+        return _executor
+
+
+def _wait_seconds(
+    elapsed: float, hedge_after: Optional[float], timeout: Optional[float]
+) -> Optional[float]:
+    waits = [limit - elapsed for limit in (hedge_after, timeout) if limit is not None]
+    return max(min(waits), 0) if waits else None
+
+
+def hedged_call(
+    func: Callable[[], T],
+    hedge_after: Optional[float] = None,
+    timeout: Optional[float] = None,
+    abandoned: Optional[threading.Event] = None,
+) -> T:
+    """Call `func`, sending one duplicate call if it is still running after `hedge_after`.
+
+    Args:
+        func: The call to make. It must be safe to run twice concurrently.
+        hedge_after: Seconds after which the duplicate is sent; None disables hedging.
+        timeout: Seconds after which `HedgeTimeout` is raised; None waits forever.
+        abandoned: Set once the call has returned or raised. An attempt still
+            running then has its result discarded.
+
+    Returns:
+        The result of the first attempt that succeeds. An attempt that fails is
+        only raised once no other attempt is still running.
+
+    Attempts run on the shared pool. Threads cannot be cancelled, so a losing or
+    timed out attempt that already started finishes in the background.
+    """
+    executor = _attempt_pool()
+    start = time.monotonic()
+    pending = {executor.submit(func)}
+    hedge = None
+    try:
+        while True:
+            elapsed = time.monotonic() - start
+            next_hedge = hedge_after if hedge is None else None
+            done, pending = wait(
+                pending,
+                timeout=_wait_seconds(elapsed, next_hedge, timeout),
+                return_when=FIRST_COMPLETED,
+            )
+            error = None
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        hedge_counts["hedge_won"] += 1
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            elapsed = time.monotonic() - start
+            if timeout is not None and elapsed >= timeout:
+                hedge_counts["timed_out"] += 1
+                raise HedgeTimeout(f"No response after {timeout:.1f}s")
+            if hedge is None and hedge_after is not None and elapsed >= hedge_after:
+                hedge_counts["hedged"] += 1
+                hedge = executor.submit(func)
+                pending.add(hedge)
+    finally:
+        if abandoned is not None:
+            abandoned.set()
+        for future in pending:
+            future.cancel()
+
+
+async def ahedged_call(
+    func: Callable[[], Awaitable[T]],
+    hedge_after: Optional[float] = None,
+    timeout: Optional[float] = None,
+) -> T:
+    """Async variant of `hedged_call`; `func` returns a new awaitable per attempt.
+
+    Losing and timed out attempts are cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    pending = {asyncio.ensure_future(func())}
+    hedge = None
+    try:
+        while True:
+            elapsed = loop.time() - start
+            next_hedge = hedge_after if hedge is None else None
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=_wait_seconds(elapsed, next_hedge, timeout),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            error = None
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        hedge_counts["hedge_won"] += 1
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                raise error
+            elapsed = loop.time() - start
+            if timeout is not None and elapsed >= timeout:
+                hedge_counts["timed_out"] += 1
+                raise HedgeTimeout(f"No response after {timeout:.1f}s")
+            if hedge is None and hedge_after is not None and elapsed >= hedge_after:
+                hedge_counts["hedged"] += 1
+                hedge = asyncio.ensure_future(func())
+                pending.add(hedge)
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,161 @@
+"""Token-bounded conversation history for the research prompts.
+
+`generate_query`, `reflection`, the condense step and `finalize_answer` all
+embed the conversation as the research topic. For long threads, sending the
+whole history to each of them makes every node slower and more expensive.
+`conversation_history` keeps the most recent turns that fit in
+`history_window_tokens`. Older turns are folded into a rolling extractive
+summary with one digest line per turn, capped at `history_summary_tokens`.
+
+The window is cached per thread, keyed on the id of the thread's first
+message. When messages are appended, only the new turns are processed, so the
+nodes of a run and the later runs of a thread do not recompute the history.
+"""
+
+import re
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
+
+from agent.configuration import Configuration
+from agent.utils import estimate_tokens
+
+# Longest digest of one summarized turn, in words
+DIGEST_WORDS = 40
+MAX_THREADS = 256
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s")
+
+
+def render_turn(message: AnyMessage) -> Optional[str]:
+    """Render a user or assistant message as one history line."""
+    if isinstance(message, HumanMessage):
+        return f"User: {message.content}\n"
+    if isinstance(message, AIMessage):
+        return f"Assistant: {message.content}\n"
+    return None
+
+
+def digest_turn(line: str, words: int = DIGEST_WORDS) -> str:
+    """First sentence of a history line, cut to `words` words."""
+    text = " ".join(line.split())
+    text = _SENTENCE_END.split(text, maxsplit=1)[0]
+    tokens = text.split(" ")
+    if len(tokens) > words:
+        text = " ".join(tokens[:words]) + " …"
+    return f"- {text}\n"
+
+
+@dataclass
+class _Window:
+    """History of one thread: recent turns verbatim, older ones as digests."""
+
+    window_tokens: int
+    summary_tokens: int
+    message_count: int = 0
+    last_id: Optional[str] = None
+    recent: Deque[Tuple[str, int]] = field(default_factory=deque)
+    recent_total: int = 0
+    digests: Deque[Tuple[str, int]] = field(default_factory=deque)
+    digest_total: int = 0
+    omitted: int = 0
+    text: str = ""
+
+    def matches(self, messages: List[AnyMessage]) -> bool:
+        """Whether `messages` extends the messages this window was built from."""
+        if len(messages) < self.message_count:
+            return False
+        if self.message_count == 0:
+            return True
+        return messages[self.message_count - 1].id == self.last_id
+
+    def extend(self, messages: List[AnyMessage]) -> None:
+        """Add the messages after the ones already in the window."""
+        for message in messages[self.message_count :]:
+            line = render_turn(message)
+            if line is None:
+                continue
+            tokens = estimate_tokens(line)
+            self.recent.append((line, tokens))
+            self.recent_total += tokens
+            # The latest turn stays even when it alone exceeds the budget
+            while self.recent_total > self.window_tokens and len(self.recent) > 1:
+                old, old_tokens = self.recent.popleft()
+                self.recent_total -= old_tokens
+                self._summarize(old)
+        self.message_count = len(messages)
+        self.last_id = messages[-1].id if messages else None
+        self.text = self._render()
+
+    def _summarize(self, line: str) -> None:
+        digest = digest_turn(line)
+        tokens = estimate_tokens(digest)
+        self.digests.append((digest, tokens))
+        self.digest_total += tokens
+        while self.digest_total > self.summary_tokens and self.digests:
+            _, old_tokens = self.digests.popleft()
+            self.digest_total -= old_tokens
+            self.omitted += 1
+
+    def _render(self) -> str:
+        recent = "".join(line for line, _ in self.recent)
+        if not self.digests and not self.omitted:
+            return recent
+        parts = ["Summary of earlier turns:\n"]
+        if self.omitted:
+            parts.append(f"- ({self.omitted} earlier turns omitted)\n")
+        parts.extend(digest for digest, _ in self.digests)
+        parts.append("\nRecent turns:\n")
+        parts.append(recent)
+        return "".join(parts)
+
+
+_windows: "OrderedDict[str, _Window]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def conversation_history(
+    messages: List[AnyMessage], configurable: Configuration
+) -> str:
+    """Return the research topic of a conversation, bounded to the configured budget.
+
+    A single message is returned as is, like `get_research_topic` does. With
+    `history_window_tokens` set to 0 the whole history is returned.
+    """
+    if not messages:
+        return ""
+    if len(messages) == 1:
+        return messages[-1].content
+    if configurable.history_window_tokens <= 0:
+        return "".join(filter(None, map(render_turn, messages)))
+
+    thread_key = messages[0].id
+    with _lock:
+        window = _windows.get(thread_key) if thread_key is not None else None
+        if (
+            window is None
+            or window.window_tokens != configurable.history_window_tokens
+            or window.summary_tokens != configurable.history_summary_tokens
+            or not window.matches(messages)
+        ):
+            window = _Window(
+                configurable.history_window_tokens,
+                configurable.history_summary_tokens,
+            )
+        if window.message_count != len(messages):
+            window.extend(messages)
+        if thread_key is not None:
+            _windows[thread_key] = window
+            _windows.move_to_end(thread_key)
+            if len(_windows) > MAX_THREADS:
+                _windows.popitem(last=False)
+    return window.text
+
+
+def clear_history_cache() -> None:
+    """Forget the cached windows of every thread."""
+    with _lock:
+        _windows.clear()
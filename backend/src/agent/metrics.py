@@ -0,0 +1,572 @@
+"""In-process run, node and LLM call metrics for every graph in `langgraph.json`.
+
+A `MetricsCallbackHandler` is attached to each compiled graph with
+`graph.with_config(callbacks=[...])`. It times the root run and every node run
+(a chain run whose parent is the root), and the chat model calls made inside a
+node, whose token usage it reads from the model response. Calls that LangChain
+does not see, such as the grounded searches through the google-genai client,
+and the time a call spent queued in the rate limiter, are reported by the node
+itself with `report_llm_call`, which dispatches an `llm_usage` custom event.
+
+Numbers are aggregated in memory into Prometheus histograms and counters, and
+`render_prometheus` returns them in the Prometheus text format.
+"""
+
+import bisect
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler, dispatch_custom_event
+from langchain_core.runnables import RunnableConfig
+
+LLM_USAGE_EVENT = "llm_usage"
+# Run metadata key naming the prompt template of a chat model call (see
+# agent.prompt_cache)
+PROMPT_TEMPLATE_METADATA = "prompt_template"
+
+# Seconds; spans a cached lookup up to a deep research run
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a quantile estimate like `histogram_quantile`."""
+
+    def __init__(self, buckets: Sequence[float]):
+        """Create an empty histogram with the given upper bucket bounds."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Record one sample."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the `q` quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if idx == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[idx - 1] if idx else 0.0
+                return lower + (self.buckets[idx] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+@dataclass
+class _Family:
+    kind: str
+    help: str
+    buckets: Sequence[float] = ()
+    series: Dict[Labels, Any] = field(default_factory=dict)
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters and histograms keyed by name and labels."""
+
+    def __init__(self, recent_runs: int = 200):
+        """Create an empty registry keeping the last `recent_runs` run breakdowns."""
+        self._lock = threading.Lock()
+        self._families: Dict[str, _Family] = {}
+        self._recent_runs: deque = deque(maxlen=recent_runs)
+
+    def _family(self, name: str, kind: str, help: str, buckets=()) -> _Family:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = _Family(kind, help, buckets)
+        return family
+
+    def inc(self, name: str, help: str, labels: Dict[str, str], value: float = 1) -> None:
+        """Add `value` to a counter series."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._family(name, "counter", help).series
+            series[key] = series.get(key, 0) + value
+
+    def observe(
+        self,
+        name: str,
+        help: str,
+        labels: Dict[str, str],
+        value: float,
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> None:
+        """Record a sample in a histogram series."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._family(name, "histogram", help, buckets)
+            histogram = family.series.get(key)
+            if histogram is None:
+                histogram = family.series[key] = Histogram(family.buckets)
+            histogram.observe(value)
+
+    def quantile(self, name: str, labels: Dict[str, str], q: float) -> Optional[float]:
+        """Return the estimated quantile of a histogram series, None if it has no samples."""
+        with self._lock:
+            family = self._families.get(name)
+            histogram = family.series.get(tuple(sorted(labels.items()))) if family else None
+            return histogram.quantile(q) if histogram else None
+
+    def counters(self, name: str) -> List[Tuple[Dict[str, str], float]]:
+        """Return the labels and value of every series of a counter."""
+        with self._lock:
+            family = self._families.get(name)
+            series = list(family.series.items()) if family else []
+        return [(dict(labels), value) for labels, value in series]
+
+    def add_run(self, run: Dict[str, Any]) -> None:
+        """Keep the breakdown of a finished run."""
+        with self._lock:
+            self._recent_runs.append(run)
+
+    def recent_runs(self) -> List[Dict[str, Any]]:
+        """Return the per-run breakdowns of the most recent runs, newest last."""
+        with self._lock:
+            return list(self._recent_runs)
+
+    def clear(self) -> None:
+        """Drop every series and run breakdown."""
+        with self._lock:
+            self._families.clear()
+            self._recent_runs.clear()
+
+    def render(self) -> str:
+        """Render the collected metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, family in sorted(self._families.items()):
+                lines.append(f"# HELP {name} {family.help}")
+                lines.append(f"# TYPE {name} {family.kind}")
+                for labels, value in sorted(family.series.items()):
+                    if family.kind == "counter":
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(
+                        (*family.buckets, float("inf")), value.counts
+                    ):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _number(bound)
+                        lines.append(
+                            f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}"
+                        )
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(value.sum)}")
+                    lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Process-wide instance
+metrics = MetricsRegistry()
+
+
+@dataclass
+class _RunInfo:
+    root: UUID
+    node_run: Optional[UUID]
+    name: str
+    started: float
+    queue_seconds: float = 0.0
+    # Root runs: per node breakdown; node runs: tokens by model
+    nodes: List[Dict[str, Any]] = field(default_factory=list)
+    tokens: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    model: Optional[str] = None
+    template: Optional[str] = None
+
+
+def _usage_tokens(usage: Optional[Dict[str, Any]]) -> Tuple[int, int]:
+    if not usage:
+        return 0, 0
+    prompt = usage.get("input_tokens", usage.get("prompt_tokens")) or 0
+    completion = usage.get("output_tokens", usage.get("completion_tokens")) or 0
+    return int(prompt), int(completion)
+
+
+def _cached_tokens(usage: Optional[Dict[str, Any]]) -> int:
+    """Prompt tokens the provider served from its prefix cache."""
+    if not usage:
+        return 0
+    details = usage.get("input_token_details") or {}
+    cached = details.get("cache_read", usage.get("prompt_cache_hit_tokens"))
+    return int(cached or 0)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Records run, node and LLM call metrics of one graph into a `MetricsRegistry`."""
+
+    # Handle events on the calling thread so timings are not skewed by a queue
+    run_inline = True
+
+    def __init__(self, graph: str, registry: MetricsRegistry = metrics):
+        """Record the runs of `graph` into `registry`."""
+        self.graph = graph
+        self.registry = registry
+        self._runs: Dict[UUID, _RunInfo] = {}
+        self._lock = threading.Lock()
+
+    # Chains: the graph run, its node runs and everything nested in them
+
+    def on_chain_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        """Track a chain run and the graph run and node it belongs to."""
+        now = time.perf_counter()
+        name = kwargs.get("name") or ""
+        with self._lock:
+            parent = self._runs.get(parent_run_id) if parent_run_id else None
+            if parent_run_id is None:
+                self._runs[run_id] = _RunInfo(run_id, None, name, now)
+            elif parent is not None:
+                is_node = parent.root == parent_run_id and name == (
+                    (metadata or {}).get("langgraph_node")
+                )
+                node_run = run_id if is_node else parent.node_run
+                self._runs[run_id] = _RunInfo(parent.root, node_run, name, now)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        """Record a finished chain run."""
+        self._end_run(run_id, "success")
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        """Record a failed or interrupted chain run."""
+        # Interrupts end the run without failing it
+        status = "interrupted" if type(error).__name__ == "GraphInterrupt" else "error"
+        self._end_run(run_id, status)
+
+    def _end_run(self, run_id: UUID, status: str) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            info = self._runs.pop(run_id, None)
+            root = self._runs.get(info.root) if info else None
+        if info is None:
+            return
+        duration = now - info.started
+        if info.root == run_id:
+            self._record_run(run_id, info, duration, status)
+        elif info.node_run == run_id:
+            self._record_node(info, root, duration, status)
+
+    def _record_node(
+        self, info: _RunInfo, root: Optional[_RunInfo], duration: float, status: str
+    ) -> None:
+        labels = {"graph": self.graph, "node": info.name}
+        self.registry.observe(
+            "agent_node_duration_seconds", "Wall time of a node run.", labels, duration
+        )
+        self.registry.observe(
+            "agent_node_queue_seconds",
+            "Time a node run spent waiting for the LLM rate limiter.",
+            labels,
+            info.queue_seconds,
+        )
+        self.registry.inc(
+            "agent_node_runs_total",
+            "Node runs by status.",
+            {**labels, "status": status},
+        )
+        if root is not None:
+            with self._lock:
+                root.nodes.append(
+                    {
+                        "node": info.name,
+                        "duration_seconds": round(duration, 4),
+                        "queue_seconds": round(info.queue_seconds, 4),
+                        "status": status,
+                        "tokens": info.tokens,
+                    }
+                )
+
+    def _record_run(
+        self, run_id: UUID, info: _RunInfo, duration: float, status: str
+    ) -> None:
+        labels = {"graph": self.graph}
+        self.registry.observe(
+            "agent_run_duration_seconds", "Wall time of a graph run.", labels, duration
+        )
+        self.registry.inc(
+            "agent_runs_total", "Graph runs by status.", {**labels, "status": status}
+        )
+        total_tokens = sum(
+            usage["prompt"] + usage["completion"]
+            for node in info.nodes
+            for usage in node["tokens"].values()
+        )
+        self.registry.observe(
+            "agent_run_tokens",
+            "Prompt plus completion tokens of a graph run.",
+            labels,
+            total_tokens,
+            buckets=TOKEN_BUCKETS,
+        )
+        self.registry.add_run(
+            {
+                "graph": self.graph,
+                "run_id": str(run_id),
+                "finished_at": time.time(),
+                "duration_seconds": round(duration, 4),
+                "status": status,
+                "total_tokens": total_tokens,
+                "nodes": info.nodes,
+            }
+        )
+
+    # Chat model calls
+
+    def on_chat_model_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        messages: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        """Start timing a chat model call."""
+        self._llm_start(run_id, parent_run_id, metadata, kwargs)
+
+    def on_llm_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        prompts: List[str],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        """Start timing a completion model call."""
+        self._llm_start(run_id, parent_run_id, metadata, kwargs)
+
+    def _llm_start(
+        self,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        metadata: Optional[Dict[str, Any]],
+        kwargs: Dict[str, Any],
+    ) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = (
+            (metadata or {}).get("ls_model_name")
+            or params.get("model")
+            or params.get("model_name")
+            or "unknown"
+        )
+        with self._lock:
+            parent = self._runs.get(parent_run_id) if parent_run_id else None
+            if parent is None or parent.node_run is None:
+                return
+            info = _RunInfo(parent.root, parent.node_run, "llm", time.perf_counter())
+            info.model = model
+            info.template = (metadata or {}).get(PROMPT_TEMPLATE_METADATA)
+            self._runs[run_id] = info
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        """Record the latency and token usage of a finished LLM call."""
+        self._llm_end(run_id, response, "success")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        """Record a failed LLM call."""
+        self._llm_end(run_id, None, "error")
+
+    def _llm_end(self, run_id: UUID, response: Any, status: str) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            info = self._runs.pop(run_id, None)
+        if info is None:
+            return
+        node = self._runs.get(info.node_run)
+        node_name = node.name if node else "unknown"
+        labels = {"graph": self.graph, "node": node_name, "model": info.model}
+        self.registry.observe(
+            "agent_llm_call_duration_seconds",
+            "Wall time of a chat model call.",
+            labels,
+            now - info.started,
+        )
+        self.registry.inc(
+            "agent_llm_calls_total",
+            "Chat model calls by status.",
+            {**labels, "status": status},
+        )
+        if response is None:
+            return
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if getattr(message, "usage_metadata", None):
+                    usage = message.usage_metadata
+        if usage is None:
+            usage = (response.llm_output or {}).get("token_usage")
+        prompt, completion = _usage_tokens(usage)
+        self._add_tokens(node, node_name, info.model, prompt, completion)
+        cached = min(_cached_tokens(usage), prompt)
+        if cached:
+            self.registry.inc(
+                "agent_llm_cached_tokens_total",
+                "Prompt tokens served from the provider's prefix cache.",
+                labels,
+                cached,
+            )
+        if info.template:
+            self._add_template_tokens(info.template, prompt, cached)
+
+    def _add_template_tokens(self, template: str, prompt: int, cached: int) -> None:
+        labels = {"graph": self.graph, "template": template}
+        self.registry.inc(
+            "agent_prompt_template_calls_total",
+            "Chat model calls by prompt template.",
+            labels,
+        )
+        for cache, count in (("hit", cached), ("miss", prompt - cached)):
+            if count:
+                self.registry.inc(
+                    "agent_prompt_template_tokens_total",
+                    "Prompt tokens by template and provider prefix cache result.",
+                    {**labels, "cache": cache},
+                    count,
+                )
+
+    def _add_tokens(
+        self,
+        node: Optional[_RunInfo],
+        node_name: str,
+        model: str,
+        prompt: int,
+        completion: int,
+    ) -> None:
+        labels = {"graph": self.graph, "node": node_name, "model": model}
+        for kind, count in (("prompt", prompt), ("completion", completion)):
+            if count:
+                self.registry.inc(
+                    "agent_llm_tokens_total",
+                    "Tokens used by LLM calls.",
+                    {**labels, "type": kind},
+                    count,
+                )
+        if node is not None:
+            with self._lock:
+                usage = node.tokens.setdefault(model, {"prompt": 0, "completion": 0})
+                usage["prompt"] += prompt
+                usage["completion"] += completion
+
+    # Calls reported by the nodes
+
+    def on_custom_event(
+        self, name: str, data: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        """Attribute the queue time and token usage reported by `report_llm_call`."""
+        if name != LLM_USAGE_EVENT:
+            return
+        with self._lock:
+            info = self._runs.get(run_id)
+            node = self._runs.get(info.node_run) if info and info.node_run else None
+            if node is not None:
+                node.queue_seconds += data.get("queue_seconds") or 0.0
+        node_name = node.name if node else "unknown"
+        if data.get("usage"):
+            self._add_tokens(node, node_name, data["model"], *_usage_tokens(data["usage"]))
+
+
+def instrument_graph(graph: Any, name: str) -> Any:
+    """Return a copy of a compiled graph that records its runs under `name`."""
+    return graph.with_config(callbacks=[MetricsCallbackHandler(name)])
+
+
+def report_llm_call(
+    config: Optional[RunnableConfig],
+    model: str,
+    queue_seconds: float = 0.0,
+    usage: Optional[Dict[str, int]] = None,
+) -> None:
+    """Attribute the queue time and token usage of an LLM call to its node.
+
+    The call is attributed to the node that runs under `config`. Token usage only
+    needs to be passed for calls made outside LangChain.
+
+    Args:
+        config: The node's config.
+        model: The model called.
+        queue_seconds: Time the call waited for the rate limiter.
+        usage: `input_tokens`/`output_tokens` of a call that LangChain callbacks do
+            not see. Leave it out for chat model calls; their usage is read from
+            the response.
+    """
+    try:
+        dispatch_custom_event(
+            LLM_USAGE_EVENT,
+            {"model": model, "queue_seconds": queue_seconds, "usage": usage},
+            config=config,
+        )
+    except RuntimeError:
+        # Not running inside a graph run
+        pass
+
+
+def render_prometheus(registry: MetricsRegistry = metrics) -> str:
+    """All metrics in the Prometheus text format, including limiter and hedge state."""
+    from agent.hedging import hedge_counts
+    from agent.rate_limit import rate_limiter
+
+    text = registry.render()
+    lines = []
+    limiter_metrics = (
+        ("queue_depth", "agent_rate_limit_queue_depth", "gauge",
+         "Calls waiting for the LLM rate limiter."),
+        ("in_flight", "agent_rate_limit_in_flight", "gauge",
+         "LLM calls holding a rate limiter slot."),
+        ("acquired", "agent_rate_limit_acquired_total", "counter",
+         "LLM calls admitted by the rate limiter."),
+        ("wait_seconds", "agent_rate_limit_wait_seconds_total", "counter",
+         "Total time calls waited for the rate limiter."),
+    )
+    stats = rate_limiter.stats()
+    for key, name, kind, help in limiter_metrics:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for model, values in stats.items():
+            lines.append(f"{name}{_labels((('model', model),))} {_number(values[key])}")
+    lines.append("# HELP agent_web_research_hedges_total Hedged grounded search events.")
+    lines.append("# TYPE agent_web_research_hedges_total counter")
+    for event, count in sorted(hedge_counts.items()):
+        lines.append(
+            f"agent_web_research_hedges_total{_labels((('event', event),))} {count}"
+        )
+    return text + "\n".join(lines) + "\n"
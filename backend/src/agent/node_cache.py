@@ -0,0 +1,359 @@
+"""Result cache for deterministic graph nodes.
+
+Some nodes call their model at temperature 0, so they are pure functions of
+part of the state: `finalize_answer`, contentAgent `review_article`,
+comicsAgent `generate_storyboard` and excelAgent `ai_analyze`. `cached_node`
+wraps such a node with a `NodeCachePolicy`, which names the state keys the
+node reads and the keys of its update. The cache key hashes those inputs,
+the policy's model settings, and the source of the node and of the helpers
+and prompt modules it lists in `depends_on`. On a hit the stored update is
+returned, with new ids for its messages, and the node does not run. Re-runs,
+and retries after a downstream failure, then skip the model call.
+
+A result is only stored when the node set every output key to a new value
+in this call. The content nodes catch their own errors and return the state
+unchanged, so a failure hands back the outputs of an earlier step or turn;
+those are not new objects and are not cached.
+
+`NODE_CACHE` selects the backend: 'memory' (the default, an in-process LRU),
+'sqlite' (a file at `NODE_CACHE_PATH` shared by worker processes) or 'off'.
+`NODE_CACHE_TTL_SECONDS` and `NODE_CACHE_MAX_ENTRIES` bound it, and changing
+`NODE_CACHE_VERSION` drops every entry, e.g. on a deploy. Lookups are counted
+in `agent_node_cache_total{graph,node,result}`.
+
+`web_research` is not wrapped. The search cache (see `agent.search_cache`)
+already covers it and moves cached short urls to the requesting branch.
+"""
+
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from pydantic import BaseModel
+
+from agent.metrics import metrics
+from agent.search_cache import MEMORY, OFF, SQLITE
+
+_serde = JsonPlusSerializer()
+
+
+@dataclass(frozen=True)
+class NodeCachePolicy:
+    """What a cached node depends on and what it produces.
+
+    Args:
+        inputs: State keys the node reads.
+        outputs: State keys of the node's update. Only these are stored, and
+            only when the node set all of them to new values.
+        params: Returns the model settings and prompt templates the result
+            depends on, from the state and the run's config.
+        depends_on: Functions, classes and modules the node calls. Editing
+            their source drops the node's entries, like editing the node.
+    """
+
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    params: Optional[Callable[[Dict[str, Any], RunnableConfig], Any]] = None
+    depends_on: Tuple[Any, ...] = ()
+
+
+def _fingerprint(value: Any) -> Any:
+    """JSON-able form of a state value; message ids are left out."""
+    if isinstance(value, BaseMessage):
+        return [value.type, _fingerprint(value.content)]
+    if isinstance(value, BaseModel):
+        return _fingerprint(value.model_dump())
+    if isinstance(value, dict):
+        return {str(k): _fingerprint(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_fingerprint(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def _code_fingerprint(*objects: Any) -> str:
+    """Hash of the source of a node and its helpers.
+
+    Editing any of them, or an inline prompt, drops the node's entries.
+    """
+    digest = hashlib.sha256()
+    for obj in objects:
+        try:
+            source = inspect.getsource(obj)
+        except (OSError, TypeError):
+            source = getattr(obj, "__qualname__", repr(obj))
+        digest.update(source.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _with_new_ids(value: Any) -> Any:
+    """Copy of a cached value whose messages get new ids.
+
+    `add_messages` merges messages by id, so a replayed answer must not reuse
+    the id of the answer it was cached from.
+    """
+    if isinstance(value, BaseMessage):
+        return value.model_copy(update={"id": str(uuid.uuid4())})
+    if isinstance(value, list):
+        return [_with_new_ids(item) for item in value]
+    return value
+
+
+def node_cache_key(
+    namespace: str,
+    policy: NodeCachePolicy,
+    state: Dict[str, Any],
+    config: Optional[RunnableConfig],
+) -> str:
+    """Return the cache key of a node run on `state`."""
+    payload = {
+        "node": namespace,
+        "inputs": {key: _fingerprint(state.get(key)) for key in policy.inputs},
+        "params": None,
+    }
+    if policy.params is not None:
+        payload["params"] = _fingerprint(policy.params(state, config))
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class NodeCache:
+    """Interface of the node result cache backends.
+
+    Values are serialized on the way in and out, so a cached update can be
+    handed to several runs without sharing mutable objects.
+    """
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached update for `key`, or None on a miss or expired entry."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store `value` under `key`, evicting the least recently used entries."""
+        raise NotImplementedError
+
+
+class MemoryNodeCache(NodeCache):
+    """In-process LRU cache with a per-entry time to live."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        """Create an empty cache of at most `max_entries` entries."""
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Tuple[float, Tuple[str, bytes]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the update for `key` and mark it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return _serde.loads_typed(value)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store `value` and evict the least recently used entries over the limit."""
+        entry = (time.time(), _serde.dumps_typed(value))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteNodeCache(NodeCache):
+    """SQLite-backed cache that can be shared by several worker processes."""
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        """Open or create the cache database at `path`."""
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS node_cache ("
+                "key TEXT PRIMARY KEY, type TEXT NOT NULL, value BLOB NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS node_cache_accessed_at "
+                "ON node_cache (accessed_at)"
+            )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the update for `key`, dropping it if it has expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT type, value, created_at FROM node_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[2] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM node_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE node_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return _serde.loads_typed((row[0], row[1]))
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store `value`, then drop expired entries and those over the limit."""
+        now = time.time()
+        type_, blob = _serde.dumps_typed(value)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO node_cache VALUES (?, ?, ?, ?, ?)",
+                (key, type_, blob, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM node_cache WHERE created_at < ?",
+                (now - self.ttl_seconds,),
+            )
+            self._conn.execute(
+                "DELETE FROM node_cache WHERE key IN ("
+                "SELECT key FROM node_cache ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+@cache
+def get_node_cache(
+    backend: str, path: str, ttl_seconds: float, max_entries: int
+) -> Optional[NodeCache]:
+    """Return the process-wide cache for the given settings, or None when disabled."""
+    if backend == MEMORY:
+        return MemoryNodeCache(ttl_seconds, max_entries)
+    if backend == SQLITE:
+        return SQLiteNodeCache(path, ttl_seconds, max_entries)
+    if backend == OFF:
+        return None
+    raise ValueError(f"Unknown node cache backend: {backend}")
+
+
+def node_cache_from_env() -> Optional[NodeCache]:
+    """Return the cache selected by the `NODE_CACHE*` environment variables."""
+    return get_node_cache(
+        os.getenv("NODE_CACHE") or MEMORY,
+        os.getenv("NODE_CACHE_PATH") or "outputs/node_cache.sqlite3",
+        float(os.getenv("NODE_CACHE_TTL_SECONDS") or 6 * 60 * 60),
+        int(os.getenv("NODE_CACHE_MAX_ENTRIES") or 1024),
+    )
+
+
+def cached_node(
+    name: str,
+    func: Callable,
+    policy: NodeCachePolicy,
+    afunc: Optional[Callable] = None,
+) -> RunnableLambda:
+    """Wrap a node (and its async variant) with a result cache.
+
+    Args:
+        name: Node name, used in the cache key and the metrics.
+        func: The node; it may or may not take a `config` argument.
+        policy: The node's inputs, outputs and model settings.
+        afunc: Optional async implementation of the same node.
+    """
+    code = _code_fingerprint(func, *([afunc] if afunc else []), *policy.depends_on)
+    version = os.getenv("NODE_CACHE_VERSION") or ""
+    namespace = f"{func.__module__}.{name}:{code}:{version}"
+    labels = {"graph": func.__module__.split(".")[0], "node": name}
+    takes_config = "config" in inspect.signature(func).parameters
+
+    def count(result: str) -> None:
+        metrics.inc(
+            "agent_node_cache_total",
+            "Lookups of the node result cache by result.",
+            {**labels, "result": result},
+        )
+
+    def lookup(
+        cache: Optional[NodeCache], state: Dict[str, Any], config: RunnableConfig
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        if cache is None:
+            return "", None
+        key = node_cache_key(namespace, policy, state, config)
+        update = cache.get(key)
+        count("miss" if update is None else "hit")
+        if update is not None:
+            update = {output: _with_new_ids(value) for output, value in update.items()}
+        return key, update
+
+    def inputs_of(state: Dict[str, Any]) -> Dict[str, Any]:
+        return {output: state.get(output) for output in policy.outputs}
+
+    def store(
+        cache: Optional[NodeCache], key: str, update: Any, before: Dict[str, Any]
+    ) -> None:
+        if cache is None or not isinstance(update, dict):
+            return
+        # An output still holding the object the node got was not produced by it
+        if all(
+            update.get(output) is not None and update[output] is not before[output]
+            for output in policy.outputs
+        ):
+            cache.set(key, {output: update[output] for output in policy.outputs})
+        else:
+            count("uncacheable")
+
+    def node(state: Dict[str, Any], config: RunnableConfig) -> Any:
+        cache = node_cache_from_env()
+        key, update = lookup(cache, state, config)
+        if update is not None:
+            return update
+        before = inputs_of(state)
+        update = func(state, config) if takes_config else func(state)
+        store(cache, key, update, before)
+        return update
+
+    async def anode(state: Dict[str, Any], config: RunnableConfig) -> Any:
+        cache = node_cache_from_env()
+        # SQLite blocks on disk and on other processes; keep it off the event loop
+        blocking = isinstance(cache, SQLiteNodeCache)
+        if blocking:
+            key, update = await asyncio.to_thread(lookup, cache, state, config)
+        else:
+            key, update = lookup(cache, state, config)
+        if update is not None:
+            return update
+        before = inputs_of(state)
+        update = await (afunc(state, config) if takes_config else afunc(state))
+        if blocking:
+            await asyncio.to_thread(store, cache, key, update, before)
+        else:
+            store(cache, key, update, before)
+        return update
+
+    return RunnableLambda(node, afunc=anode if afunc else None, name=name)
+
+
+def clear_node_cache() -> None:
+    """Drop the process-wide caches, e.g. after changing `NODE_CACHE*`."""
+    get_node_cache.cache_clear()
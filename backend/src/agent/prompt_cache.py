@@ -0,0 +1,115 @@
+"""Prompt templates split into a static prefix and a variable suffix.
+
+The content pipelines resend long fixed instructions on every call. DeepSeek and
+Gemini both cache a request prefix they have seen recently, automatically: a
+later request that starts with the same bytes is billed and processed as cached
+input (DeepSeek reports it as `prompt_cache_hit_tokens`, Gemini as
+`cached_content_token_count`, and LangChain as
+`usage_metadata["input_token_details"]["cache_read"]`). This only helps when
+everything variable comes after the instructions.
+
+A `CachedPrompt` splits its template at the first placeholder. The prefix is
+kept as one immutable string with a token estimate, so it goes out
+byte-identical on every call, and only the suffix is formatted.
+`prompt_cache_report` flags prefixes too short for the provider to cache.
+
+Calls made with `llm.invoke(prompt.format(...), config=prompt.config)` are
+tagged with the template name. `MetricsCallbackHandler` then counts their
+cached and uncached prompt tokens per template, and `prompt_cache_report`
+returns the provider-side hit rates.
+"""
+
+import string
+from typing import Any, Dict, Tuple
+
+from agent.metrics import PROMPT_TEMPLATE_METADATA, MetricsRegistry, metrics
+from agent.utils import estimate_tokens
+
+# DeepSeek caches prefixes in 64-token units; a shorter prefix is never a hit
+MIN_CACHEABLE_PREFIX_TOKENS = 64
+
+_templates: Dict[str, "CachedPrompt"] = {}
+
+
+def split_template(template: str) -> Tuple[str, str]:
+    """Split a `str.format` template before its first placeholder.
+
+    Returns:
+        The literal prefix, with `{{`/`}}` escapes resolved, and the remaining
+        template, still to be formatted.
+    """
+    literal = []
+    for text, field, _, _ in string.Formatter().parse(template):
+        literal.append(text)
+        if field is not None:
+            prefix = "".join(literal)
+            return prefix, template[_raw_length(template, len(prefix)) :]
+    return "".join(literal), ""
+
+
+def _raw_length(template: str, literal_length: int) -> int:
+    """Length of the start of `template` that holds `literal_length` literal chars."""
+    idx = 0
+    for _ in range(literal_length):
+        idx += 2 if template[idx : idx + 2] in ("{{", "}}") else 1
+    return idx
+
+
+class CachedPrompt:
+    """A prompt template whose static prefix is shared by every call.
+
+    Args:
+        name: Template name used in metrics; must be unique.
+        template: A `str.format` template; put the placeholders at the end.
+    """
+
+    def __init__(self, name: str, template: str):
+        """Split `template` and register it under `name`."""
+        self.name = name
+        self.template = template
+        self.prefix, self.suffix = split_template(template)
+        self.prefix_tokens = estimate_tokens(self.prefix)
+        self.config = {"metadata": {PROMPT_TEMPLATE_METADATA: name}}
+        _templates[name] = self
+
+    def __repr__(self) -> str:
+        """Show the name and prefix size."""
+        return f"CachedPrompt({self.name!r}, prefix_tokens={self.prefix_tokens})"
+
+    def format(self, **values: Any) -> str:
+        """Return the prompt: the shared prefix followed by the formatted suffix."""
+        return self.prefix + self.suffix.format(**values)
+
+
+def prompt_cache_report(registry: MetricsRegistry = metrics) -> Dict[str, Dict]:
+    """Return the provider-side cache hit rates of every `CachedPrompt`.
+
+    The provider hit rate is the share of prompt tokens the provider reported as
+    read from its cache; calls made without `prompt.config` are not counted.
+    """
+    report = {
+        name: {
+            "prefix_tokens": prompt.prefix_tokens,
+            "cacheable": prompt.prefix_tokens >= MIN_CACHEABLE_PREFIX_TOKENS,
+            "calls": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+        }
+        for name, prompt in _templates.items()
+    }
+    for labels, value in registry.counters("agent_prompt_template_calls_total"):
+        if labels["template"] in report:
+            report[labels["template"]]["calls"] += int(value)
+    for labels, value in registry.counters("agent_prompt_template_tokens_total"):
+        row = report.get(labels["template"])
+        if row is not None:
+            row["prompt_tokens"] += int(value)
+            if labels["cache"] == "hit":
+                row["cached_tokens"] += int(value)
+    for row in report.values():
+        row["provider_hit_rate"] = (
+            round(row["cached_tokens"] / row["prompt_tokens"], 4)
+            if row["prompt_tokens"]
+            else None
+        )
+    return report
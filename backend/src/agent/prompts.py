@@ -79,6 +79,45 @@ Summaries:
 {summaries}
 """
 
+incremental_reflection_instructions = """You are an expert research assistant analyzing summaries about "{research_topic}".
+
+Instructions:
+- You are given a condensed summary of the knowledge gathered so far, followed by the summaries added since it was written.
+- Update the knowledge summary so it covers the new summaries as well. Keep it dense and factual, drop repetition, and keep it under {summary_words} words.
+- Identify knowledge gaps or areas that need deeper exploration and generate a follow-up query. (1 or multiple).
+- If the knowledge gathered is sufficient to answer the user's question, don't generate a follow-up query.
+- If there is a knowledge gap, generate a follow-up query that would help expand your understanding.
+- Focus on technical details, implementation specifics, or emerging trends that weren't fully covered.
+- The current date is {current_date}.
+
+Requirements:
+- Ensure the follow-up query is self-contained and includes necessary context for web search.
+
+Output Format:
+- Format your response as a JSON object with these exact keys:
+   - "knowledge_summary": The updated condensed summary of everything gathered so far
+   - "is_sufficient": true or false
+   - "knowledge_gap": Describe what information is missing or needs clarification
+   - "follow_up_queries": Write a specific question to address this gap
+
+Knowledge Summary:
+{knowledge_summary}
+
+New Summaries:
+{summaries}
+"""
+
+condense_instructions = """Condense the provided summaries into dense research notes about "{research_topic}".
+
+Instructions:
+- The current date is {current_date}.
+- Keep every fact, figure, date and name that could help answer the user's question; drop repetition and filler.
+- Keep each markdown citation link exactly as written (e.g. [apnews](https://vertexaisearch.cloud.google.com/id/1-0)) next to the fact it supports. Never change or invent a link. THIS IS A MUST.
+- Only output the notes.
+
+Summaries:
+{summaries}"""
+
 answer_instructions = """Generate a high-quality answer to the user's question based on the provided summaries.
 
 Instructions:
@@ -0,0 +1,473 @@
+"""Process-wide concurrency and rate limiting for LLM provider calls.
+
+A single research run fans out `number_of_initial_queries` parallel Gemini calls,
+so many concurrent runs burst past the provider's request and token quotas and
+then burn time in client-side retries. Calls go through a `RateLimiter` instead,
+which caps in-flight requests and requests/tokens per minute per model. Callers
+wait in a FIFO queue per model, so runs are served in arrival order.
+
+Quota state lives in memory by default. Setting `LLM_RATE_LIMIT_DB` to a file
+path stores it in SQLite so that several worker processes share the limits.
+
+Waiters sleep until a lease is released or the queue moves, or until the token
+buckets have refilled, and coroutines are woken on their own event loop. Only
+the head of a model's queue calls the quota, outside the queue lock; the async
+path runs SQLite quota calls in a worker thread so they never block the loop.
+"""
+
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+# Releases in other processes cannot wake a waiter, so waiters on a full SQLite
+# quota re-check it this often.
+_POLL_SECONDS = 0.05
+# In-flight leases expire after this long, so a crashed process cannot hold slots forever.
+_LEASE_SECONDS = 600.0
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Limits applied to one model. `None` disables the corresponding limit."""
+
+    max_concurrency: Optional[int] = 16
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+
+
+@dataclass
+class RateLimitSettings:
+    """Default limits plus per-model overrides."""
+
+    default: RateLimit = field(default_factory=RateLimit)
+    models: Dict[str, RateLimit] = field(default_factory=dict)
+    db_path: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> "RateLimitSettings":
+        """Read the settings from environment variables.
+
+        `LLM_MAX_CONCURRENCY`, `LLM_REQUESTS_PER_MINUTE` and `LLM_TOKENS_PER_MINUTE`
+        set the defaults. `LLM_RATE_LIMITS` holds per-model overrides as JSON, e.g.
+        `{"gemini-2.5-pro": {"max_concurrency": 8, "tokens_per_minute": 2000000}}`.
+        """
+
+        def _number(name: str, cast: Any, fallback: Any) -> Any:
+            value = os.getenv(name)
+            return cast(value) if value else fallback
+
+        base = RateLimit()
+        default = RateLimit(
+            max_concurrency=_number("LLM_MAX_CONCURRENCY", int, base.max_concurrency),
+            requests_per_minute=_number("LLM_REQUESTS_PER_MINUTE", float, None),
+            tokens_per_minute=_number("LLM_TOKENS_PER_MINUTE", float, None),
+        )
+        overrides = json.loads(os.getenv("LLM_RATE_LIMITS") or "{}")
+        models = {
+            model: RateLimit(**{**default.__dict__, **values})
+            for model, values in overrides.items()
+        }
+        return cls(default=default, models=models, db_path=os.getenv("LLM_RATE_LIMIT_DB"))
+
+    def for_model(self, model: str) -> RateLimit:
+        """Return the limits that apply to `model`."""
+        return self.models.get(model, self.default)
+
+
+class _MemoryQuota:
+    """Token buckets and in-flight leases kept in this process."""
+
+    def __init__(self) -> None:
+        # model -> [requests bucket, tokens bucket, last refill time]
+        self._buckets: Dict[str, list] = {}
+        self._leases: Dict[str, Dict[str, float]] = {}
+
+    def try_take(self, model: str, limit: RateLimit, tokens: int) -> Tuple[float, Optional[str]]:
+        now = time.monotonic()
+        leases = self._leases.setdefault(model, {})
+        if limit.max_concurrency is not None and len(leases) >= limit.max_concurrency:
+            # Wait for a release, which wakes the waiters
+            return math.inf, None
+        bucket = self._buckets.setdefault(
+            model,
+            [limit.requests_per_minute or 0.0, limit.tokens_per_minute or 0.0, now],
+        )
+        bucket[0], bucket[1] = _refill(limit, bucket[0], bucket[1], now - bucket[2])
+        bucket[2] = now
+        wait = _bucket_wait(limit, bucket[0], bucket[1], tokens)
+        if wait > 0:
+            return wait, None
+        bucket[0] -= 1
+        bucket[1] -= tokens
+        lease_id = uuid.uuid4().hex
+        leases[lease_id] = now
+        return 0.0, lease_id
+
+    def give_back(self, model: str, lease_id: str, token_delta: int) -> None:
+        self._leases.get(model, {}).pop(lease_id, None)
+        if token_delta and model in self._buckets:
+            self._buckets[model][1] -= token_delta
+
+
+class _SQLiteQuota:
+    """Token buckets and in-flight leases shared between processes through SQLite."""
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "model TEXT PRIMARY KEY, requests REAL, tokens REAL, updated_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_leases ("
+            "id TEXT PRIMARY KEY, model TEXT, expires_at REAL)"
+        )
+
+    def try_take(self, model: str, limit: RateLimit, tokens: int) -> Tuple[float, Optional[str]]:
+        now = time.time()
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM rate_limit_leases WHERE expires_at < ?", (now,))
+            if limit.max_concurrency is not None:
+                (in_flight,) = conn.execute(
+                    "SELECT COUNT(*) FROM rate_limit_leases WHERE model = ?", (model,)
+                ).fetchone()
+                if in_flight >= limit.max_concurrency:
+                    conn.execute("COMMIT")
+                    return _POLL_SECONDS, None
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at FROM rate_limit_buckets WHERE model = ?",
+                (model,),
+            ).fetchone()
+            if row is None:
+                row = (limit.requests_per_minute or 0.0, limit.tokens_per_minute or 0.0, now)
+            requests, bucket_tokens = _refill(limit, row[0], row[1], now - row[2])
+            wait = _bucket_wait(limit, requests, bucket_tokens, tokens)
+            lease_id = None
+            if wait <= 0:
+                requests -= 1
+                bucket_tokens -= tokens
+                lease_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO rate_limit_leases VALUES (?, ?, ?)",
+                    (lease_id, model, now + _LEASE_SECONDS),
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets VALUES (?, ?, ?, ?)",
+                (model, requests, bucket_tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return max(wait, 0.0), lease_id
+
+    def give_back(self, model: str, lease_id: str, token_delta: int) -> None:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM rate_limit_leases WHERE id = ?", (lease_id,))
+            if token_delta:
+                conn.execute(
+                    "UPDATE rate_limit_buckets SET tokens = tokens - ? WHERE model = ?",
+                    (token_delta, model),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _refill(limit: RateLimit, requests: float, tokens: float, elapsed: float) -> Tuple[float, float]:
+    if limit.requests_per_minute:
+        requests = min(
+            limit.requests_per_minute, requests + elapsed * limit.requests_per_minute / 60
+        )
+    if limit.tokens_per_minute:
+        tokens = min(limit.tokens_per_minute, tokens + elapsed * limit.tokens_per_minute / 60)
+    return requests, tokens
+
+
+def _bucket_wait(limit: RateLimit, requests: float, tokens: float, needed: int) -> float:
+    """Seconds until both buckets can serve a request of `needed` tokens."""
+    wait = 0.0
+    if limit.requests_per_minute and requests < 1:
+        wait = (1 - requests) * 60 / limit.requests_per_minute
+    if limit.tokens_per_minute:
+        # A request larger than the whole bucket only waits for a full bucket
+        needed = min(needed, limit.tokens_per_minute)
+        if tokens < needed:
+            wait = max(wait, (needed - tokens) * 60 / limit.tokens_per_minute)
+    return wait
+
+
+class Lease:
+    """A granted request slot. Call `record_usage` once the real token count is known."""
+
+    def __init__(self, model: str, lease_id: str, estimated_tokens: int, waited: float):
+        """Record a slot granted for `model` after waiting `waited` seconds."""
+        self.model = model
+        self.lease_id = lease_id
+        self.estimated_tokens = estimated_tokens
+        self.waited = waited
+        self.token_delta = 0
+
+    def record_usage(self, total_tokens: Optional[int]) -> None:
+        """Correct the token bucket by the difference between actual and estimated tokens."""
+        if total_tokens is not None:
+            self.token_delta = total_tokens - self.estimated_tokens
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """Fair, per-model limiter for provider calls, usable from threads and coroutines."""
+
+    def __init__(self, settings: Optional[RateLimitSettings] = None):
+        """Create a limiter; `settings` defaults to `RateLimitSettings.from_env()`."""
+        self.settings = settings or RateLimitSettings.from_env()
+        self._quota = (
+            _SQLiteQuota(self.settings.db_path)
+            if self.settings.db_path
+            else _MemoryQuota()
+        )
+        # SQLite quota calls may wait on disk and on other processes
+        self._blocking_quota = isinstance(self._quota, _SQLiteQuota)
+        # Guards the queues, stats and waiters; never held during quota calls
+        self._cond = threading.Condition()
+        self._quota_lock = threading.Lock()
+        self._queues: Dict[str, Deque[object]] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        # Bumped on every release and queue change; waiters re-check when it moves
+        self._generation = 0
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _model_stats(self, model: str) -> Dict[str, float]:
+        return self._stats.setdefault(
+            model, {"in_flight": 0, "acquired": 0, "wait_seconds": 0.0}
+        )
+
+    def _notify(self) -> None:
+        # Caller holds self._cond
+        self._generation += 1
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # The waiter's loop is closed
+                pass
+
+    def _enqueue(self, model: str) -> object:
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(model, deque()).append(ticket)
+        return ticket
+
+    def _try_acquire(
+        self, model: str, ticket: object, tokens: int
+    ) -> Tuple[float, Optional[str], int]:
+        """Take a slot for `ticket` if it heads the queue of `model`.
+
+        Returns the seconds to wait before trying again (infinite until the next
+        release or queue change), the lease id on success, and the generation
+        seen before the check, so that a wake-up in between is not missed.
+        """
+        with self._cond:
+            generation = self._generation
+            queue = self._queues[model]
+            if queue[0] is not ticket:
+                return math.inf, None, generation
+        # The head stays the head until it leaves, so the quota call needs no queue lock
+        with self._quota_lock:
+            wait, lease_id = self._quota.try_take(
+                model, self.settings.for_model(model), tokens
+            )
+        if lease_id is not None:
+            with self._cond:
+                # A cancelled async waiter may have left the queue already
+                if queue and queue[0] is ticket:
+                    queue.popleft()
+                self._notify()
+        return wait, lease_id, generation
+
+    def _dequeue(self, model: str, ticket: object) -> None:
+        with self._cond:
+            queue = self._queues.get(model)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                self._notify()
+
+    def _granted(self, model: str, lease_id: str, tokens: int, started: float) -> Lease:
+        waited = time.monotonic() - started
+        with self._cond:
+            stats = self._model_stats(model)
+            stats["in_flight"] += 1
+            stats["acquired"] += 1
+            stats["wait_seconds"] += waited
+        return Lease(model, lease_id, tokens, waited)
+
+    def _release(self, lease: Lease) -> None:
+        with self._quota_lock:
+            self._quota.give_back(lease.model, lease.lease_id, lease.token_delta)
+        with self._cond:
+            self._model_stats(lease.model)["in_flight"] -= 1
+            self._notify()
+
+    async def _arelease(self, lease: Lease) -> None:
+        if self._blocking_quota:
+            # Shielded, so a cancelled caller still gives the slot back
+            await asyncio.shield(asyncio.to_thread(self._release, lease))
+        else:
+            self._release(lease)
+
+    def acquire(self, model: str, tokens: int = 0) -> Lease:
+        """Block until a request of `tokens` estimated tokens may be sent to `model`."""
+        started = time.monotonic()
+        ticket = self._enqueue(model)
+        try:
+            while True:
+                wait, lease_id, generation = self._try_acquire(model, ticket, tokens)
+                if lease_id is not None:
+                    return self._granted(model, lease_id, tokens, started)
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._generation != generation,
+                        None if math.isinf(wait) else wait,
+                    )
+        except BaseException:
+            self._dequeue(model, ticket)
+            raise
+
+    async def _atry_acquire(
+        self, model: str, ticket: object, tokens: int, started: float
+    ) -> Tuple[float, Optional[str], int]:
+        if not self._blocking_quota:
+            return self._try_acquire(model, ticket, tokens)
+        task = asyncio.ensure_future(
+            asyncio.to_thread(self._try_acquire, model, ticket, tokens)
+        )
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # The quota call finishes in its thread; give back a slot it took
+            task.add_done_callback(
+                lambda done: self._discard(done, model, tokens, started)
+            )
+            raise
+
+    def _discard(
+        self, task: asyncio.Future, model: str, tokens: int, started: float
+    ) -> None:
+        if task.cancelled() or task.exception() is not None:
+            return
+        lease_id = task.result()[1]
+        if lease_id is not None:
+            lease = self._granted(model, lease_id, tokens, started)
+            threading.Thread(target=self._release, args=(lease,), daemon=True).start()
+
+    async def _await_change(self, generation: int, wait: float) -> None:
+        """Sleep until the queue or the leases change, or for `wait` seconds."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._cond:
+            if self._generation != generation:
+                return
+            self._async_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, None if math.isinf(wait) else wait)
+        except TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+
+    async def aacquire(self, model: str, tokens: int = 0) -> Lease:
+        """Async variant of `acquire` that waits on the event loop.
+
+        Waiters are woken by releases instead of polling, and SQLite quota calls
+        run in a worker thread.
+        """
+        started = time.monotonic()
+        ticket = self._enqueue(model)
+        try:
+            while True:
+                wait, lease_id, generation = await self._atry_acquire(
+                    model, ticket, tokens, started
+                )
+                if lease_id is not None:
+                    return self._granted(model, lease_id, tokens, started)
+                await self._await_change(generation, wait)
+        except BaseException:
+            self._dequeue(model, ticket)
+            raise
+
+    @contextmanager
+    def limit(self, model: str, tokens: int = 0) -> Iterator[Lease]:
+        """Hold a request slot for `model` for the duration of the block."""
+        lease = self.acquire(model, tokens)
+        try:
+            yield lease
+        finally:
+            self._release(lease)
+
+    @asynccontextmanager
+    async def alimit(self, model: str, tokens: int = 0) -> AsyncIterator[Lease]:
+        """Async variant of `limit`."""
+        lease = await self.aacquire(model, tokens)
+        try:
+            yield lease
+        finally:
+            await self._arelease(lease)
+
+    def headroom(self, model: str) -> Optional[int]:
+        """Free request slots for `model` in this process, None without a concurrency cap.
+
+        Waiting callers count against the free slots, so a queued model has none.
+        """
+        max_concurrency = self.settings.for_model(model).max_concurrency
+        if max_concurrency is None:
+            return None
+        with self._cond:
+            busy = self._model_stats(model)["in_flight"] + len(
+                self._queues.get(model, ())
+            )
+        return max(0, int(max_concurrency - busy))
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Return queue depth, in-flight requests and wait totals per model."""
+        with self._cond:
+            models = set(self._queues) | set(self._stats)
+            return {
+                model: {
+                    "queue_depth": len(self._queues.get(model, ())),
+                    **self._model_stats(model),
+                }
+                for model in sorted(models)
+            }
+
+
+# Process-wide instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,487 @@
+"""Record/replay harness for provider calls.
+
+With `LLM_HARNESS_MODE=record`, every chat model call handed out by the client
+registry, every google-genai `generate_content` call (grounded search, including
+its grounding metadata) and every Yunwu image request from
+`comicsAgent/gemini.py` goes to the live provider, and the request and response
+are written to fixture files under `LLM_FIXTURES_DIR`.
+
+With `LLM_HARNESS_MODE=replay`, the same calls are answered from those fixtures
+without any network access, after a synthetic latency of `LLM_REPLAY_LATENCY`
+seconds (either a fixed value such as `0.8`, or a range such as `0.5:2`, from
+which a deterministic latency is drawn per call). Provider keys are not needed
+in replay mode, so `require_env` skips its checks.
+
+Fixtures are keyed by a hash of the request, in which dates are normalized so a
+recording keeps matching on later days. Identical requests recorded several
+times are replayed in the order they were recorded.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+)
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+
+T = TypeVar("T")
+
+OFF = ""
+RECORD = "record"
+REPLAY = "replay"
+
+_MONTH_DATE = re.compile(
+    r"\b(?:January|February|March|April|May|June|July|August|September|October"
+    r"|November|December) \d{1,2}, \d{4}\b"
+)
+_ISO_DATE = re.compile(
+    r"\b\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?\b"
+)
+# Text chunk size of replayed streams
+_STREAM_CHUNK_CHARS = 24
+
+
+def harness_mode() -> str:
+    """Return the current harness mode: `OFF`, `RECORD` or `REPLAY`."""
+    mode = os.getenv("LLM_HARNESS_MODE", OFF).strip().lower()
+    if mode not in (OFF, RECORD, REPLAY):
+        raise ValueError(f"Unknown LLM_HARNESS_MODE: {mode}")
+    return mode
+
+
+def require_env(name: str, message: Optional[str] = None) -> None:
+    """Raise ValueError if the environment variable `name` is unset.
+
+    The check is skipped in replay mode, which needs no provider keys.
+    """
+    if os.getenv(name) is None and harness_mode() != REPLAY:
+        raise ValueError(message or f"{name} is not set")
+
+
+class FixtureNotFound(KeyError):
+    """Raised in replay mode when no recording matches a request."""
+
+
+def normalize_dates(text: str) -> str:
+    """Replace dates in `text` with placeholders so fixtures do not expire."""
+    return _ISO_DATE.sub("<DATE>", _MONTH_DATE.sub("<DATE>", text))
+
+
+class FixtureStore:
+    """Fixture files of one directory, one JSON file per request key."""
+
+    def __init__(self, root: str):
+        """Use the fixture files under `root`."""
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._replayed: Dict[str, int] = {}
+
+    def key(self, kind: str, request: Any) -> str:
+        """Return the fixture key of a request, with embedded dates normalized."""
+        raw = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f"{kind}\x1f{normalize_dates(raw)}".encode()).hexdigest()
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.root / kind / f"{key}.json"
+
+    def record(self, kind: str, request: Any, response: Any) -> None:
+        """Write the response to a request as a fixture file."""
+        key = self.key(kind, request)
+        path = self._path(kind, key)
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists():
+                fixture = json.loads(path.read_text(encoding="utf-8"))
+            else:
+                fixture = {"kind": kind, "request": request, "responses": []}
+            fixture["responses"].append(response)
+            path.write_text(
+                json.dumps(fixture, ensure_ascii=False, indent=1, default=str),
+                encoding="utf-8",
+            )
+
+    def replay(self, kind: str, request: Any) -> Any:
+        """Return the next recorded response for `request`, cycling through them."""
+        key = self.key(kind, request)
+        path = self._path(kind, key)
+        if not path.exists():
+            raise FixtureNotFound(
+                f"No {kind} fixture {key} in {self.root}; record it with "
+                f"LLM_HARNESS_MODE=record"
+            )
+        responses = json.loads(path.read_text(encoding="utf-8"))["responses"]
+        with self._lock:
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+        return responses[index % len(responses)]
+
+    def latency(self, kind: str, request: Any) -> float:
+        """Synthetic latency of a replayed call, deterministic per request and call."""
+        spec = os.getenv("LLM_REPLAY_LATENCY", "0")
+        low, _, high = spec.partition(":")
+        if not high:
+            return float(low)
+        key = self.key(kind, request)
+        rng = random.Random(f"{key}:{self._replayed.get(key, 0)}")
+        return rng.uniform(float(low), float(high))
+
+
+_stores: Dict[str, FixtureStore] = {}
+
+
+def fixture_store() -> FixtureStore:
+    """Return the fixture store of the directory named by `LLM_FIXTURES_DIR`."""
+    root = os.getenv("LLM_FIXTURES_DIR", "fixtures/llm")
+    store = _stores.get(root)
+    if store is None:
+        store = _stores.setdefault(root, FixtureStore(root))
+    return store
+
+
+def intercept(
+    kind: str,
+    request: Any,
+    live: Callable[[], T],
+    dump: Callable[[T], Any] = lambda value: value,
+    load: Callable[[Any], T] = lambda value: value,
+) -> T:
+    """Route one provider call through the harness.
+
+    Args:
+        kind: Fixture namespace, e.g. `"genai"` or `"yunwu"`.
+        request: JSON-serializable description of the request; it is hashed into
+            the fixture key, so it must not contain secrets or per-call ids.
+        live: Performs the real call.
+        dump: Converts the live response into JSON-serializable data.
+        load: Rebuilds the response from the recorded data.
+    """
+    mode = harness_mode()
+    if mode == REPLAY:
+        store = fixture_store()
+        time.sleep(store.latency(kind, request))
+        return load(store.replay(kind, request))
+    result = live()
+    if mode == RECORD:
+        fixture_store().record(kind, request, dump(result))
+    return result
+
+
+async def aintercept(
+    kind: str,
+    request: Any,
+    live: Callable[[], Awaitable[T]],
+    dump: Callable[[T], Any] = lambda value: value,
+    load: Callable[[Any], T] = lambda value: value,
+) -> T:
+    """Async variant of `intercept`; `live` returns the awaitable of the real call."""
+    mode = harness_mode()
+    if mode == REPLAY:
+        store = fixture_store()
+        await asyncio.sleep(store.latency(kind, request))
+        return load(store.replay(kind, request))
+    result = await live()
+    if mode == RECORD:
+        fixture_store().record(kind, request, dump(result))
+    return result
+
+
+# Chat models
+
+
+def _chat_request(
+    provider: str, model: str, schema: Optional[str], messages: List[BaseMessage]
+) -> Dict[str, Any]:
+    return {
+        "provider": provider,
+        "model": model,
+        "schema": schema,
+        "messages": [{"type": m.type, "content": m.content} for m in messages],
+    }
+
+
+def _dump_message(message: BaseMessage) -> Dict[str, Any]:
+    return {
+        "content": message.content,
+        "usage_metadata": getattr(message, "usage_metadata", None),
+    }
+
+
+def _message_chunks(message: Dict[str, Any]) -> Iterator[ChatGenerationChunk]:
+    content = message["content"]
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False)
+    pieces = [
+        content[i : i + _STREAM_CHUNK_CHARS]
+        for i in range(0, len(content), _STREAM_CHUNK_CHARS)
+    ] or [""]
+    for idx, piece in enumerate(pieces):
+        last = idx == len(pieces) - 1
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=piece,
+                usage_metadata=message.get("usage_metadata") if last else None,
+            )
+        )
+
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model that answers from recorded fixtures; see the module docstring."""
+
+    provider: str
+    model: str
+    schema_name: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _request(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        return _chat_request(self.provider, self.model, self.schema_name, messages)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = intercept("chat", self._request(messages), live=_no_live_call)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(**message))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = await aintercept("chat", self._request(messages), live=_no_live_call)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(**message))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        message = intercept("chat", self._request(messages), live=_no_live_call)
+        for chunk in _message_chunks(message):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        message = await aintercept("chat", self._request(messages), live=_no_live_call)
+        for chunk in _message_chunks(message):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        """Replay the recorded structured result, stored as JSON message content."""
+        llm = self.model_copy(update={"schema_name": schema.__name__})
+        return llm | RunnableLambda(
+            lambda message: schema.model_validate_json(message.content)
+        )
+
+
+def _no_live_call():
+    raise RuntimeError("Replay models never call a provider")
+
+
+class RecordingChatModel(BaseChatModel):
+    """Wraps a live chat model and records every response as a fixture."""
+
+    inner: BaseChatModel
+    provider: str
+    model: str
+    schema_name: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"recording-{self.inner._llm_type}"
+
+    def _request(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        return _chat_request(self.provider, self.model, self.schema_name, messages)
+
+    def _record(self, messages: List[BaseMessage], message: BaseMessage) -> None:
+        fixture_store().record("chat", self._request(messages), _dump_message(message))
+
+    # The inner model's private hooks are called directly, so the call is reported
+    # to callbacks once, by this model
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        result = self.inner._generate(messages, stop=stop, **kwargs)
+        self._record(messages, result.generations[0].message)
+        return result
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+        self._record(messages, result.generations[0].message)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        aggregate = None
+        for chunk in self.inner._stream(messages, stop=stop, **kwargs):
+            message = chunk.message
+            aggregate = message if aggregate is None else aggregate + message
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        if aggregate is not None:
+            self._record(messages, aggregate)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        aggregate = None
+        async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+            message = chunk.message
+            aggregate = message if aggregate is None else aggregate + message
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        if aggregate is not None:
+            self._record(messages, aggregate)
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        """Record the parsed result as JSON content, with the raw message's usage."""
+        structured = self.inner.with_structured_output(
+            schema, include_raw=True, **kwargs
+        )
+        request_model = self.model_copy(update={"schema_name": schema.__name__})
+
+        def record(output: Dict[str, Any], messages: List[BaseMessage]):
+            if output.get("parsing_error") is not None:
+                raise output["parsing_error"]
+            parsed = output["parsed"]
+            usage = getattr(output["raw"], "usage_metadata", None)
+            fixture_store().record(
+                "chat",
+                request_model._request(messages),
+                {"content": parsed.model_dump_json(), "usage_metadata": usage},
+            )
+            return parsed
+
+        def invoke(prompt: Any, config=None):
+            messages = self._convert_input(prompt).to_messages()
+            return record(structured.invoke(prompt, config), messages)
+
+        async def ainvoke(prompt: Any, config=None):
+            messages = self._convert_input(prompt).to_messages()
+            return record(await structured.ainvoke(prompt, config), messages)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name="RecordingStructuredOutput")
+
+
+def wrap_chat_model(
+    provider: str, model: str, build: Callable[[], BaseChatModel]
+) -> BaseChatModel:
+    """Return the chat model for the current harness mode.
+
+    `build` creates the live model; it is not called in replay mode.
+    """
+    mode = harness_mode()
+    if mode == REPLAY:
+        return ReplayChatModel(provider=provider, model=model)
+    if mode == RECORD:
+        return RecordingChatModel(inner=build(), provider=provider, model=model)
+    return build()
+
+
+# google-genai client
+
+
+def _genai_request(model: str, contents: Any, config: Any) -> Dict[str, Any]:
+    if hasattr(config, "model_dump"):
+        config = config.model_dump(mode="json", exclude_none=True)
+    return {"model": model, "contents": contents, "config": config}
+
+
+def _dump_genai(response: Any) -> Dict[str, Any]:
+    return response.model_dump(mode="json", exclude_none=True)
+
+
+def _load_genai(data: Dict[str, Any]) -> Any:
+    from google.genai import types
+
+    return types.GenerateContentResponse.model_validate(data)
+
+
+class _HarnessModels:
+    def __init__(self, live: Any):
+        self._live = live
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None):
+        return intercept(
+            "genai",
+            _genai_request(model, contents, config),
+            lambda: self._live.models.generate_content(
+                model=model, contents=contents, config=config
+            ),
+            _dump_genai,
+            _load_genai,
+        )
+
+
+class _AsyncHarnessModels:
+    def __init__(self, live: Any):
+        self._live = live
+
+    async def generate_content(self, *, model: str, contents: Any, config: Any = None):
+        return await aintercept(
+            "genai",
+            _genai_request(model, contents, config),
+            lambda: self._live.aio.models.generate_content(
+                model=model, contents=contents, config=config
+            ),
+            _dump_genai,
+            _load_genai,
+        )
+
+
+class _AsyncHarnessClient:
+    def __init__(self, live: Any):
+        self.models = _AsyncHarnessModels(live)
+
+
+class HarnessGenaiClient:
+    """google-genai client stand-in that records or replays `generate_content`.
+
+    In replay mode `live` is None and no provider client is created.
+    """
+
+    def __init__(self, live: Any = None):
+        """Wrap the `live` client, or none in replay mode."""
+        self.models = _HarnessModels(live)
+        self.aio = _AsyncHarnessClient(live)
@@ -0,0 +1,179 @@
+"""Result cache for the `web_research` node.
+
+Grounded Google Search calls are the slowest step of the research graph, and
+`generate_query`/`reflection` regularly produce the same query for repeat topics.
+Results are cached under the normalized query text, the search model and the
+date bucket that is embedded in the search prompt. Two backends are available:
+an in-process LRU and a SQLite file that several worker processes can share.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import cache
+from typing import Any, Dict, Optional
+
+from agent.sources import rekey_source_store
+from agent.utils import SHORT_URL_PREFIX
+
+MEMORY = "memory"
+SQLITE = "sqlite"
+OFF = "off"
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so trivially different spellings share a cache entry."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.strip(" .?!,;:\"'")
+
+
+def search_cache_key(query: str, model: str, date_bucket: str) -> str:
+    """Return the cache key for a query searched with `model` on `date_bucket`."""
+    raw = "\x1f".join((normalize_query(query), model, date_bucket))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def rekey_short_urls(entry: Dict[str, Any], new_id: Any) -> Dict[str, Any]:
+    """Rewrite the short urls of a cached entry to the id of the requesting branch.
+
+    Short urls embed the `web_research` branch id (see `resolve_urls`), so an entry
+    cached by another run has to be moved to the current id to avoid colliding with
+    the short urls of its sibling branches.
+    """
+    old, new = f"{SHORT_URL_PREFIX}{entry['id']}-", f"{SHORT_URL_PREFIX}{new_id}-"
+    if old == new:
+        return entry
+    return {
+        "id": new_id,
+        "text": entry["text"].replace(old, new),
+        "source_store": rekey_source_store(entry["source_store"], entry["id"], new_id),
+    }
+
+
+class SearchCache:
+    """Interface of the search result cache backends."""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for `key`, or None on a miss or expired entry."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store `value` under `key`, evicting the least recently used entries."""
+        raise NotImplementedError
+
+
+class MemorySearchCache(SearchCache):
+    """In-process LRU cache with a per-entry time to live."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        """Create an empty cache of at most `max_entries` entries."""
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for `key` and mark it as recently used."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            created_at, value = item
+            if time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store `value` and evict the least recently used entries over the limit."""
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteSearchCache(SearchCache):
+    """SQLite-backed cache that can be shared by several worker processes.
+
+    The database runs in WAL mode so readers in other processes are not blocked by
+    a writer, and `accessed_at` drives the LRU eviction.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        """Open or create the cache database at `path`."""
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS search_cache_accessed_at "
+                "ON search_cache (accessed_at)"
+            )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for `key`, dropping it if it has expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store `value`, then drop expired entries and those over the limit."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE created_at < ?",
+                (now - self.ttl_seconds,),
+            )
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE key IN ("
+                "SELECT key FROM search_cache ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+@cache
+def get_search_cache(
+    backend: str, path: str, ttl_seconds: float, max_entries: int
+) -> Optional[SearchCache]:
+    """Return the process-wide cache for the given settings, or None when disabled."""
+    if backend == MEMORY:
+        return MemorySearchCache(ttl_seconds, max_entries)
+    if backend == SQLITE:
+        return SQLiteSearchCache(path, ttl_seconds, max_entries)
+    if backend == OFF:
+        return None
+    raise ValueError(f"Unknown search cache backend: {backend}")
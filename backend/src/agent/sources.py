@@ -0,0 +1,126 @@
+"""Compact, deduplicated store of the sources cited by web research.
+
+Every `web_research` branch cites the same pages many times: once per grounding
+segment, per query and per loop. Instead of appending one dict per segment, the
+graph keeps a single store in which each URI appears once:
+
+    {
+        "labels": ["apnews", "reuters", ...],
+        "uris": {"https://...": [label_index, "0-3", "4-1", ...], ...},
+    }
+
+Labels are interned in `labels`, and each URI lists the short url ids
+(`SHORT_URL_PREFIX` + id) that stand for it. The structure is made of plain
+lists, dicts, strings and ints, so it serializes cheaply into checkpoints, and
+`merge_sources` merges stores instead of concatenating them.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from agent.utils import SHORT_URL_PREFIX
+
+SourceStore = Dict[str, Any]
+
+
+def empty_source_store() -> SourceStore:
+    """Return a store without sources."""
+    return {"labels": [], "uris": {}}
+
+
+def _short_url_id(short_url: str) -> str:
+    return short_url[len(SHORT_URL_PREFIX) :]
+
+
+def source_store(segments: Iterable[Dict[str, Any]]) -> SourceStore:
+    """Build a store from citation segments with `label`, `short_url` and `value`."""
+    labels: List[str] = []
+    label_index: Dict[str, int] = {}
+    uris: Dict[str, list] = {}
+    for segment in segments:
+        entry = uris.get(segment["value"])
+        if entry is None:
+            label = segment["label"]
+            if label not in label_index:
+                label_index[label] = len(labels)
+                labels.append(label)
+            entry = uris[segment["value"]] = [label_index[label]]
+        short_url_id = _short_url_id(segment["short_url"])
+        if short_url_id not in entry[1:]:
+            entry.append(short_url_id)
+    return {"labels": labels, "uris": uris}
+
+
+def merge_sources(
+    left: Optional[SourceStore], right: Optional[SourceStore]
+) -> SourceStore:
+    """Reducer of the `source_store` state key.
+
+    Adds the URIs and short urls of `right` that `left` does not know yet. `left`
+    is returned unchanged when there is nothing new, which is the common case in
+    later research loops, and is never mutated since checkpoints may share it.
+    """
+    if not left:
+        return right or empty_source_store()
+    if not right:
+        return left
+
+    labels = left["labels"]
+    label_index = None
+    uris = None
+    for uri, (right_label, *short_url_ids) in right["uris"].items():
+        entry = left["uris"].get(uri)
+        if entry is None:
+            if label_index is None:
+                labels = list(labels)
+                label_index = {label: idx for idx, label in enumerate(labels)}
+            label = right["labels"][right_label]
+            if label not in label_index:
+                label_index[label] = len(labels)
+                labels.append(label)
+            new_entry = [label_index[label], *short_url_ids]
+        else:
+            new_ids = [i for i in short_url_ids if i not in entry[1:]]
+            if not new_ids:
+                continue
+            new_entry = entry + new_ids
+        if uris is None:
+            uris = dict(left["uris"])
+        uris[uri] = new_entry
+
+    if uris is None:
+        return left
+    return {"labels": labels, "uris": uris}
+
+
+def store_segments(store: Optional[SourceStore]) -> List[Dict[str, Any]]:
+    """Expand a store into unique citation segments, first seen first."""
+    if not store:
+        return []
+    labels = store["labels"]
+    return [
+        {
+            "label": labels[label_idx],
+            "short_url": f"{SHORT_URL_PREFIX}{short_url_id}",
+            "value": uri,
+        }
+        for uri, (label_idx, *short_url_ids) in store["uris"].items()
+        for short_url_id in short_url_ids
+    ]
+
+
+def rekey_source_store(store: SourceStore, old_id: Any, new_id: Any) -> SourceStore:
+    """Move the short urls of one `web_research` branch from `old_id` to `new_id`."""
+    old, new = f"{old_id}-", f"{new_id}-"
+    return {
+        "labels": store["labels"],
+        "uris": {
+            uri: [
+                label_idx,
+                *(
+                    new + i[len(old) :] if i.startswith(old) else i
+                    for i in short_url_ids
+                ),
+            ]
+            for uri, (label_idx, *short_url_ids) in store["uris"].items()
+        },
+    }
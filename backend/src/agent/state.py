@@ -9,12 +9,27 @@ from typing_extensions import Annotated
 
 import operator
 
+from agent.sources import merge_sources
+
 
 class OverallState(TypedDict):
     messages: Annotated[list, add_messages]
     search_query: Annotated[list, operator.add]
     web_research_result: Annotated[list, operator.add]
+    # Sources cited by web research, deduplicated by URI (see agent.sources)
+    source_store: Annotated[dict, merge_sources]
+    # Sources cited by the final answer
     sources_gathered: Annotated[list, operator.add]
+    skipped_queries: Annotated[list, operator.add]
+    dropped_queries: Annotated[list, operator.add]
+    # Decisions of the adaptive fan-out (see agent.fanout)
+    fan_out: Annotated[list, operator.add]
+    knowledge_summary: str
+    summarized_result_count: int
+    # Spend counters of the thread, and their values when the current run started
+    tokens_used: Annotated[int, operator.add]
+    web_searches_used: Annotated[int, operator.add]
+    budget_start: dict
     initial_search_query_count: int
     max_research_loops: int
     research_loop_count: int
@@ -25,9 +40,14 @@ class OverallState(TypedDict):
 class ReflectionState(TypedDict):
     is_sufficient: bool
     knowledge_gap: str
-    follow_up_queries: Annotated[list, operator.add]
+    follow_up_queries: list
     research_loop_count: int
+    # The run's loop limit, so evaluate_research sees the same one as reflection
+    max_research_loops: int
     number_of_ran_queries: int
+    tokens_used: int
+    web_searches_used: int
+    budget_start: dict
 
 
 class Query(TypedDict):
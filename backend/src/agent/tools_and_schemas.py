@@ -21,3 +21,11 @@ class Reflection(BaseModel):
     follow_up_queries: List[str] = Field(
         description="A list of follow-up queries to address the knowledge gap."
     )
+
+
+class IncrementalReflection(Reflection):
+    """Reflection of the 'incremental' mode, which also rewrites the knowledge summary."""
+
+    knowledge_summary: str = Field(
+        description="A condensed summary of all the knowledge gathered so far."
+    )
@@ -1,6 +1,10 @@
-from typing import Any, Dict, List
+import re
+from typing import Any, Dict, List, Sequence, Tuple
 from langchain_core.messages import AnyMessage, AIMessage, HumanMessage
 
+# Prefix of the short urls that stand in for the long vertex ai search urls
+SHORT_URL_PREFIX = "https://vertexaisearch.cloud.google.com/id/"
+
 
 def get_research_topic(messages: List[AnyMessage]) -> str:
     """
@@ -8,15 +12,70 @@ def get_research_topic(messages: List[AnyMessage]) -> str:
     """
     # check if request has a history and combine the messages into a single string
     if len(messages) == 1:
-        research_topic = messages[-1].content
-    else:
-        research_topic = ""
-        for message in messages:
-            if isinstance(message, HumanMessage):
-                research_topic += f"User: {message.content}\n"
-            elif isinstance(message, AIMessage):
-                research_topic += f"Assistant: {message.content}\n"
-    return research_topic
+        return messages[-1].content
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {message.content}\n")
+        elif isinstance(message, AIMessage):
+            lines.append(f"Assistant: {message.content}\n")
+    return "".join(lines)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a prompt, about four UTF-8 bytes per token."""
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def _query_tokens(query: str) -> frozenset:
+    return frozenset(re.findall(r"\w+", query.lower()))
+
+
+def query_similarity(a: str, b: str) -> float:
+    """Return the token Jaccard similarity of two search queries, between 0 and 1."""
+    tokens_a, tokens_b = _query_tokens(a), _query_tokens(b)
+    if not tokens_a or not tokens_b:
+        return float(a.strip().lower() == b.strip().lower())
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+def dedupe_queries(
+    queries: Sequence[str], seen: Sequence[str], threshold: float
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Drop queries that are near-duplicates of a query already seen.
+
+    Each query is compared against `seen` and against the queries kept before it.
+
+    Args:
+        queries: Candidate queries in order of preference.
+        seen: Queries that were already run.
+        threshold: Similarity at or above which a candidate is dropped.
+
+    Returns:
+        The kept queries, and one record per dropped query with the query it
+        duplicates and their similarity.
+    """
+    kept: List[str] = []
+    skipped: List[Dict[str, Any]] = []
+    reference = [(query, _query_tokens(query)) for query in seen]
+    for query in queries:
+        tokens = _query_tokens(query)
+        best, best_score = None, 0.0
+        for other, other_tokens in reference:
+            if tokens and other_tokens:
+                score = len(tokens & other_tokens) / len(tokens | other_tokens)
+            else:
+                score = query_similarity(query, other)
+            if score > best_score:
+                best, best_score = other, score
+        if best is not None and best_score >= threshold:
+            skipped.append(
+                {"query": query, "similar_to": best, "similarity": round(best_score, 3)}
+            )
+            continue
+        kept.append(query)
+        reference.append((query, tokens))
+    return kept, skipped
 
 
 def resolve_urls(urls_to_resolve: List[Any], id: int) -> Dict[str, str]:
@@ -24,7 +83,7 @@ def resolve_urls(urls_to_resolve: List[Any], id: int) -> Dict[str, str]:
     Create a map of the vertex ai search urls (very long) to a short url with a unique id for each url.
     Ensures each original URL gets a consistent shortened form while maintaining uniqueness.
     """
-    prefix = f"https://vertexaisearch.cloud.google.com/id/"
+    prefix = SHORT_URL_PREFIX
     urls = [site.web.uri for site in urls_to_resolve]
 
     # Create a dictionary that maps each unique URL to its first occurrence index
@@ -36,6 +95,87 @@ def resolve_urls(urls_to_resolve: List[Any], id: int) -> Dict[str, str]:
     return resolved_map
 
 
+class ShortUrlStreamRewriter:
+    """Replace short urls with the original urls in an answer that arrives in chunks.
+
+    A short url can be split across chunks, so the tail of the text that might
+    still grow into a short url is held back until the next chunk (or `flush`)
+    shows where it ends.
+    """
+
+    _SHORT_URL = re.compile(re.escape(SHORT_URL_PREFIX) + r"\d+-\d+")
+    _PARTIAL_TAIL = re.compile(re.escape(SHORT_URL_PREFIX) + r"[\d-]*\Z")
+
+    def __init__(self, sources: List[Dict[str, Any]]):
+        """Index `sources` by short url; the first source of a short url wins."""
+        self._sources: Dict[str, Dict[str, Any]] = {}
+        for source in sources:
+            if source.get("short_url"):
+                self._sources.setdefault(source["short_url"], source)
+        self._pending = ""
+        self.used: set = set()
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return the rewritten text that is safe to emit."""
+        text = self._pending + chunk
+        hold = self._holdback_start(text)
+        self._pending = text[hold:]
+        return self._rewrite(text[:hold])
+
+    def flush(self) -> str:
+        """Return the rewritten remainder once the stream has ended."""
+        text, self._pending = self._pending, ""
+        return self._rewrite(text)
+
+    def unique_sources(self, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return the sources whose short url appeared in the answer, without repeats."""
+        unique, seen = [], set()
+        for source in sources:
+            short_url = source.get("short_url")
+            if short_url in self.used and short_url not in seen:
+                seen.add(short_url)
+                unique.append(source)
+        return unique
+
+    def _holdback_start(self, text: str) -> int:
+        match = self._PARTIAL_TAIL.search(text)
+        if match:
+            return match.start()
+        for size in range(min(len(SHORT_URL_PREFIX) - 1, len(text)), 0, -1):
+            if text.endswith(SHORT_URL_PREFIX[:size]):
+                return len(text) - size
+        return len(text)
+
+    def _rewrite(self, text: str) -> str:
+        return self._SHORT_URL.sub(self._expand, text) if text else text
+
+    def _expand(self, match: re.Match) -> str:
+        source = self._sources.get(match.group(0))
+        if source is None:
+            return match.group(0)
+        self.used.add(match.group(0))
+        return source["value"]
+
+
+def expand_short_urls(
+    text: str, sources: List[Dict[str, Any]]
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """Replace every short url in `text` with its original url in a single pass.
+
+    Matches the generic short url pattern once and looks each match up in a map
+    that is deduplicated by short url, so the cost no longer grows with the number
+    of sources times the length of the text. Whole matches are looked up, which
+    also keeps `.../id/1-1` from being rewritten inside `.../id/1-10`.
+
+    Returns:
+        The rewritten text and the sources whose short url appeared in it, unique
+        and in their original order.
+    """
+    rewriter = ShortUrlStreamRewriter(sources)
+    expanded = rewriter.feed(text) + rewriter.flush()
+    return expanded, rewriter.unique_sources(sources)
+
+
 def insert_citation_markers(text, citations_list):
     """
     Inserts citation markers into a text string based on start and end indices.
@@ -50,6 +190,34 @@ def insert_citation_markers(text, citations_list):
     Returns:
         str: The text with citation markers inserted.
     """
+    if any(not 0 <= c["end_index"] <= len(text) for c in citations_list):
+        # Out-of-range indices resolve against the partially modified text, which
+        # only the slicing implementation reproduces
+        return _insert_citation_markers_by_slicing(text, citations_list)
+
+    # Walk the insertion points left to right and build the output in one pass.
+    # Reversing the descending sort keeps the order of markers that share an end
+    # index identical to inserting them back to front.
+    sorted_citations = sorted(
+        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+    )
+    parts = []
+    position = 0
+    for citation_info in reversed(sorted_citations):
+        end_idx = citation_info["end_index"]
+        parts.append(text[position:end_idx])
+        for segment in citation_info["segments"]:
+            parts.append(f" [{segment['label']}]({segment['short_url']})")
+        position = end_idx
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def _insert_citation_markers_by_slicing(text, citations_list):
+    """Insert citation markers by rebuilding the text once per citation.
+
+    Quadratic in the number of citations; used for indices outside the text.
+    """
     # Sort citations by end_index in descending order.
     # If end_index is the same, secondary sort by start_index descending.
     # This ensures that insertions at the end of the string don't affect
@@ -4,6 +4,8 @@ import os
 import base64
 from datetime import datetime
 
+from agent.replay import intercept
+
 def save_response_and_images(prompt: str, root_folder: str = "outputs/comics") -> dict:
     """
     调用 Yunwu AI 生成内容，并将完整响应和图片保存到不同子文件夹。
@@ -21,26 +23,25 @@ def save_response_and_images(prompt: str, root_folder: str = "outputs/comics") -
     os.makedirs(responses_folder, exist_ok=True)
     os.makedirs(images_folder, exist_ok=True)
 
-    # 2️⃣ 调用 API
-    conn = http.client.HTTPSConnection("yunwu.ai")
-    payload = json.dumps({
+    # 2️⃣ 调用 API（录制/回放模式下经由 agent.replay，密钥不参与 fixture 的键）
+    path = "/v1beta/models/gemini-3-pro-image-preview:generateContent"
+    payload = {
         "contents": [{"role": "user", "parts": [{"text": prompt}]}],
         "generationConfig": {"responseModalities": ["IMAGE", "TEXT"]}
-    })
-    headers = {
-        'Authorization': 'Bearer ' + os.getenv("YUNWU_API_KEY"),
-        'Content-Type': 'application/json'
     }
 
-    conn.request(
-        "POST",
-        "/v1beta/models/gemini-3-pro-image-preview:generateContent",
-        payload,
-        headers
-    )
-    res = conn.getresponse()
-    data = res.read()
-    result = json.loads(data.decode("utf-8"))
+    def call_api() -> dict:
+        conn = http.client.HTTPSConnection("yunwu.ai")
+        headers = {
+            'Authorization': 'Bearer ' + os.getenv("YUNWU_API_KEY"),
+            'Content-Type': 'application/json'
+        }
+        conn.request("POST", path, json.dumps(payload), headers)
+        res = conn.getresponse()
+        data = res.read()
+        return json.loads(data.decode("utf-8"))
+
+    result = intercept("yunwu", {"path": path, "payload": payload}, call_api)
 
     # 3️⃣ 保存完整 JSON 响应
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
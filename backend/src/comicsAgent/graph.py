@@ -1,6 +1,9 @@
-import os
 from typing import Any
-from langchain_deepseek import ChatDeepSeek
+from agent.clients import DEEPSEEK, get_chat_model
+from agent.checkpoint import get_checkpointer
+from agent.replay import require_env
+from agent.metrics import instrument_graph
+from agent.node_cache import NodeCachePolicy, cached_node
 from langgraph.graph import START, END, StateGraph
 from langchain_core.messages import AIMessage
 from contentAgent.utils_state import persistence
@@ -12,30 +15,22 @@ from comicsAgent.prompts import (
     generate_image_prompt,
     generate_image_prompt_2
 )
-from langchain_openai import ChatOpenAI
 
 from comicsAgent.tools_and_schemas import StoryboardResult
 from comicsAgent.gemini import save_response_and_images
 
 
 # 环境变量检查
-if os.getenv("DeepSeek_API_KEY") is None:
-    raise ValueError("DeepSeek_API_KEY 环境变量未设置")
-if os.getenv("YUNWU_BASE_URL") is None:
-    raise ValueError("YUNWU_BASE_URL 环境变量未设置")
-if os.getenv("YUNWU_API_KEY") is None:
-    raise ValueError("YUNWU_API_KEY 环境变量未设置")
+require_env("DeepSeek_API_KEY", "DeepSeek_API_KEY 环境变量未设置")
+require_env("YUNWU_BASE_URL", "YUNWU_BASE_URL 环境变量未设置")
+require_env("YUNWU_API_KEY", "YUNWU_API_KEY 环境变量未设置")
 def generate_outline(state: OverallState)->OverallState:
     """生成预分镜处理"""
     try:
-        llm = ChatDeepSeek(
-            model="deepseek-chat",
-            temperature=0.7,
-            api_key=os.getenv("DeepSeek_API_KEY")
-        )
+        llm = get_chat_model(DEEPSEEK, "deepseek-chat", temperature=0.7)
         prompt = generate_outline_prompt.format(description=state["description"])
         print("预分镜prompt = ",prompt)
-        result = llm.invoke(prompt)
+        result = llm.invoke(prompt, config=generate_outline_prompt.config)
         state["outline"] = result.content
         print("预分镜结果",result)
 
@@ -49,15 +44,12 @@ def generate_outline(state: OverallState)->OverallState:
 def generate_storyboard(state: OverallState)->OverallState:
     """生成分镜处理"""
     try:
-        llm = ChatDeepSeek(
-            model="deepseek-chat",
-            temperature=0,
-            api_key=os.getenv("DeepSeek_API_KEY")
+        structured_llm = get_chat_model(
+            DEEPSEEK, "deepseek-chat", temperature=0, schema=StoryboardResult
         )
         prompt = generate_storyboard_prompt.format(outline=state["outline"])
         print("分镜prompt = ",prompt)
-        structured_llm = llm.with_structured_output(StoryboardResult)
-        result = structured_llm.invoke(prompt)
+        result = structured_llm.invoke(prompt, config=generate_storyboard_prompt.config)
         print("分镜结果",result)
         if not hasattr(result, "panels") or not result.panels:
             raise ValueError("StoryboardResult 中未返回有效 panels")
@@ -178,7 +170,20 @@ def build_graph()->Any:
     graph = StateGraph(OverallState)
     # graph.add_node(START, generate_outline)
     graph.add_node("generate_outline", generate_outline)
-    graph.add_node("generate_storyboard", generate_storyboard)
+    # 分镜在 temperature=0 下只取决于大纲，相同大纲直接复用缓存结果
+    graph.add_node(
+        "generate_storyboard",
+        cached_node(
+            "generate_storyboard",
+            generate_storyboard,
+            NodeCachePolicy(
+                inputs=("outline",),
+                outputs=("storyBoard", "messages"),
+                params=lambda state, config: generate_storyboard_prompt.template,
+                depends_on=(StoryboardResult,),
+            ),
+        ),
+    )
     graph.add_node("batch_generate_image", batch_generate_image)
     graph.add_node("save_conversation_state",save_conversation_state)
     # graph.add_node(END, persistence)
@@ -188,6 +193,6 @@ def build_graph()->Any:
     graph.add_edge("batch_generate_image", "save_conversation_state")
     graph.add_edge("save_conversation_state", END)
 
-    return graph.compile(name="pro-comics-agent")
+    return graph.compile(name="pro-comics-agent", checkpointer=get_checkpointer())
 
-graph = build_graph()
+graph = instrument_graph(build_graph(), "comicsAgent")
@@ -1,5 +1,6 @@
+from agent.prompt_cache import CachedPrompt
 
-generate_outline_prompt="""
+generate_outline_prompt = CachedPrompt("comicsAgent.generate_outline_prompt", """
 你是一名擅长漫画分镜设计的故事策划师。
 
 请根据以下故事文本，对内容进行【分镜预处理】，将故事拆解为一组“画面节点”，用于后续生成正式的漫画分镜（PanelInfo）。
@@ -37,9 +38,9 @@ generate_outline_prompt="""
 【故事文本】
 {description}
 
-"""
+""")
 
-generate_storyboard_prompt="""
+generate_storyboard_prompt = CachedPrompt("comicsAgent.generate_storyboard_prompt", """
 你是一名漫画分镜设计师。
 
 请根据分镜预处理数据，将每个画面节点转化为正式分镜内容。
@@ -50,10 +51,10 @@ generate_storyboard_prompt="""
 - 内容应可直接用于绘制漫画画面
 分镜预处理数据：
 {outline}
-"""
+""")
 
 
-generate_image_prompt="""
+generate_image_prompt = CachedPrompt("comicsAgent.generate_image_prompt", """
 Comic type: {comic_type}.
 Drawing style: {style}.
 Color scheme: {color_scheme}.
@@ -65,9 +66,9 @@ Character expression: {expression}.
 Additional details: {details}.
 text:{text_section}
 Draw as a comic panel, simple and clear, focus on scene and character only.
-"""
+""")
 
-generate_image_prompt_2="""
+generate_image_prompt_2 = CachedPrompt("comicsAgent.generate_image_prompt_2", """
 # Role: Nano Banana Pro - Universal Comic Engine
 You are a versatile AI Comic Artist. Your core strength is the ability to semantically parse ANY structured JSON data and transform it into a cohesive, visually consistent multi-panel comic page.
 
@@ -97,4 +98,4 @@ Regardless of the key names in the provided JSON, you must intelligently map the
 
 # Final Instruction
 Analyze the [JSON_Data] provided, map the semantic meanings to comic elements, apply the [Style_Theme], and generate the final rendered comic page image directly.
-"""
\ No newline at end of file
+""")
\ No newline at end of file
@@ -1,2 +1,10 @@
-from contentAgent.graph import graph
-__all__ = ["graph"]
\ No newline at end of file
+# graph 在首次访问时才构建，导入子模块（如 contentAgent.utils_state）不会加载整个图
+__all__ = ["graph"]
+
+
+def __getattr__(name):
+    if name == "graph":
+        from contentAgent.graph import graph
+
+        return graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
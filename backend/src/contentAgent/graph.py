@@ -1,6 +1,9 @@
-import os
 from typing import Any
-from langchain_deepseek import ChatDeepSeek
+from agent.clients import DEEPSEEK, get_chat_model
+from agent.checkpoint import get_checkpointer
+from agent.replay import require_env
+from agent.metrics import instrument_graph
+from agent.node_cache import NodeCachePolicy, cached_node
 from langgraph.graph import START, END, StateGraph
 from langchain_core.messages import AIMessage
 import pysrt
@@ -22,8 +25,7 @@ from contentAgent.tools_and_schemas import ViewPointsStruct
 from contentAgent.utils_state import persistence
 
 # 环境变量检查
-if os.getenv("DeepSeek_API_KEY") is None:
-    raise ValueError("DeepSeek_API_KEY 环境变量未设置")
+require_env("DeepSeek_API_KEY", "DeepSeek_API_KEY 环境变量未设置")
 
 def parse_srt(path:str)->str:
     """解析 SRT 字幕文件，返回纯文本内容"""
@@ -33,23 +35,20 @@ def parse_srt(path:str)->str:
 def analyze_subtitle(state: OverallState) -> OverallState:
     """分析字幕/文本，提取观点结构"""
     try:
-        llm = ChatDeepSeek(
-            model="deepseek-chat",
-            temperature=0,
-            timeout=600,
-            api_key=os.getenv("DeepSeek_API_KEY")
-        )
+        llm = get_chat_model(DEEPSEEK, "deepseek-chat", temperature=0, timeout=600)
         BASE_DIR = Path(contentAgent.__file__).resolve().parent
         srt_path = BASE_DIR / "data" / str(state["srt"])
         subtitle_text = parse_srt(srt_path)
         state["subtitle_text"] = subtitle_text
 
-        structured_llm = llm.with_structured_output(ViewPointsStruct)
+        structured_llm = get_chat_model(
+            DEEPSEEK, "deepseek-chat", temperature=0, schema=ViewPointsStruct, timeout=600
+        )
         prompt = opinion_extraction_prompt.format(transcript=subtitle_text)
         print("观点prompt = ",prompt)
         print("start", time.time())
         # result = structured_llm.invoke(prompt)
-        result = llm.invoke(prompt)
+        result = llm.invoke(prompt, config=opinion_extraction_prompt.config)
         print("end", time.time())
         print("✓ 观点分析完成",result)
         state["viewpoints"] = result.content if hasattr(result, 'content') else str(result)
@@ -64,14 +63,10 @@ def analyze_subtitle(state: OverallState) -> OverallState:
 def generate_article(state: OverallState) -> OverallState:
     """根据观点生成文章"""
     try:
-        llm = ChatDeepSeek(
-            model="deepseek-chat",
-            temperature=0.85,
-            api_key=os.getenv("DeepSeek_API_KEY")
-        )
+        llm = get_chat_model(DEEPSEEK, "deepseek-chat", temperature=0.85)
         prompt = knowledge_article_writer.format(viewpoints=state.get("viewpoints", []))
         print("文章prompt = ",prompt)
-        result = llm.invoke(prompt)
+        result = llm.invoke(prompt, config=knowledge_article_writer.config)
         print("✓ 文章生成完成")
         state["article"] = result.content if hasattr(result, 'content') else str(result)
         state["messages"] = AIMessage(content=result.content)
@@ -82,14 +77,10 @@ def generate_article(state: OverallState) -> OverallState:
 def generate_title(state: OverallState) -> OverallState:
     """根据文章生成标题"""
     try:
-        llm = ChatDeepSeek(
-            model="deepseek-chat",
-            temperature=0.85,
-            api_key=os.getenv("DeepSeek_API_KEY")
-        )
+        llm = get_chat_model(DEEPSEEK, "deepseek-chat", temperature=0.85)
         prompt = title_generation_prompt2.format(article=state.get("article", ""))
         print("标题prompt = ",prompt)
-        result = llm.invoke(prompt)
+        result = llm.invoke(prompt, config=title_generation_prompt2.config)
         print("✓ 标题生成完成")
         # 假设返回的是多个标题，处理为列表
         titles_text = result.content if hasattr(result, 'content') else str(result)
@@ -102,14 +93,10 @@ def generate_title(state: OverallState) -> OverallState:
 def review_article(state:OverallState)->OverallState:
     """对文章进行审核"""
     try:
-        llm=ChatDeepSeek(
-            model="deepseek-chat",
-            temperature = 0,
-            api_key=os.getenv("DeepSeek_API_KEY")
-        )
+        llm = get_chat_model(DEEPSEEK, "deepseek-chat", temperature=0)
         prompt = review_article_prompt.format(article=state.get("article", ""))
         print("审核prompt = ",prompt)
-        result = llm.invoke(prompt)
+        result = llm.invoke(prompt, config=review_article_prompt.config)
         print("✓ 文章审核完成")
         state["review_result"] = result.content if hasattr(result, 'content') else str(result)
         state["messages"] = AIMessage(content=result.content)
@@ -119,14 +106,10 @@ def review_article(state:OverallState)->OverallState:
 def generate_comment(state: OverallState)-> OverallState:
     """生成评论"""
     try:
-        llm = ChatDeepSeek(
-            model="deepseek-chat",
-            temperature=1,
-            api_key=os.getenv("DeepSeek_API_KEY")
-        )
+        llm = get_chat_model(DEEPSEEK, "deepseek-chat", temperature=1)
         prompt = comment_generation_prompt.format(article=state.get("article", ""))
         print("评论prompt = ",prompt)
-        result = llm.invoke(prompt)
+        result = llm.invoke(prompt, config=comment_generation_prompt.config)
         print("✓ 评论生成完成")
     
         state["comment"] = result.content if hasattr(result, 'content') else str(result)
@@ -161,7 +144,19 @@ def build_graph() -> Any:
     builder.add_node("generate_article", generate_article)
     builder.add_node("generate_title", generate_title)
     builder.add_node("save_state", save_conversation_state)
-    builder.add_node("review_article", review_article)
+    # 审核在 temperature=0 下只取决于文章内容，相同文章直接复用缓存结果
+    builder.add_node(
+        "review_article",
+        cached_node(
+            "review_article",
+            review_article,
+            NodeCachePolicy(
+                inputs=("article",),
+                outputs=("review_result", "messages"),
+                params=lambda state, config: review_article_prompt.template,
+            ),
+        ),
+    )
     builder.add_node("generate_comment", generate_comment)
 
     # 添加边（定义流程）
@@ -173,8 +168,10 @@ def build_graph() -> Any:
     builder.add_edge("generate_comment", "save_state")
     builder.add_edge("save_state", END)
 
-    return builder.compile(name="pro-knowledge-content")
+    return builder.compile(
+        name="pro-knowledge-content", checkpointer=get_checkpointer()
+    )
 
 
 # 编译图
-graph = build_graph()
\ No newline at end of file
+graph = instrument_graph(build_graph(), "contentAgent")
\ No newline at end of file
@@ -1,4 +1,6 @@
-universal_extraction_prompt = """
+from agent.prompt_cache import CachedPrompt
+
+universal_extraction_prompt = CachedPrompt("contentAgent.universal_extraction_prompt", """
 你是一名信息结构分析智能体，擅长从视频字幕中抽取“可复用的信息单元”，
 用于后续的内容重组与写作。
 
@@ -77,10 +79,10 @@ universal_extraction_prompt = """
 
 视频字幕：
 {transcript}
-"""
+""")
 
 
-opinion_extraction_prompt = """
+opinion_extraction_prompt = CachedPrompt("contentAgent.opinion_extraction_prompt", """
 你是一名严谨的知识分析智能体。
 
 以下是一段视频字幕，请严格完成以下任务：
@@ -108,8 +110,8 @@ opinion_extraction_prompt = """
 - 不进行任何语言润色或总结
 视频字幕：
 {transcript}
-"""
-article_generation_prompt = """
+""")
+article_generation_prompt = CachedPrompt("contentAgent.article_generation_prompt", """
 你是一名严谨的知识型内容写作者，擅长将结构化观点整理为逻辑清晰的说明性文章。
 
 以下提供的是【已抽取并标注类型的观点列表】，观点之间可能存在逻辑先后、因果、并列或不确定关系。请你严格基于这些观点完成写作任务。
@@ -142,8 +144,8 @@ article_generation_prompt = """
 
 观点列表：
 {viewpoints}
-"""
-title_generation_prompt = """
+""")
+title_generation_prompt = CachedPrompt("contentAgent.title_generation_prompt", """
 你是一名理性取向的内容策划专家。
 
 基于以下知识文章，请生成 8 个标题，按类型分组：
@@ -159,8 +161,8 @@ title_generation_prompt = """
 - 信息密度优先于吸引力
 文章内容：
 {article}
-"""
-knowledge_article_writer="""
+""")
+knowledge_article_writer = CachedPrompt("contentAgent.knowledge_article_writer", """
 你是一名擅长写「高完读率、强连贯性微信公众号文章」的专业内容作者，
 能够将结构化的信息单元，转化为一篇具有强阅读吸引力和清晰认知推进路径的完整文章。
 
@@ -269,8 +271,8 @@ knowledge_article_writer="""
 信息单元数据：
 {viewpoints}
 
-"""
-story_article_writer="""
+""")
+story_article_writer = CachedPrompt("contentAgent.story_article_writer", """
 你是一名擅长讲故事的作者，能够根据素材信息量，
 判断合适的叙事篇幅，并将其改写为一篇引人入胜的故事。
 
@@ -322,9 +324,9 @@ story_article_writer="""
 {viewpoints}
 
 
-"""
+""")
 
-title_generation_prompt2="""
+title_generation_prompt2 = CachedPrompt("contentAgent.title_generation_prompt2", """
 你是一名资深公众号内容策划，擅长在【不歪曲内容、不制造虚假信息】的前提下，
 为知识型文章设计“让人忍不住点开”的标题。
 
@@ -368,8 +370,8 @@ title_generation_prompt2="""
 文章内容如下：
 {article}
 
-"""
-review_article_prompt="""
+""")
+review_article_prompt = CachedPrompt("contentAgent.review_article_prompt", """
 你是一名极其严格、理性、以读者体验和内容安全为第一原则的「公众号审稿编辑」。
 
 你的职责不是优化文章，而是【发现问题】。
@@ -435,8 +437,8 @@ review_article_prompt="""
 待审文章内容：
 {article}
 
-"""
-comment_generation_prompt="""
+""")
+comment_generation_prompt = CachedPrompt("contentAgent.comment_generation_prompt", """
 你是一名非常了解公众号评论区生态的内容策划专家，
 擅长通过“观点分歧型评论”激发真实读者之间的讨论、反驳和互动。
 
@@ -535,9 +537,9 @@ comment_generation_prompt="""
 ────────────────────
 文章内容如下：
 {article}
-"""
+""")
 
-xiaohongshu_generation_prompt="""
+xiaohongshu_generation_prompt = CachedPrompt("contentAgent.xiaohongshu_generation_prompt", """
 你是一名长期从事干海产品销售的普通商家，
 你的目标不是科普或说教，
 而是通过真实、克制、可信的内容，
@@ -575,4 +577,4 @@ xiaohongshu_generation_prompt="""
 - 段落短，口语化
 - 不需要标题，直接正文
 
-"""
\ No newline at end of file
+""")
\ No newline at end of file
@@ -1,3 +1,10 @@
-from excelAgent.graph import graph
+# graph 在首次访问时才构建，导入子模块（如 excelAgent.state）不会加载整个图
+__all__ = ["graph"]
 
-__all__ = ["graph"]
\ No newline at end of file
+
+def __getattr__(name):
+    if name == "graph":
+        from excelAgent.graph import graph
+
+        return graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,9 @@
 from dotenv import load_dotenv
-load_dotenv()
-import os
-from langchain_deepseek import ChatDeepSeek
+from agent.clients import DEEPSEEK, get_chat_model
+from agent.checkpoint import get_checkpointer
+from agent.replay import require_env
+from agent.metrics import instrument_graph
+from agent.node_cache import NodeCachePolicy, cached_node
 from excelAgent.tools_and_schemas import ExcelAnalysisResult
 from excelAgent.state import AnalysisState
 from agent.state import (
@@ -14,9 +16,10 @@ from langgraph.graph import START, END
 from langgraph.graph import StateGraph
 import excelAgent
 from pathlib import Path
-import pandas as pd
-if os.getenv("DeepSeek_API_KEY") is None:
-    raise ValueError("DeepSeek_API_KEY is not set")
+
+# None of the imports above reads the environment at import time
+load_dotenv()
+require_env("DeepSeek_API_KEY")
 
 # 节点 excel解析
 
@@ -26,6 +29,9 @@ def parse_excel(state: dict) -> dict:
     BASE_DIR = Path(excelAgent.__file__).resolve().parent
     excel_path = BASE_DIR / "data" / "demo.xlsx"
 
+    # pandas 导入较慢，首次解析时再加载
+    import pandas as pd
+
     df = pd.read_excel(excel_path)
 
     state["table_text"] = df.to_markdown(index=False)
@@ -36,10 +42,6 @@ def parse_excel(state: dict) -> dict:
 #AI数据结构解析
 def ai_analyze(state:AnalysisState)->AnalysisState:
     print("第二步",state)
-    llm = ChatDeepSeek(
-        model="deepseek-chat",
-        temperature=0
-    )
     prompt = f"""
 你是一名专业的数据分析助手。
 
@@ -60,7 +62,9 @@ def ai_analyze(state:AnalysisState)->AnalysisState:
 {state["table_text"]}
 --------------------
 """
-    structured_llm = llm.with_structured_output(ExcelAnalysisResult)
+    structured_llm = get_chat_model(
+        DEEPSEEK, "deepseek-chat", temperature=0, schema=ExcelAnalysisResult
+    )
     result = structured_llm.invoke(prompt)
     print(result)
     state["ai_analysis_result"] = result
@@ -70,10 +74,25 @@ def ai_analyze(state:AnalysisState)->AnalysisState:
 builder =StateGraph(AnalysisState)
 
 builder.add_node("parse_excel",parse_excel)
-builder.add_node("ai_analyze",ai_analyze)
+# 分析在 temperature=0 下只取决于表格内容，相同表格直接复用缓存结果
+builder.add_node(
+    "ai_analyze",
+    cached_node(
+        "ai_analyze",
+        ai_analyze,
+        NodeCachePolicy(
+            inputs=("table_text",),
+            outputs=("ai_analysis_result",),
+            depends_on=(ExcelAnalysisResult,),
+        ),
+    ),
+)
 
 builder.add_edge(START,"parse_excel")
 builder.add_edge("parse_excel","ai_analyze")
 builder.add_edge("ai_analyze",END)
 
-graph = builder.compile(name="pro-research-excel")
\ No newline at end of file
+graph = instrument_graph(
+    builder.compile(name="pro-research-excel", checkpointer=get_checkpointer()),
+    "excelAgent",
+)
\ No newline at end of file
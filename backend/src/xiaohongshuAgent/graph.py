@@ -1,6 +1,8 @@
-import os
 from typing import Any
-from langchain_deepseek import ChatDeepSeek
+from agent.clients import DEEPSEEK, get_chat_model
+from agent.checkpoint import get_checkpointer
+from agent.replay import require_env
+from agent.metrics import instrument_graph
 from langgraph.graph import START, END, StateGraph
 from langchain_core.messages import AIMessage
 import pysrt
@@ -19,22 +21,18 @@ from xiaohongshuAgent.tools_and_schemas import TopicStruct
 from contentAgent.utils_state import persistence
 
 # 环境变量检查
-if os.getenv("DeepSeek_API_KEY") is None:
-    raise ValueError("DeepSeek_API_KEY 环境变量未设置")
+require_env("DeepSeek_API_KEY", "DeepSeek_API_KEY 环境变量未设置")
 
 
 def generate_topic(state:ContentState)->ContentState:
     """生成选题"""
     try:
-        llm = ChatDeepSeek(
-            model="deepseek-chat",
-            temperature=0.85,
-            api_key=os.getenv("DeepSeek_API_KEY")
+        structured_llm = get_chat_model(
+            DEEPSEEK, "deepseek-chat", temperature=0.85, schema=TopicStruct
         )
-        structured_llm = llm.with_structured_output(TopicStruct)
-        prompt = xiaohongshu_topic_prompt
+        prompt = xiaohongshu_topic_prompt.format()
         print("选题prompt = ",prompt)
-        result = structured_llm.invoke(prompt)
+        result = structured_llm.invoke(prompt, config=xiaohongshu_topic_prompt.config)
         print("✓ 选题生成完成",str(result))
         # 假设返回的是多个标题，处理为列表
         if not hasattr(result, "topics") or not result.topics:
@@ -55,16 +53,12 @@ def generate_topic(state:ContentState)->ContentState:
 def generate_article(state:ContentState)->ContentState:
     """根绝选题生成文章"""
     try:
-        llm = ChatDeepSeek(
-            model="deepseek-chat",
-            temperature=0.85,
-            api_key=os.getenv("DeepSeek_API_KEY")
-        )
+        llm = get_chat_model(DEEPSEEK, "deepseek-chat", temperature=0.85)
         print("开始生成文章：",str(state))
         # structured_llm = llm.with_structured_output(TopicStruct)
         prompt = xiaohongshu_article_prompt.format(topic=state["selected_topic"])
         print("文章prompt = ",prompt)
-        result = llm.invoke(prompt)
+        result = llm.invoke(prompt, config=xiaohongshu_article_prompt.config)
         print("✓ 文章生成完成",result)
         state["article"] = result.content if hasattr(result, 'content') else str(result)
         state["messages"] = AIMessage(content=result.content)
@@ -116,6 +110,10 @@ def build_graph()->Any:
     builder.add_edge("generate_article", "save_conversation_state")
     builder.add_edge("save_conversation_state", END)
 
-    return builder.compile(name="pro-xiaohongshu-content",interrupt_after=["generate_topic"])
+    return builder.compile(
+        name="pro-xiaohongshu-content",
+        interrupt_after=["generate_topic"],
+        checkpointer=get_checkpointer(),
+    )
 # 编译图
-graph = build_graph()
\ No newline at end of file
+graph = instrument_graph(build_graph(), "xiaohongshuAgent")
\ No newline at end of file
@@ -1,4 +1,6 @@
-xiaohongshu_article_prompt = """
+from agent.prompt_cache import CachedPrompt
+
+xiaohongshu_article_prompt = CachedPrompt("xiaohongshuAgent.xiaohongshu_article_prompt", """
 你是一位长期经营干海产品的小红书博主，只卖【海米】，
 对海米及相关食材的使用非常熟悉。
 
@@ -17,10 +19,10 @@ xiaohongshu_article_prompt = """
 
 选题：
 {topic}
-"""
+""")
 
 
-xiaohongshu_article_prompt2="""
+xiaohongshu_article_prompt2 = CachedPrompt("xiaohongshuAgent.xiaohongshu_article_prompt2", """
 # Role
 你是一位专注高品质海米的真实经营者。你的文字不带推销味，而是一个对食材有“洁癖”和“怪癖”的生活家。
 
@@ -39,9 +41,9 @@ xiaohongshu_article_prompt2="""
 不准出现：价格、链接、私信、正宗、推荐、质量、性价比。
 
 选题：{topic}
-"""
+""")
 
-xiaohongshu_topic_prompt="""
+xiaohongshu_topic_prompt = CachedPrompt("xiaohongshuAgent.xiaohongshu_topic_prompt", """
 你是一名专门为「小红书带货账号」策划内容选题的编辑型智能体，
 账号只销售一种产品：干海产品【海米】。
 
@@ -121,4 +123,4 @@ xiaohongshu_topic_prompt="""
 - 选题 3：……
 
 
-"""
\ No newline at end of file
+""")
\ No newline at end of file
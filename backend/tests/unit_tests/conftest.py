@@ -0,0 +1,10 @@
+"""Shared setup for the unit tests.
+
+The agent graphs check their provider keys at import time; the unit tests
+never reach a provider, so placeholder keys are enough.
+"""
+
+import os
+
+for _name in ("GEMINI_API_KEY", "DeepSeek_API_KEY", "YUNWU_BASE_URL", "YUNWU_API_KEY"):
+    os.environ.setdefault(_name, "unused")
@@ -0,0 +1,87 @@
+import time
+
+from langgraph.types import Send
+
+from agent.configuration import Configuration
+from agent.graph import _budget_fan_out, evaluate_research
+
+FOLLOW_UPS = ["first follow up", "second follow up", "third follow up"]
+
+
+def _state(**overrides) -> dict:
+    state = {
+        "is_sufficient": False,
+        "follow_up_queries": FOLLOW_UPS,
+        "research_loop_count": 1,
+        "number_of_ran_queries": 3,
+        # Spend of earlier runs of the thread, excluded from this run's budgets
+        "tokens_used": 50_000,
+        "web_searches_used": 10,
+        "budget_start": {
+            "started_at": time.time(),
+            "tokens_used": 50_000,
+            "web_searches_used": 10,
+            "research_loop_count": 0,
+        },
+    }
+    state.update(overrides)
+    return state
+
+
+def _config(**configurable) -> dict:
+    return {"configurable": {"max_research_loops": 3, **configurable}}
+
+
+def _searched(route) -> list:
+    if route == "finalize_answer":
+        return []
+    assert all(isinstance(send, Send) for send in route)
+    return [send.arg["search_query"] for send in route]
+
+
+def test_no_budget_runs_every_follow_up():
+    assert _budget_fan_out(_state(), Configuration()) is None
+    assert _searched(evaluate_research(_state(), _config())) == FOLLOW_UPS
+
+
+def test_search_budget_trims_follow_ups_in_priority_order():
+    state = _state(web_searches_used=13)
+    assert _searched(evaluate_research(state, _config(max_web_searches=5))) == [
+        "first follow up",
+        "second follow up",
+    ]
+
+
+def test_exhausted_search_budget_finalizes():
+    state = _state(web_searches_used=15)
+    assert evaluate_research(state, _config(max_web_searches=5)) == "finalize_answer"
+
+
+def test_token_budget_keeps_one_search_for_the_answer():
+    # 3 searches used 3000 tokens: room for 3 more, one of them kept for the answer
+    state = _state(web_searches_used=13, tokens_used=53_000)
+    configurable = Configuration(max_total_tokens=6000)
+    assert _budget_fan_out(state, configurable) == 2
+
+    configurable = Configuration(max_total_tokens=4000)
+    assert _budget_fan_out(state, configurable) == 0
+    assert evaluate_research(state, _config(max_total_tokens=4000)) == "finalize_answer"
+
+
+def test_smallest_budget_wins():
+    state = _state(web_searches_used=13, tokens_used=53_000)
+    configurable = Configuration(max_total_tokens=6000, max_web_searches=4)
+    assert _budget_fan_out(state, configurable) == 1
+
+
+def test_time_budget_stops_when_another_round_would_overrun():
+    # One round took 10s; another round plus the answer would end at about 30s
+    start = {"started_at": time.time() - 10, "research_loop_count": 0}
+    state = _state(budget_start=start)
+    assert evaluate_research(state, _config(max_run_seconds=25)) == "finalize_answer"
+    assert _searched(evaluate_research(state, _config(max_run_seconds=60))) == FOLLOW_UPS
+
+
+def test_new_ids_continue_after_the_queries_already_run():
+    route = evaluate_research(_state(), _config(max_web_searches=100))
+    assert [send.arg["id"] for send in route] == [3, 4, 5]
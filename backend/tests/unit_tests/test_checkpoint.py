@@ -0,0 +1,173 @@
+import operator
+import sqlite3
+import time
+from typing import Annotated, List
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.graph import END, START, StateGraph
+from typing_extensions import TypedDict
+
+from agent.checkpoint import (
+    CheckpointWriteError,
+    SQLiteCheckpointSaver,
+    resume_run,
+    run_status,
+)
+
+
+@pytest.fixture
+def saver(tmp_path):
+    saver = SQLiteCheckpointSaver(
+        str(tmp_path / "checkpoints.sqlite3"), flush_seconds=0.01, retry_seconds=0.01
+    )
+    yield saver
+    saver.close()
+
+
+def _config(thread_id: str = "t", checkpoint_id: str = None) -> dict:
+    configurable = {"thread_id": thread_id, "checkpoint_ns": ""}
+    if checkpoint_id:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+
+def _put(saver: SQLiteCheckpointSaver, thread_id: str = "t", parent: str = None) -> str:
+    checkpoint = empty_checkpoint()
+    saver.put(_config(thread_id, parent), checkpoint, {"step": 0}, {})
+    return checkpoint["id"]
+
+
+def test_put_then_get_and_list(saver):
+    first = _put(saver)
+    second = _put(saver, parent=first)
+    saver.put_writes(_config(checkpoint_id=second), [("steps", ["a"])], "task-1")
+
+    latest = saver.get_tuple(_config())
+    assert latest.config["configurable"]["checkpoint_id"] == second
+    assert latest.parent_config["configurable"]["checkpoint_id"] == first
+    assert latest.metadata["step"] == 0
+    assert latest.pending_writes == [("task-1", "steps", ["a"])]
+
+    assert saver.get_tuple(_config(checkpoint_id=first)).checkpoint["id"] == first
+    assert [c.checkpoint["id"] for c in saver.list(_config())] == [second, first]
+    assert saver.get_tuple(_config("other")) is None
+
+
+def test_reopened_database_keeps_checkpoints(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite3")
+    saver = SQLiteCheckpointSaver(path)
+    checkpoint_id = _put(saver)
+    saver.close()
+
+    reopened = SQLiteCheckpointSaver(path)
+    try:
+        assert reopened.get_tuple(_config()).checkpoint["id"] == checkpoint_id
+    finally:
+        reopened.close()
+
+
+def test_prune_keeps_newest_per_thread(tmp_path):
+    saver = SQLiteCheckpointSaver(
+        str(tmp_path / "checkpoints.sqlite3"), keep_per_thread=2
+    )
+    try:
+        ids = [_put(saver) for _ in range(5)]
+        other = _put(saver, "other")
+        saver.prune()
+        assert [c.checkpoint["id"] for c in saver.list(_config())] == ids[:-3:-1]
+        assert [c.checkpoint["id"] for c in saver.list(_config("other"))] == [other]
+    finally:
+        saver.close()
+
+
+def test_delete_thread(saver):
+    _put(saver)
+    _put(saver, "other")
+    saver.delete_thread("t")
+    assert saver.get_tuple(_config()) is None
+    assert saver.get_tuple(_config("other")) is not None
+
+
+class _State(TypedDict):
+    steps: Annotated[List[str], operator.add]
+
+
+def test_resume_run_skips_completed_nodes(saver):
+    calls = {"a": 0, "b": 0}
+
+    def a(state: _State) -> dict:
+        calls["a"] += 1
+        return {"steps": ["a"]}
+
+    def b(state: _State) -> dict:
+        calls["b"] += 1
+        if calls["b"] == 1:
+            raise RuntimeError("provider down")
+        return {"steps": ["b"]}
+
+    builder = StateGraph(_State)
+    builder.add_node("a", a)
+    builder.add_node("b", b)
+    builder.add_edge(START, "a")
+    builder.add_edge("a", "b")
+    builder.add_edge("b", END)
+    graph = builder.compile(checkpointer=saver)
+    config = _config("run")
+
+    with pytest.raises(RuntimeError, match="provider down"):
+        graph.invoke({"steps": []}, config)
+    status = run_status(graph, config)
+    assert status["next"] == ["b"]
+    assert "provider down" in repr(status["failed"]["b"])
+
+    assert resume_run(graph, config) == {"steps": ["a", "b"]}
+    assert calls == {"a": 1, "b": 2}
+    assert run_status(graph, config)["next"] == []
+    with pytest.raises(ValueError, match="nothing to resume"):
+        resume_run(graph, config)
+
+
+def test_failed_writes_raise_until_retried(saver):
+    commit = saver._commit
+    failing = {"on": True}
+
+    def flaky_commit(batch):
+        if failing["on"]:
+            raise sqlite3.OperationalError("disk I/O error")
+        commit(batch)
+
+    saver._commit = flaky_commit
+    checkpoint_id = _put(saver)
+    with pytest.raises(CheckpointWriteError, match="disk I/O error"):
+        saver.flush()
+    with pytest.raises(CheckpointWriteError):
+        _put(saver)
+    with pytest.raises(CheckpointWriteError):
+        saver.get_tuple(_config())
+
+    failing["on"] = False
+    # The failed batch is retried, so the queued checkpoint is not lost
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            saver.flush()
+            break
+        except CheckpointWriteError:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    assert saver.get_tuple(_config()).checkpoint["id"] == checkpoint_id
+
+
+def test_close_raises_when_writes_are_lost(tmp_path):
+    saver = SQLiteCheckpointSaver(
+        str(tmp_path / "checkpoints.sqlite3"), flush_seconds=10
+    )
+
+    def failing_commit(batch):
+        raise sqlite3.OperationalError("database is locked")
+
+    saver._commit = failing_commit
+    _put(saver)
+    with pytest.raises(CheckpointWriteError, match="were lost"):
+        saver.close()
@@ -0,0 +1,39 @@
+import pydantic
+import pytest
+
+from agent.configuration import Configuration
+
+
+def _config(**configurable) -> dict:
+    return {"configurable": {"thread_id": "t", **configurable}}
+
+
+def test_runs_with_the_same_settings_share_an_instance():
+    first = Configuration.from_runnable_config(_config(max_research_loops=4))
+    # Thread ids and other non-field keys do not matter
+    second = Configuration.from_runnable_config(
+        {"configurable": {"max_research_loops": 4, "thread_id": "other"}}
+    )
+    assert first is second
+    assert first.max_research_loops == 4
+    assert Configuration.from_runnable_config(_config()).max_research_loops == 2
+
+
+def test_environment_changes_are_seen(monkeypatch):
+    config = _config(max_research_loops=4)
+    assert Configuration.from_runnable_config(config).max_research_loops == 4
+    monkeypatch.setenv("MAX_RESEARCH_LOOPS", "7")
+    assert Configuration.from_runnable_config(config).max_research_loops == 7
+    monkeypatch.setenv("MAX_RESEARCH_LOOPS", "8")
+    assert Configuration.from_runnable_config(config).max_research_loops == 8
+    monkeypatch.delenv("MAX_RESEARCH_LOOPS")
+    assert Configuration.from_runnable_config(config).max_research_loops == 4
+
+
+def test_instances_are_frozen():
+    configuration = Configuration.from_runnable_config(_config())
+    with pytest.raises(pydantic.ValidationError):
+        configuration.max_research_loops = 9
+    changed = configuration.model_copy(update={"max_research_loops": 9})
+    assert changed.max_research_loops == 9
+    assert Configuration.from_runnable_config(_config()).max_research_loops == 2
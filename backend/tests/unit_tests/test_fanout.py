@@ -0,0 +1,186 @@
+import pytest
+from langgraph.graph import END, START, StateGraph
+
+from agent import fanout
+from agent.configuration import Configuration
+from agent.fanout import FOLLOW_UP, INITIAL, decide_fan_out, run_decisions, source_gain
+from agent.graph import _reflection_update, evaluate_research
+from agent.hedging import latency_tracker
+from agent.rate_limit import RateLimit, RateLimiter, RateLimitSettings
+from agent.state import OverallState
+from agent.tools_and_schemas import Reflection
+
+
+@pytest.fixture(autouse=True)
+def free_rate_limiter(monkeypatch):
+    limiter = RateLimiter(RateLimitSettings(default=RateLimit(max_concurrency=16)))
+    monkeypatch.setattr(fanout, "rate_limiter", limiter)
+    return limiter
+
+
+def _configurable(model: str, **overrides) -> Configuration:
+    return Configuration(
+        query_generator_model=model,
+        adaptive_fan_out=True,
+        max_fan_out=5,
+        fan_out_latency_slack=0.5,
+        fan_out_min_source_gain=1.0,
+        **overrides,
+    )
+
+
+def _record(model: str, latencies: list) -> None:
+    for seconds in latencies:
+        latency_tracker.record(model, seconds)
+
+
+def _store(uris: int) -> dict:
+    return {"uris": {f"https://example.com/{i}": f"[{i}]" for i in range(uris)}}
+
+
+def test_initial_round_keeps_requested_without_latency_data():
+    decision = decide_fan_out(INITIAL, 3, {}, _configurable("fanout-no-data"))
+    assert decision["width"] == 3
+    assert decision["limited_by"] == "requested"
+    assert decision["median_latency_seconds"] is None
+
+
+def test_tight_latency_widens_to_max_fan_out():
+    model = "fanout-tight"
+    _record(model, [1.0] * 100)
+    decision = decide_fan_out(INITIAL, 3, {}, _configurable(model))
+    assert decision["width"] == 5
+    assert decision["limited_by"] == "max_fan_out"
+    assert decision["latency_width"] == 5
+
+
+def test_latency_spread_narrows_the_round():
+    model = "fanout-spread"
+    # Median 1s; a third of the searches take 3s, beyond the 1.5s slack
+    _record(model, [1.0] * 50 + [1.4] * 20 + [3.0] * 30)
+    decision = decide_fan_out(INITIAL, 3, {}, _configurable(model))
+    assert decision["width"] == 2
+    assert decision["limited_by"] == "latency"
+    assert decision["median_latency_seconds"] == 1.0
+
+
+def test_rate_limit_headroom_caps_the_round(monkeypatch):
+    limiter = RateLimiter(RateLimitSettings(default=RateLimit(max_concurrency=2)))
+    monkeypatch.setattr(fanout, "rate_limiter", limiter)
+    decision = decide_fan_out(FOLLOW_UP, 4, {}, _configurable("fanout-limited"))
+    assert decision["width"] == 2
+    assert decision["limited_by"] == "rate_limit"
+    assert decision["rate_limit_headroom"] == 2
+
+
+def test_low_source_gain_narrows_follow_ups():
+    previous = {"width": 4, "unique_uris": 2}
+    state = {
+        "fan_out": [previous],
+        "budget_start": {"fan_out_decisions": 0},
+        # Two new sources from four searches
+        "source_store": _store(4),
+        "research_loop_count": 1,
+    }
+    assert source_gain(state) == 0.5
+    decision = decide_fan_out(FOLLOW_UP, 5, state, _configurable("fanout-gain"))
+    assert decision["width"] == 2
+    assert decision["limited_by"] == "source_gain"
+    assert decision["unique_uris"] == 4
+    assert decision["loop"] == 1
+
+
+def test_source_gain_ignores_decisions_of_earlier_turns():
+    earlier_turn = {"width": 5, "unique_uris": 10}
+    state = {
+        "fan_out": [earlier_turn],
+        "budget_start": {"fan_out_decisions": 1},
+        "source_store": _store(10),
+    }
+    assert run_decisions(state) == []
+    assert source_gain(state) is None
+    decision = decide_fan_out(FOLLOW_UP, 3, state, _configurable("fanout-turns"))
+    assert decision["width"] == 3
+    assert decision["limited_by"] == "requested"
+
+    # Without the run's start marker no decision counts as the run's own
+    assert run_decisions({"fan_out": [earlier_turn]}) == []
+
+
+def _reflection_state(loop: int, **extra) -> dict:
+    return {
+        "messages": [],
+        "search_query": ["first query"],
+        "web_research_result": ["result"],
+        "research_loop_count": loop,
+        "source_store": _store(1),
+        **extra,
+    }
+
+
+def _reflection(queries: list) -> Reflection:
+    return Reflection(
+        is_sufficient=False, knowledge_gap="gap", follow_up_queries=queries
+    )
+
+
+def test_reflection_decides_only_while_loops_are_left():
+    config = {
+        "configurable": {
+            "query_generator_model": "fanout-loops",
+            "adaptive_fan_out": True,
+            "max_research_loops": 2,
+        }
+    }
+    queries = ["solar output by year", "wind farm capacity factors"]
+    update = _reflection_update(_reflection_state(1), config, _reflection(queries), "")
+    assert update["fan_out"][0]["stage"] == FOLLOW_UP
+    assert update["follow_up_queries"] == queries
+
+    # The last loop's follow-ups are never searched
+    update = _reflection_update(_reflection_state(2), config, _reflection(queries), "")
+    assert "fan_out" not in update
+
+    # The state's loop limit overrides the configured one
+    state = _reflection_state(2, max_research_loops=3)
+    update = _reflection_update(state, config, _reflection(queries), "")
+    assert "fan_out" in update
+
+
+def _router_graph(searched: list):
+    def reflect(state: OverallState) -> dict:
+        return {
+            "is_sufficient": False,
+            "knowledge_gap": "gap",
+            "follow_up_queries": ["follow up"],
+            "research_loop_count": state["research_loop_count"],
+            "number_of_ran_queries": 1,
+        }
+
+    def web_research(state: dict) -> dict:
+        searched.append(state["search_query"])
+        return {}
+
+    builder = StateGraph(OverallState)
+    builder.add_node("reflect", reflect)
+    builder.add_node("web_research", web_research)
+    builder.add_node("finalize_answer", lambda state: {})
+    builder.add_edge(START, "reflect")
+    builder.add_conditional_edges(
+        "reflect", evaluate_research, ["web_research", "finalize_answer"]
+    )
+    builder.add_edge("web_research", END)
+    builder.add_edge("finalize_answer", END)
+    return builder.compile()
+
+
+def test_router_sees_the_state_loop_limit():
+    searched = []
+    graph = _router_graph(searched)
+    config = {"configurable": {"max_research_loops": 2}}
+    graph.invoke({"messages": [], "research_loop_count": 2}, config)
+    assert searched == []
+    graph.invoke(
+        {"messages": [], "research_loop_count": 2, "max_research_loops": 3}, config
+    )
+    assert searched == ["follow up"]
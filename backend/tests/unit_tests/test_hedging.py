@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agent import hedging
+from agent.hedging import (
+    HedgeTimeout,
+    LatencyTracker,
+    ahedged_call,
+    hedge_counts,
+    hedged_call,
+)
+
+
+def _slow_then_fast(first_seconds: float):
+    """Call whose first attempt takes `first_seconds` and later ones return at once."""
+    attempts = []
+    lock = threading.Lock()
+
+    def call() -> int:
+        with lock:
+            attempt = len(attempts)
+            attempts.append(attempt)
+        if attempt == 0:
+            time.sleep(first_seconds)
+        return attempt
+
+    return call, attempts
+
+
+def test_percentile_needs_min_samples():
+    tracker = LatencyTracker(window=10, min_samples=3)
+    tracker.record("m", 1.0)
+    tracker.record("m", 3.0)
+    assert tracker.percentile("m", 0.5) is None
+    tracker.record("m", 2.0)
+    assert tracker.percentile("m", 0.5) == 2.0
+    assert tracker.percentile("m", 1.0) == 3.0
+    assert tracker.percentile("other", 0.5) is None
+
+
+def test_percentile_uses_the_recent_window():
+    tracker = LatencyTracker(window=3, min_samples=1)
+    for seconds in (10.0, 1.0, 1.0, 1.0):
+        tracker.record("m", seconds)
+    assert tracker.percentile("m", 1.0) == 1.0
+
+
+def test_fast_call_is_not_hedged():
+    call, attempts = _slow_then_fast(0.0)
+    assert hedged_call(call, hedge_after=1.0) == 0
+    assert attempts == [0]
+
+
+def test_hedge_wins_against_a_straggler():
+    won = hedge_counts["hedge_won"]
+    call, attempts = _slow_then_fast(1.0)
+    started = time.monotonic()
+    assert hedged_call(call, hedge_after=0.05) == 1
+    assert time.monotonic() - started < 0.5
+    assert attempts == [0, 1]
+    assert hedge_counts["hedge_won"] == won + 1
+
+
+def test_failed_attempt_waits_for_the_other():
+    attempts = []
+
+    def call() -> str:
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            time.sleep(0.1)
+            raise ValueError("first attempt failed")
+        time.sleep(0.2)
+        return "second"
+
+    assert hedged_call(call, hedge_after=0.01) == "second"
+
+
+def test_error_is_raised_when_no_attempt_is_left():
+    def call() -> None:
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        hedged_call(call, hedge_after=1.0)
+
+
+def test_timeout():
+    with pytest.raises(HedgeTimeout):
+        hedged_call(lambda: time.sleep(1.0), timeout=0.05)
+
+
+def test_async_hedge_cancels_the_loser():
+    cancelled = []
+
+    async def main():
+        attempts = []
+
+        async def call() -> int:
+            attempt = len(attempts)
+            attempts.append(attempt)
+            try:
+                await asyncio.sleep(1.0 if attempt == 0 else 0)
+            except asyncio.CancelledError:
+                cancelled.append(attempt)
+                raise
+            return attempt
+
+        result = await ahedged_call(call, hedge_after=0.05)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == 1
+    assert cancelled == [0]
+
+
+def test_async_timeout():
+    async def main():
+        return await ahedged_call(lambda: asyncio.sleep(1.0), timeout=0.05)
+
+    with pytest.raises(HedgeTimeout):
+        asyncio.run(main())
+
+
+def test_abandoned_is_set_for_the_losing_attempt():
+    abandoned = threading.Event()
+    seen = []
+    release = threading.Event()
+
+    def call() -> str:
+        first = not seen
+        seen.append(first)
+        if first:
+            release.wait(1.0)
+            # A late attempt learns that its result is discarded
+            return "late" if not abandoned.is_set() else "abandoned"
+        return "hedge"
+
+    assert hedged_call(call, hedge_after=0.05, abandoned=abandoned) == "hedge"
+    assert abandoned.is_set()
+    release.set()
+
+
+def test_queued_attempts_are_cancelled(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(hedging, "_executor", pool)
+    calls = []
+
+    def call() -> int:
+        calls.append(1)
+        time.sleep(0.2)
+        return len(calls)
+
+    # The hedge cannot start while the first attempt holds the only worker
+    with pytest.raises(HedgeTimeout):
+        hedged_call(call, hedge_after=0.01, timeout=0.05)
+    pool.shutdown(wait=True)
+    assert calls == [1]
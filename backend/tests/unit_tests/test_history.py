@@ -0,0 +1,143 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent import history
+from agent.configuration import Configuration
+from agent.history import (
+    clear_history_cache,
+    conversation_history,
+    digest_turn,
+    render_turn,
+)
+from agent.utils import estimate_tokens
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_history_cache()
+    yield
+    clear_history_cache()
+
+
+def _messages(turns: int, thread: str = "t") -> list:
+    messages = []
+    for i in range(turns):
+        cls = HumanMessage if i % 2 == 0 else AIMessage
+        content = f"Turn {i} is about topic {i}. " + "filler words " * 5
+        messages.append(cls(content=content, id=f"{thread}-{i}"))
+    return messages
+
+
+def _configurable(window: int = 100, summary: int = 60) -> Configuration:
+    return Configuration(history_window_tokens=window, history_summary_tokens=summary)
+
+
+def _recent(text: str) -> str:
+    return text.split("\nRecent turns:\n", 1)[-1]
+
+
+def test_short_conversations_are_not_bounded():
+    messages = _messages(1)
+    assert conversation_history(messages, _configurable()) == messages[0].content
+    messages = _messages(6)
+    full = "".join(render_turn(message) for message in messages)
+    assert conversation_history(messages, _configurable(window=0)) == full
+    assert conversation_history(messages, _configurable(window=10_000)) == full
+
+
+def test_recent_turns_fit_the_window_and_older_ones_are_digested():
+    messages = _messages(10)
+    text = conversation_history(messages, _configurable(window=100, summary=60))
+    # Each turn is about 25 tokens: three fit the window
+    recent = "".join(render_turn(message) for message in messages[7:])
+    assert estimate_tokens(recent) <= 100
+    assert text == (
+        "Summary of earlier turns:\n"
+        "- (1 earlier turns omitted)\n"
+        + "".join(digest_turn(render_turn(message)) for message in messages[1:7])
+        + "\nRecent turns:\n"
+        + recent
+    )
+
+
+def test_latest_turn_stays_even_when_it_exceeds_the_window():
+    messages = _messages(3)
+    text = conversation_history(messages, _configurable(window=10))
+    assert _recent(text) == render_turn(messages[-1])
+
+
+def test_digest_summary_is_capped_and_counts_omitted_turns():
+    messages = _messages(30)
+    text = conversation_history(messages, _configurable(window=60, summary=30))
+    summary, recent = text.split("\nRecent turns:\n", 1)
+    digests = [digest_turn(render_turn(message)) for message in messages[26:28]]
+    assert sum(map(estimate_tokens, digests)) <= 30
+    assert summary == (
+        "Summary of earlier turns:\n- (26 earlier turns omitted)\n" + "".join(digests)
+    )
+    assert recent == "".join(render_turn(message) for message in messages[28:])
+
+
+def test_appended_turns_are_processed_incrementally(monkeypatch):
+    rendered = []
+
+    def counting_render(message):
+        rendered.append(message.id)
+        return render_turn(message)
+
+    monkeypatch.setattr(history, "render_turn", counting_render)
+    messages = _messages(12)
+    configurable = _configurable()
+
+    conversation_history(messages[:10], configurable)
+    assert len(rendered) == 10
+    rendered.clear()
+
+    # Later nodes of the same run reuse the window
+    conversation_history(messages[:10], configurable)
+    assert rendered == []
+
+    incremental = conversation_history(messages, configurable)
+    assert rendered == ["t-10", "t-11"]
+
+    clear_history_cache()
+    assert conversation_history(messages, configurable) == incremental
+
+
+def test_edited_history_is_rebuilt():
+    messages = _messages(8)
+    configurable = _configurable()
+    conversation_history(messages, configurable)
+    # Same thread and length, but the last turns were regenerated
+    edited = messages[:6] + [
+        HumanMessage(content="A different question.", id="new-6"),
+        AIMessage(content="A different answer.", id="new-7"),
+    ]
+    text = conversation_history(edited, configurable)
+    assert text.endswith(
+        "User: A different question.\nAssistant: A different answer.\n"
+    )
+    clear_history_cache()
+    assert conversation_history(edited, configurable) == text
+
+
+def test_changed_budget_is_rebuilt():
+    messages = _messages(10)
+    small = conversation_history(messages, _configurable(window=60))
+    large = conversation_history(messages, _configurable(window=300))
+    assert small != large
+    clear_history_cache()
+    assert conversation_history(messages, _configurable(window=300)) == large
+
+
+def test_least_recently_used_thread_is_evicted(monkeypatch):
+    monkeypatch.setattr(history, "MAX_THREADS", 2)
+    configurable = _configurable()
+    for thread in ("a", "b", "a", "c"):
+        conversation_history(_messages(4, thread), configurable)
+    assert list(history._windows) == ["a-0", "c-0"]
+
+
+def test_digest_turn_keeps_the_first_sentence_within_the_word_limit():
+    assert digest_turn("User: Solar grew.  Wind fell.\n") == "- User: Solar grew.\n"
+    assert digest_turn("User: " + "word " * 10, words=3) == "- User: word word …\n"
@@ -0,0 +1,196 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.node_cache import (
+    MemoryNodeCache,
+    NodeCachePolicy,
+    cached_node,
+    clear_node_cache,
+    node_cache_key,
+)
+
+POLICY = NodeCachePolicy(
+    inputs=("messages",),
+    outputs=("messages", "answer"),
+    params=lambda state, config: (config or {}).get("configurable", {}).get("model"),
+)
+
+
+@pytest.fixture(autouse=True)
+def memory_cache(monkeypatch):
+    monkeypatch.setenv("NODE_CACHE", "memory")
+    monkeypatch.delenv("NODE_CACHE_VERSION", raising=False)
+    clear_node_cache()
+    yield
+    clear_node_cache()
+
+
+def _state(question: str = "why?") -> dict:
+    return {"messages": [HumanMessage(content=question)]}
+
+
+def _config(model: str = "m1") -> dict:
+    return {"configurable": {"model": model}}
+
+
+def _counting_node(calls: list):
+    def answer(state: dict) -> dict:
+        calls.append(state["messages"][-1].content)
+        return {
+            "messages": [AIMessage(content=f"answer {len(calls)}")],
+            "answer": f"answer {len(calls)}",
+        }
+
+    return answer
+
+
+def _helper_v1() -> str:
+    return "prompt v1"
+
+
+def _helper_v2() -> str:
+    return "prompt v2"
+
+
+def test_key_ignores_message_ids_but_not_content():
+    first = {"messages": [HumanMessage(content="why?", id="1")]}
+    second = {"messages": [HumanMessage(content="why?", id="2")]}
+    other = {"messages": [HumanMessage(content="how?", id="1")]}
+    key = node_cache_key("ns", POLICY, first, _config())
+    assert node_cache_key("ns", POLICY, second, _config()) == key
+    assert node_cache_key("ns", POLICY, other, _config()) != key
+    assert node_cache_key("ns", POLICY, first, _config("m2")) != key
+    assert node_cache_key("other", POLICY, first, _config()) != key
+
+
+def test_hit_skips_the_node_and_gets_new_message_ids():
+    calls = []
+    node = cached_node("answer", _counting_node(calls), POLICY)
+    first = node.invoke(_state(), _config())
+    second = node.invoke(_state(), _config())
+    assert calls == ["why?"]
+    assert second["answer"] == first["answer"] == "answer 1"
+    assert second["messages"][0].content == first["messages"][0].content
+    assert second["messages"][0].id != first["messages"][0].id
+
+    node.invoke(_state("how?"), _config())
+    node.invoke(_state(), _config("m2"))
+    assert calls == ["why?", "how?", "why?"]
+
+
+def test_incomplete_updates_are_not_cached():
+    calls = []
+
+    def failing(state: dict) -> dict:
+        calls.append(1)
+        return {"messages": [AIMessage(content="error")]}
+
+    node = cached_node("answer", failing, POLICY)
+    node.invoke(_state(), _config())
+    node.invoke(_state(), _config())
+    assert len(calls) == 2
+
+
+def test_failure_returning_the_input_state_is_not_cached():
+    calls = []
+    fail = {"on": True}
+
+    def storyboard(state: dict) -> dict:
+        # Like the content nodes: errors are caught and the state is returned as is
+        calls.append(state["outline"])
+        if not fail["on"]:
+            state["storyBoard"] = [f"panel for {state['outline']}"]
+            state["messages"] = AIMessage(content="storyboard")
+        return state
+
+    policy = NodeCachePolicy(inputs=("outline",), outputs=("storyBoard", "messages"))
+    node = cached_node("generate_storyboard", storyboard, policy)
+
+    def earlier_turn() -> dict:
+        return {
+            "outline": "new",
+            "storyBoard": ["OLD"],
+            "messages": [HumanMessage(content="draw it")],
+        }
+
+    assert node.invoke(earlier_turn())["storyBoard"] == ["OLD"]
+    assert node.invoke(earlier_turn())["storyBoard"] == ["OLD"]
+    assert calls == ["new", "new"]
+
+    fail["on"] = False
+    assert node.invoke(earlier_turn())["storyBoard"] == ["panel for new"]
+    cached = node.invoke(earlier_turn())
+    assert set(cached) == {"storyBoard", "messages"}
+    assert cached["storyBoard"] == ["panel for new"]
+    assert calls == ["new", "new", "new"]
+
+
+def test_helper_source_and_version_invalidate(monkeypatch):
+    calls = []
+    func = _counting_node(calls)
+    v1 = NodeCachePolicy(
+        inputs=POLICY.inputs, outputs=POLICY.outputs, depends_on=(_helper_v1,)
+    )
+    v2 = NodeCachePolicy(
+        inputs=POLICY.inputs, outputs=POLICY.outputs, depends_on=(_helper_v2,)
+    )
+    cached_node("answer", func, v1).invoke(_state())
+    cached_node("answer", func, v1).invoke(_state())
+    assert len(calls) == 1
+    cached_node("answer", func, v2).invoke(_state())
+    assert len(calls) == 2
+
+    monkeypatch.setenv("NODE_CACHE_VERSION", "deploy-2")
+    cached_node("answer", func, v1).invoke(_state())
+    assert len(calls) == 3
+
+
+def test_disabled_cache_always_runs(monkeypatch):
+    monkeypatch.setenv("NODE_CACHE", "off")
+    clear_node_cache()
+    calls = []
+    node = cached_node("answer", _counting_node(calls), POLICY)
+    node.invoke(_state(), _config())
+    node.invoke(_state(), _config())
+    assert len(calls) == 2
+
+
+def test_sqlite_cache_is_used_by_the_async_node(monkeypatch, tmp_path):
+    monkeypatch.setenv("NODE_CACHE", "sqlite")
+    monkeypatch.setenv("NODE_CACHE_PATH", str(tmp_path / "node_cache.sqlite3"))
+    clear_node_cache()
+    calls = []
+    func = _counting_node(calls)
+
+    async def afunc(state: dict) -> dict:
+        return func(state)
+
+    node = cached_node("answer", func, POLICY, afunc=afunc)
+
+    async def main():
+        first = await node.ainvoke(_state(), _config())
+        second = await node.ainvoke(_state(), _config())
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert len(calls) == 1
+    assert second["messages"][0].id != first["messages"][0].id
+
+    # A new cache instance, like another worker process, reads the same file
+    clear_node_cache()
+    node.invoke(_state(), _config())
+    assert len(calls) == 1
+
+
+def test_memory_cache_expires_and_evicts():
+    cache = MemoryNodeCache(ttl_seconds=60, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"answer": key})
+    assert cache.get("a") is None
+    assert cache.get("c") == {"answer": "c"}
+
+    expired = MemoryNodeCache(ttl_seconds=-1, max_entries=2)
+    expired.set("a", {"answer": "a"})
+    assert expired.get("a") is None
@@ -0,0 +1,201 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import agent.graph as graph
+from agent.graph import _Pipeline
+
+
+def _state(queries: list, **extra) -> dict:
+    return {"messages": [], "search_query": list(queries), **extra}
+
+
+def _config(**configurable) -> dict:
+    return {
+        "configurable": {
+            "max_research_loops": 3,
+            "pipelined_reflection_quorum": 0.5,
+            **configurable,
+        }
+    }
+
+
+def _result(query: str) -> dict:
+    return {"web_research_result": [f"result {query}"], "web_searches_used": 1}
+
+
+def _reflection(snapshot: dict, follow_ups: list, sufficient: bool = False) -> dict:
+    return {
+        "is_sufficient": sufficient,
+        "knowledge_gap": "gap",
+        "follow_up_queries": follow_ups,
+        "research_loop_count": (snapshot.get("research_loop_count") or 0) + 1,
+        "number_of_ran_queries": len(snapshot["search_query"]),
+    }
+
+
+def _queries(branches: list) -> list:
+    return [branch["search_query"] for branch in branches]
+
+
+def test_reflects_once_the_quorum_has_returned():
+    pipeline = _Pipeline(_state(["a", "b", "c", "d"]), _config())
+    branches = pipeline.take_branches()
+    assert [branch["id"] for branch in branches] == [0, 1, 2, 3]
+    assert not pipeline.reflection_due()
+
+    pipeline.add_result(_result("a"))
+    assert not pipeline.reflection_due()
+    pipeline.add_result(_result("b"))
+    assert pipeline.reflection_due()
+
+    snapshot = pipeline.start_reflection()
+    assert snapshot["web_research_result"] == ["result a", "result b"]
+    assert not pipeline.reflection_due()
+    pipeline.add_reflection(snapshot, _reflection(snapshot, ["e"]))
+    follow_ups = pipeline.take_branches()
+    assert follow_ups == [{"search_query": "e", "id": 4}]
+    assert pipeline.in_flight == 3
+
+
+def test_late_results_are_folded_in_and_the_last_loop_waits_for_all():
+    pipeline = _Pipeline(_state(["a", "b"]), _config(max_research_loops=2))
+    pipeline.take_branches()
+    pipeline.add_result(_result("a"))
+    snapshot = pipeline.start_reflection()
+    # "b" returns while the first reflection runs
+    pipeline.add_result(_result("b"))
+    pipeline.add_reflection(snapshot, _reflection(snapshot, ["c"]))
+    assert _queries(pipeline.take_branches()) == ["c"]
+
+    # The second reflection is the last one, so it waits for "c"
+    assert not pipeline.reflection_due()
+    pipeline.add_result(_result("c"))
+    assert pipeline.reflection_due()
+    snapshot = pipeline.start_reflection()
+    assert len(snapshot["web_research_result"]) == 3
+    pipeline.add_reflection(snapshot, _reflection(snapshot, ["d"]))
+
+    # Its follow-ups are not searched, as in the 'rounds' mode
+    assert pipeline.take_branches() == []
+    assert pipeline.stopped
+    assert pipeline.update["research_loop_count"] == 2
+    assert pipeline.update["web_research_result"] == [
+        "result a",
+        "result b",
+        "result c",
+    ]
+
+
+def test_single_loop_still_reflects():
+    pipeline = _Pipeline(_state(["a", "b"]), _config(max_research_loops=1))
+    pipeline.take_branches()
+    pipeline.add_result(_result("a"))
+    assert not pipeline.reflection_due()
+    pipeline.add_result(_result("b"))
+    assert pipeline.reflection_due()
+    snapshot = pipeline.start_reflection()
+    pipeline.add_reflection(snapshot, _reflection(snapshot, ["c"]))
+    assert pipeline.take_branches() == []
+    assert pipeline.update["research_loop_count"] == 1
+    assert pipeline.update["is_sufficient"] is False
+    assert pipeline.update["knowledge_gap"] == "gap"
+
+
+def test_sufficient_results_stop_searching():
+    pipeline = _Pipeline(_state(["a", "b", "c"]), _config(max_research_loops=5))
+    pipeline.take_branches()
+    pipeline.add_result(_result("a"))
+    pipeline.add_result(_result("b"))
+    snapshot = pipeline.start_reflection()
+    pipeline.add_reflection(snapshot, _reflection(snapshot, ["d"], sufficient=True))
+    assert pipeline.take_branches() == []
+
+    # The search still in flight reaches the answer, without another reflection
+    pipeline.add_result(_result("c"))
+    assert not pipeline.reflection_due()
+    assert pipeline.update["is_sufficient"] is True
+    assert len(pipeline.update["web_research_result"]) == 3
+
+
+def test_duplicate_follow_ups_stop_searching():
+    pipeline = _Pipeline(_state(["a"]), _config())
+    pipeline.take_branches()
+    pipeline.add_result(_result("a"))
+    snapshot = pipeline.start_reflection()
+    # _reflection_update drops follow-ups that duplicate earlier queries
+    pipeline.add_reflection(snapshot, _reflection(snapshot, []))
+    assert pipeline.stopped
+    assert pipeline.take_branches() == []
+
+
+@pytest.mark.parametrize(
+    "max_web_searches, follow_ups", [(3, ["c"]), (2, [])]
+)
+def test_budget_cuts_the_follow_ups(max_web_searches, follow_ups):
+    pipeline = _Pipeline(
+        _state(["a", "b"], budget_start={"web_searches_used": 0}),
+        _config(max_web_searches=max_web_searches),
+    )
+    pipeline.take_branches()
+    pipeline.add_result(_result("a"))
+    pipeline.add_result(_result("b"))
+    snapshot = pipeline.start_reflection()
+    pipeline.add_reflection(snapshot, _reflection(snapshot, ["c", "d"]))
+    assert _queries(pipeline.take_branches()) == follow_ups
+    assert pipeline.stopped == (not follow_ups)
+
+
+def _fake_nodes(monkeypatch, slow: dict):
+    reflected = []
+    lock = threading.Lock()
+
+    def web_research(branch: dict, config: dict) -> dict:
+        time.sleep(slow.get(branch["search_query"], 0))
+        return _result(branch["search_query"])
+
+    def reflection(snapshot: dict, config: dict) -> dict:
+        with lock:
+            reflected.append(len(snapshot["web_research_result"]))
+        loop = (snapshot.get("research_loop_count") or 0) + 1
+        return _reflection(snapshot, [f"follow up {loop}"])
+
+    async def aweb_research(branch: dict, config: dict) -> dict:
+        await asyncio.sleep(slow.get(branch["search_query"], 0))
+        return _result(branch["search_query"])
+
+    async def areflection(snapshot: dict, config: dict) -> dict:
+        return reflection(snapshot, config)
+
+    monkeypatch.setattr(graph, "web_research", web_research)
+    monkeypatch.setattr(graph, "reflection", reflection)
+    monkeypatch.setattr(graph, "aweb_research", aweb_research)
+    monkeypatch.setattr(graph, "areflection", areflection)
+    return reflected
+
+
+@pytest.mark.parametrize("driver", ["sync", "async"])
+def test_driver_does_not_wait_for_a_straggler(monkeypatch, driver):
+    reflected = _fake_nodes(monkeypatch, {"straggler": 0.3})
+    state = _state(["fast", "straggler"])
+    config = _config(max_research_loops=3)
+    started = time.monotonic()
+    if driver == "sync":
+        update = graph.pipelined_research(state, config)
+    else:
+        update = asyncio.run(graph.apipelined_research(state, config))
+    elapsed = time.monotonic() - started
+
+    # The follow-ups ran while the straggler was in flight
+    assert elapsed < 0.6
+    assert reflected[0] == 1
+    assert reflected[-1] == 4
+    assert update["research_loop_count"] == 3
+    assert sorted(update["web_research_result"]) == [
+        "result fast",
+        "result follow up 1",
+        "result follow up 2",
+        "result straggler",
+    ]
@@ -0,0 +1,98 @@
+import pytest
+
+from agent.graph import _query_generation_update, _reflection_update
+from agent.tools_and_schemas import Reflection, SearchQueryList
+from agent.utils import dedupe_queries, query_similarity
+
+
+def test_query_similarity_is_token_jaccard():
+    assert query_similarity("Solar output 2024", "solar OUTPUT, 2024?") == 1.0
+    assert query_similarity("solar output 2024", "solar output 2023") == 0.5
+    assert query_similarity("solar", "wind") == 0.0
+    # Queries without word tokens only match themselves
+    assert query_similarity("??", " ?? ") == 1.0
+    assert query_similarity("??", "!!") == 0.0
+
+
+def test_dedupe_queries_drops_paraphrases_of_seen_queries():
+    kept, skipped = dedupe_queries(
+        ["solar output 2024 worldwide", "wind capacity factors"],
+        ["worldwide solar output 2024"],
+        0.8,
+    )
+    assert kept == ["wind capacity factors"]
+    assert skipped == [
+        {
+            "query": "solar output 2024 worldwide",
+            "similar_to": "worldwide solar output 2024",
+            "similarity": 1.0,
+        }
+    ]
+
+
+def test_dedupe_queries_compares_against_earlier_kept_queries():
+    kept, skipped = dedupe_queries(
+        ["solar output 2024", "Solar output, 2024", "wind output 2024"], [], 0.8
+    )
+    assert kept == ["solar output 2024", "wind output 2024"]
+    assert [record["similar_to"] for record in skipped] == ["solar output 2024"]
+
+
+@pytest.mark.parametrize(
+    ("threshold", "kept"),
+    [
+        (0.5, []),
+        (0.51, ["solar output 2023"]),
+        (1.01, ["solar output 2023"]),
+    ],
+)
+def test_dedupe_queries_threshold_is_inclusive(threshold, kept):
+    # The two queries have a similarity of exactly 0.5
+    result, _ = dedupe_queries(["solar output 2023"], ["solar output 2024"], threshold)
+    assert result == kept
+
+
+def test_generated_queries_skip_queries_of_earlier_turns():
+    state = {"messages": [], "search_query": ["solar output 2024"]}
+    result = SearchQueryList(
+        query=["Solar output 2024?", "wind output 2024"], rationale="r"
+    )
+    update = _query_generation_update(state, {"configurable": {}}, result, "prompt")
+    assert update["search_query"] == ["wind output 2024"]
+    assert update["skipped_queries"][0]["query"] == "Solar output 2024?"
+
+
+def test_generation_searches_once_when_every_query_was_run():
+    state = {"messages": [], "search_query": ["solar output 2024"]}
+    result = SearchQueryList(
+        query=["Solar output 2024", "solar output, 2024"], rationale="r"
+    )
+    update = _query_generation_update(state, {"configurable": {}}, result, "prompt")
+    assert update["search_query"] == ["Solar output 2024"]
+    assert [record["query"] for record in update["skipped_queries"]] == [
+        "solar output, 2024"
+    ]
+
+
+def test_reflection_skips_follow_ups_already_run():
+    state = {
+        "messages": [],
+        "search_query": ["solar output 2024"],
+        "web_research_result": ["result"],
+        "research_loop_count": 1,
+    }
+    result = Reflection(
+        is_sufficient=False,
+        knowledge_gap="gap",
+        follow_up_queries=["solar output 2024", "wind output 2024"],
+    )
+    config = {"configurable": {"query_dedup_threshold": 0.8}}
+    update = _reflection_update(state, config, result, "prompt")
+    assert update["follow_up_queries"] == ["wind output 2024"]
+    assert update["skipped_queries"][0]["similar_to"] == "solar output 2024"
+
+    # A threshold above 1 disables the check
+    config = {"configurable": {"query_dedup_threshold": 1.5}}
+    update = _reflection_update(state, config, result, "prompt")
+    assert update["follow_up_queries"] == result.follow_up_queries
+    assert update["skipped_queries"] == []
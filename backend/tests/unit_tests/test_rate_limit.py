@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.rate_limit import RateLimit, RateLimiter, RateLimitSettings
+
+
+def _limiter(tmp_path=None, **limit) -> RateLimiter:
+    db_path = str(tmp_path / "quota.sqlite3") if tmp_path is not None else None
+    return RateLimiter(RateLimitSettings(default=RateLimit(**limit), db_path=db_path))
+
+
+def test_queue_is_served_in_arrival_order():
+    limiter = _limiter(max_concurrency=1)
+    held = limiter.acquire("m")
+    order = []
+
+    def call(i: int) -> None:
+        with limiter.limit("m"):
+            order.append(i)
+
+    threads = []
+    for i in range(5):
+        thread = threading.Thread(target=call, args=(i,))
+        thread.start()
+        threads.append(thread)
+        # Wait until the thread has queued so arrival order is fixed
+        while limiter.stats()["m"]["queue_depth"] < i + 1:
+            time.sleep(0.001)
+
+    limiter._release(held)
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1, 2, 3, 4]
+    stats = limiter.stats()["m"]
+    assert stats["acquired"] == 6
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+
+
+def test_concurrency_cap_and_release():
+    limiter = _limiter(max_concurrency=2)
+    first = limiter.acquire("m")
+    second = limiter.acquire("m")
+    assert limiter.headroom("m") == 0
+
+    acquired = threading.Event()
+
+    def third() -> None:
+        with limiter.limit("m"):
+            acquired.set()
+
+    thread = threading.Thread(target=third)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter._release(first)
+    assert acquired.wait(5)
+    thread.join(5)
+    limiter._release(second)
+    assert limiter.headroom("m") == 2
+
+
+def test_models_are_limited_separately():
+    limiter = _limiter(max_concurrency=1)
+    with limiter.limit("a"):
+        with limiter.limit("b") as lease:
+            assert lease.model == "b"
+            assert lease.waited < 1
+
+
+def test_requests_per_minute_bucket_waits_for_refill():
+    # 600/min refills one request every 0.1s; the bucket starts full
+    limiter = _limiter(max_concurrency=None, requests_per_minute=600)
+    assert limiter.headroom("m") is None
+    for _ in range(600):
+        limiter._release(limiter.acquire("m"))
+    started = time.monotonic()
+    limiter._release(limiter.acquire("m"))
+    assert time.monotonic() - started >= 0.05
+
+
+def test_per_model_overrides():
+    settings = RateLimitSettings(
+        default=RateLimit(max_concurrency=1),
+        models={"wide": RateLimit(max_concurrency=3)},
+    )
+    limiter = RateLimiter(settings)
+    assert limiter.headroom("narrow") == 1
+    assert limiter.headroom("wide") == 3
+
+
+def test_async_waiters_in_order_and_woken_by_release():
+    limiter = _limiter(max_concurrency=1)
+
+    async def main():
+        held = await limiter.aacquire("m")
+        order = []
+
+        async def call(i: int) -> None:
+            async with limiter.alimit("m"):
+                order.append(i)
+                await asyncio.sleep(0)
+
+        tasks = []
+        for i in range(4):
+            tasks.append(asyncio.create_task(call(i)))
+            await asyncio.sleep(0)
+        assert limiter.stats()["m"]["queue_depth"] == 4
+        await limiter._arelease(held)
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+        return order
+
+    assert asyncio.run(main()) == [0, 1, 2, 3]
+    assert limiter.stats()["m"]["in_flight"] == 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    limiter = _limiter(max_concurrency=1)
+
+    async def main():
+        held = await limiter.aacquire("m")
+        waiter = asyncio.create_task(limiter.aacquire("m"))
+        await asyncio.sleep(0.01)
+        assert limiter.headroom("m") == 0
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await limiter._arelease(held)
+
+    asyncio.run(main())
+    stats = limiter.stats()["m"]
+    assert stats["queue_depth"] == 0
+    assert stats["in_flight"] == 0
+    assert limiter.headroom("m") == 1
+
+
+def test_sqlite_quota_is_shared_between_limiters(tmp_path):
+    first = _limiter(tmp_path, max_concurrency=1)
+    second = _limiter(tmp_path, max_concurrency=1)
+    held = first.acquire("m")
+
+    async def main():
+        return await asyncio.wait_for(second.aacquire("m"), 5)
+
+    def release_later() -> None:
+        time.sleep(0.1)
+        first._release(held)
+
+    thread = threading.Thread(target=release_later)
+    thread.start()
+    lease = asyncio.run(main())
+    thread.join(5)
+    # The other process' release is only seen by polling
+    assert lease.waited >= 0.05
+    second._release(lease)
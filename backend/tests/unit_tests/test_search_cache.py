@@ -0,0 +1,112 @@
+import pytest
+
+from agent import search_cache
+from agent.search_cache import (
+    MemorySearchCache,
+    SQLiteSearchCache,
+    get_search_cache,
+    normalize_query,
+    rekey_short_urls,
+    search_cache_key,
+)
+from agent.sources import source_store
+from agent.utils import SHORT_URL_PREFIX
+
+
+class _Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(search_cache, "time", clock)
+    return clock
+
+
+def _entry(id_: int) -> dict:
+    short_url = f"{SHORT_URL_PREFIX}{id_}-0"
+    return {
+        "id": id_,
+        "text": f"Solar grew [apnews]({short_url}).",
+        "source_store": source_store(
+            [{"label": "apnews", "short_url": short_url, "value": "https://apnews.com/a"}]
+        ),
+    }
+
+
+def test_normalize_query_ignores_case_spacing_and_punctuation():
+    assert normalize_query("  Solar   Output\n2024? ") == "solar output 2024"
+    assert normalize_query('"Solar output 2024."') == "solar output 2024"
+    assert search_cache_key("Solar output 2024", "m", "June 2025") == search_cache_key(
+        "solar  output 2024?", "m", "June 2025"
+    )
+
+
+def test_cache_key_depends_on_model_and_date_bucket():
+    key = search_cache_key("solar", "m", "June 2025")
+    assert key != search_cache_key("solar", "other", "June 2025")
+    assert key != search_cache_key("solar", "m", "July 2025")
+
+
+def test_rekey_short_urls_moves_entry_to_the_new_branch():
+    entry = _entry(3)
+    rekeyed = rekey_short_urls(entry, 12)
+    assert rekeyed["id"] == 12
+    assert rekeyed["text"] == f"Solar grew [apnews]({SHORT_URL_PREFIX}12-0)."
+    assert rekeyed["source_store"]["uris"] == {"https://apnews.com/a": [0, "12-0"]}
+    assert entry == _entry(3)
+    assert rekey_short_urls(entry, 3) is entry
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(ttl_seconds: float = 60, max_entries: int = 10):
+        if request.param == "memory":
+            return MemorySearchCache(ttl_seconds, max_entries)
+        return SQLiteSearchCache(str(tmp_path / "search.db"), ttl_seconds, max_entries)
+
+    return make
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    cache = make_cache(ttl_seconds=60)
+    cache.set("k", _entry(0))
+    clock.now += 59
+    assert cache.get("k") == _entry(0)
+    clock.now += 2
+    assert cache.get("k") is None
+
+
+def test_least_recently_used_entry_is_evicted(make_cache, clock):
+    cache = make_cache(max_entries=2)
+    cache.set("a", _entry(0))
+    clock.now += 1
+    cache.set("b", _entry(1))
+    clock.now += 1
+    assert cache.get("a") is not None
+    clock.now += 1
+    cache.set("c", _entry(2))
+    assert cache.get("b") is None
+    assert cache.get("a") == _entry(0)
+    assert cache.get("c") == _entry(2)
+
+
+def test_sqlite_cache_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "nested" / "search.db")
+    SQLiteSearchCache(path, 60, 10).set("k", _entry(4))
+    assert SQLiteSearchCache(path, 60, 10).get("k") == _entry(4)
+
+
+def test_get_search_cache_backends():
+    assert isinstance(get_search_cache("memory", "", 60, 10), MemorySearchCache)
+    assert get_search_cache("memory", "", 60, 10) is get_search_cache(
+        "memory", "", 60, 10
+    )
+    assert get_search_cache("off", "", 60, 10) is None
+    with pytest.raises(ValueError):
+        get_search_cache("redis", "", 60, 10)
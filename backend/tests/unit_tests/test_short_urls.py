@@ -0,0 +1,65 @@
+from agent.utils import SHORT_URL_PREFIX, ShortUrlStreamRewriter
+
+SOURCES = [
+    {"short_url": f"{SHORT_URL_PREFIX}0-1", "value": "https://a.example/one"},
+    {"short_url": f"{SHORT_URL_PREFIX}0-10", "value": "https://a.example/ten"},
+    {"short_url": f"{SHORT_URL_PREFIX}1-0", "value": "https://b.example/zero"},
+]
+
+ANSWER = (
+    f"First [a]({SHORT_URL_PREFIX}0-1), then [b]({SHORT_URL_PREFIX}0-10) "
+    f"and [c]({SHORT_URL_PREFIX}1-0), again [a]({SHORT_URL_PREFIX}0-1)."
+)
+EXPANDED = (
+    "First [a](https://a.example/one), then [b](https://a.example/ten) "
+    "and [c](https://b.example/zero), again [a](https://a.example/one)."
+)
+
+
+def _stream(chunks):
+    rewriter = ShortUrlStreamRewriter(SOURCES)
+    out = [rewriter.feed(chunk) for chunk in chunks]
+    out.append(rewriter.flush())
+    return "".join(out), rewriter
+
+
+def test_whole_answer_is_rewritten():
+    text, _ = _stream([ANSWER])
+    assert text == EXPANDED
+
+
+def test_short_url_split_at_any_position():
+    for split in range(1, len(ANSWER)):
+        text, _ = _stream([ANSWER[:split], ANSWER[split:]])
+        assert text == EXPANDED, split
+
+
+def test_single_character_chunks():
+    text, _ = _stream(list(ANSWER))
+    assert text == EXPANDED
+
+
+def test_partial_short_url_is_held_back_until_it_ends():
+    rewriter = ShortUrlStreamRewriter(SOURCES)
+    assert rewriter.feed(f"see {SHORT_URL_PREFIX}0-1") == "see "
+    # The next chunk shows the url is 0-10, not 0-1
+    assert rewriter.feed("0 now") == "https://a.example/ten now"
+    assert rewriter.flush() == ""
+
+
+def test_prefix_fragment_at_end_is_flushed_unchanged():
+    rewriter = ShortUrlStreamRewriter(SOURCES)
+    assert rewriter.feed("end https://vertex") == "end "
+    assert rewriter.flush() == "https://vertex"
+
+
+def test_unknown_short_url_is_left_alone():
+    text, rewriter = _stream([f"x {SHORT_URL_PREFIX}7-7 y"])
+    assert text == f"x {SHORT_URL_PREFIX}7-7 y"
+    assert rewriter.used == set()
+
+
+def test_unique_sources_keeps_order_and_drops_unused():
+    sources = SOURCES + [dict(SOURCES[0], value="https://a.example/dup")]
+    _, rewriter = _stream([f"{SHORT_URL_PREFIX}1-0 {SHORT_URL_PREFIX}0-1"])
+    assert rewriter.unique_sources(sources) == [SOURCES[0], SOURCES[2]]
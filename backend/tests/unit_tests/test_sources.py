@@ -0,0 +1,106 @@
+import copy
+
+from agent.sources import (
+    empty_source_store,
+    merge_sources,
+    rekey_source_store,
+    source_store,
+    store_segments,
+)
+from agent.utils import SHORT_URL_PREFIX
+
+
+def _segment(label: str, short_url_id: str, uri: str) -> dict:
+    return {
+        "label": label,
+        "short_url": f"{SHORT_URL_PREFIX}{short_url_id}",
+        "value": uri,
+    }
+
+
+def test_source_store_interns_labels_and_dedupes_uris():
+    store = source_store(
+        [
+            _segment("apnews", "0-0", "https://apnews.com/a"),
+            _segment("apnews", "0-1", "https://apnews.com/b"),
+            _segment("apnews", "0-0", "https://apnews.com/a"),
+            _segment("reuters", "0-2", "https://reuters.com/a"),
+            _segment("apnews", "1-0", "https://apnews.com/a"),
+        ]
+    )
+    assert store == {
+        "labels": ["apnews", "reuters"],
+        "uris": {
+            "https://apnews.com/a": [0, "0-0", "1-0"],
+            "https://apnews.com/b": [0, "0-1"],
+            "https://reuters.com/a": [1, "0-2"],
+        },
+    }
+
+
+def test_store_segments_round_trips_unique_segments():
+    segments = [
+        _segment("apnews", "0-0", "https://apnews.com/a"),
+        _segment("apnews", "1-0", "https://apnews.com/a"),
+        _segment("reuters", "0-1", "https://reuters.com/a"),
+    ]
+    assert store_segments(source_store(segments + segments)) == segments
+    assert store_segments(None) == []
+    assert store_segments(empty_source_store()) == []
+
+
+def test_merge_sources_adds_new_uris_labels_and_short_urls():
+    left = source_store(
+        [
+            _segment("apnews", "0-0", "https://apnews.com/a"),
+            _segment("reuters", "0-1", "https://reuters.com/a"),
+        ]
+    )
+    right = source_store(
+        [
+            _segment("bbc", "1-0", "https://bbc.com/a"),
+            _segment("reuters", "1-1", "https://reuters.com/b"),
+            _segment("apnews", "1-2", "https://apnews.com/a"),
+        ]
+    )
+    before = copy.deepcopy(left)
+
+    merged = merge_sources(left, right)
+
+    assert merged == {
+        "labels": ["apnews", "reuters", "bbc"],
+        "uris": {
+            "https://apnews.com/a": [0, "0-0", "1-2"],
+            "https://reuters.com/a": [1, "0-1"],
+            "https://bbc.com/a": [2, "1-0"],
+            "https://reuters.com/b": [1, "1-1"],
+        },
+    }
+    # Checkpoints may share `left`, so it is never mutated
+    assert left == before
+
+
+def test_merge_sources_returns_left_when_nothing_is_new():
+    left = source_store([_segment("apnews", "0-0", "https://apnews.com/a")])
+    right = source_store([_segment("apnews", "0-0", "https://apnews.com/a")])
+    assert merge_sources(left, right) is left
+    assert merge_sources(left, None) is left
+    assert merge_sources(None, right) is right
+    assert merge_sources(None, None) == empty_source_store()
+
+
+def test_rekey_source_store_moves_only_the_branch_short_urls():
+    store = source_store(
+        [
+            _segment("apnews", "1-0", "https://apnews.com/a"),
+            _segment("apnews", "10-0", "https://apnews.com/a"),
+            _segment("reuters", "1-1", "https://reuters.com/a"),
+        ]
+    )
+    rekeyed = rekey_source_store(store, 1, 7)
+    assert rekeyed["uris"] == {
+        "https://apnews.com/a": [0, "7-0", "10-0"],
+        "https://reuters.com/a": [1, "7-1"],
+    }
+    assert rekeyed["labels"] == store["labels"]
+    assert store["uris"]["https://apnews.com/a"] == [0, "1-0", "10-0"]